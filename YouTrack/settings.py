@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from celery.schedules import crontab
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -42,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.PerformanceMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -50,15 +53,141 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'main.middleware.ProfilerMiddleware',
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Request tracing (main.middleware.PerformanceMiddleware): the fraction of
+# requests that get Server-Timing headers and a JSON line on the
+# main.performance logger. 0 turns it off.
+PERF_SAMPLE_RATE = float(os.environ.get("PERF_SAMPLE_RATE", "0"))
+PERF_SLOW_QUERIES = 3
+PERF_SERVER_TIMING = True
+
+# Request profiles (main.middleware.ProfilerMiddleware): superusers add
+# ?_profile=1 or an "X-Profile: 1" header to profile one request, and
+# PROFILER_SAMPLE_RATE profiles that fraction of all requests. cProfile and
+# collapsed-stack files go to PROFILER_DIR; only the newest
+# PROFILER_MAX_PROFILES are kept. Listed under Request profiles in the admin.
+PROFILER_SAMPLE_RATE = float(os.environ.get("PROFILER_SAMPLE_RATE", "0"))
+PROFILER_DIR = Path(os.environ.get("PROFILER_DIR", BASE_DIR / "profiles"))
+PROFILER_MAX_PROFILES = 50
+PROFILER_INTERVAL = 0.005
+PROFILER_QUERY_PARAM = "_profile"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "main.performance": {"handlers": ["console"], "level": "INFO", "propagate": False},
+        "main.profiling": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
+
 CELERY_RESULT_BACKEND = 'django-db'
 CELERY_BROKER_URL = "redis://localhost:6379/0"
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 300
 
+# Rank, leaderboard and outbox tasks opt out of the result backend (see
+# main.tasks.FIRE_AND_FORGET). Stored results are pruned in small batches by
+# the prune-results beat job after CELERY_RESULT_RETENTION_DAYS, which
+# replaces Celery's built-in single-statement cleanup.
+CELERY_RESULT_RETENTION_DAYS = 7
+CELERY_RESULT_EXPIRES = None
+
+# Apply ActivityEntry points/coins to Enrollment totals as deltas on write.
+# When disabled every rank update re-aggregates the whole course.
+INCREMENTAL_TOTALS = True
+
+# "sql" ranks with one ROW_NUMBER() UPDATE in the database, "python" sorts in
+# the worker; "auto" uses sql when the database supports it.
+RANK_ENGINE = "auto"
+
+# Rank recomputes requested within this many seconds are folded into one run.
+RANK_UPDATE_DEBOUNCE = 2
+
+# Dashboard leaderboards are cached per course version; optionally re-render
+# them right after each rank recompute so student polls always hit the cache.
+DASHBOARD_CACHE_TIMEOUT = 60 * 60
+DASHBOARD_PRERENDER = True
+
+# Optional live leaderboard in Redis sorted sets, e.g.
+# "main.leaderboard.RedisLeaderboardBackend". Ranks are copied back to
+# Enrollment every LEADERBOARD_PERSIST_INTERVAL seconds by Celery beat.
+LEADERBOARD_BACKEND = os.environ.get("LEADERBOARD_BACKEND") or None
+LEADERBOARD_REDIS_URL = CELERY_BROKER_URL
+LEADERBOARD_PERSIST_INTERVAL = 60
+
+# New students are pushed to the CD mock service through the outbox: one
+# pooled session per worker, BATCH_SIZE students per chunk, CONCURRENCY
+# chunks in flight.
+CD_MOCK_URL = os.environ.get("CD_MOCK_URL", "https://cd-mock-api.xmichael446.com/api/add_candidate/")
+CD_MOCK_API_KEY = os.environ.get("CD_MOCK_API_KEY", "QODIRALI_ABDUSAMATOV")
+CD_MOCK_TIMEOUT = 5
+CD_MOCK_BATCH_SIZE = 50
+CD_MOCK_CONCURRENCY = 4
+
+# Outbox relay: messages are retried after BACKOFF * 2**(attempts-1) seconds
+# (capped at BACKOFF_MAX) and dead-lettered after MAX_ATTEMPTS. Beat runs the
+# relay every RELAY_INTERVAL seconds to pick up retries.
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_BACKOFF = 30
+OUTBOX_RETRY_BACKOFF_MAX = 60 * 60
+OUTBOX_RELAY_DEBOUNCE = 1
+OUTBOX_RELAY_INTERVAL = 60
+OUTBOX_RETENTION_DAYS = 7
+
+CELERY_BEAT_SCHEDULE = {
+    "persist-leaderboards": {
+        "task": "main.tasks.persist_leaderboards_task",
+        "schedule": LEADERBOARD_PERSIST_INTERVAL,
+    },
+    "relay-outbox": {
+        "task": "main.tasks.relay_outbox_task",
+        "schedule": OUTBOX_RELAY_INTERVAL,
+    },
+    "prune-results": {
+        "task": "main.tasks.prune_results_task",
+        "schedule": crontab(hour=4, minute=30),
+    },
+}
+
+# Per-process LRU of resolved (student_code, group_code) pairs used by the
+# student API. Deactivations are dropped locally at once; other workers see
+# them within TTL seconds.
+ACCESS_CODE_CACHE = {
+    "MAXSIZE": 10000,
+    "TTL": 60,
+}
+
+# Student and group access codes get one more digit whenever the table would
+# otherwise use more than this fraction of the current code space.
+ACCESS_CODE_MAX_OCCUPANCY = 0.5
+
+# Lifetime of the signed tokens handed out by /api/login/.
+STUDENT_TOKEN_MAX_AGE = 60 * 60 * 24 * 30
+
+# orjson-backed JSON output, byte-identical to DRF's own renderer.
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "main.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+# Shared across gunicorn and Celery workers (rank scheduling locks, counters).
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("CACHE_URL", "redis://localhost:6379/1"),
+        "KEY_PREFIX": "yt",
+    }
+}
+
 ROOT_URLCONF = 'YouTrack.urls'
 
 TEMPLATES = [
@@ -83,13 +212,39 @@ WSGI_APPLICATION = 'YouTrack.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLITE_PROFILE=concurrent (default) lets gunicorn and Celery workers write
+# the same file: WAL so readers never block the writer, a generous busy
+# timeout instead of instant "database is locked", and BEGIN IMMEDIATE so
+# write transactions take the lock up front rather than failing on a
+# read->write upgrade. The pragmas run on every new connection.
+# SQLITE_PROFILE=default keeps Django's stock behaviour.
+SQLITE_PROFILE = os.environ.get("SQLITE_PROFILE", "concurrent")
+SQLITE_BUSY_TIMEOUT = 20
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+]
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # File-backed so concurrency tests see real SQLite locking instead of
+        # the shared-cache table locks of an in-memory database.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+if SQLITE_PROFILE == "concurrent":
+    DATABASES['default']['OPTIONS'] = {
+        'timeout': SQLITE_BUSY_TIMEOUT,
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': ";".join(SQLITE_PRAGMAS),
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -1,14 +1,26 @@
 import nested_admin
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
 from django.db.models import Q
-
+from django.http import FileResponse, Http404, HttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .admin_extras.actions import award_points_action, revoke_student_tokens_action, \
+    requeue_outbox_messages_action
+from .admin_extras.forms import StudentImportForm
 from .admin_extras.inlines import GroupInline, EnrollmentInline
 from .admin_extras.mixins import UserOwnedQuerysetMixin, AutoCreatedByMixin
 from .models import (
     Course, Student, Enrollment,
     PointReason, PointEntry,
-    Reward, RewardRedemption, ActivityEntry, Group, YTInstance
+    Reward, RewardRedemption, ActivityEntry, Group, YTInstance, OutboxMessage, RequestProfile
 )
+from .outbox import backlog_stats
+from .profiling import PROFILE_SUFFIXES, profile_file
+from .student_import import StudentImportError, import_student_file
+from .tenancy import get_tenant_context
 
 admin.site.site_header = "YouTrack Administration"
 admin.site.site_title = "YouTrack Admin"
@@ -21,6 +33,10 @@ class YTInstanceAdmin(admin.ModelAdmin):
     search_fields = ("name", "admin__username", "coordinators__username")
     autocomplete_fields = ("admin", "coordinators", "point_reasons")
     filter_horizontal = ("coordinators", "point_reasons")
+    list_select_related = ("admin",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("coordinators", "point_reasons")
 
     def get_coordinators(self, obj):
         return ", ".join([c.username for c in obj.coordinators.all()])
@@ -40,6 +56,7 @@ class CourseAdmin(UserOwnedQuerysetMixin, AutoCreatedByMixin, nested_admin.Neste
     list_display = ("name", "created_by", "created_at")
     search_fields = ("name",)
     readonly_fields = ("created_by", "created_at")
+    list_select_related = ("created_by",)
     inlines = [GroupInline]
 
     def filter_for_user(self, qs, request):
@@ -49,8 +66,14 @@ class CourseAdmin(UserOwnedQuerysetMixin, AutoCreatedByMixin, nested_admin.Neste
 @admin.register(Group)
 class GroupAdmin(UserOwnedQuerysetMixin, admin.ModelAdmin):
     list_display = ("name", "access_code", "coordinator", "course",)
+    list_select_related = ("coordinator", "course")
     readonly_fields = ("access_code",)
     inlines = [EnrollmentInline]
+    actions = [award_points_action]
+
+    def has_award_permission(self, request):
+        # Awards create PointEntry rows, like adding one on the PointEntry admin.
+        return request.user.has_perm("main.add_pointentry")
 
     def filter_for_user(self, qs, request):
         return qs.filter(Q(coordinator=request.user) | Q(course__created_by=request.user))
@@ -61,14 +84,13 @@ class GroupAdmin(UserOwnedQuerysetMixin, admin.ModelAdmin):
         if db_field.name == "course" and not user.is_superuser:
             kwargs["queryset"] = db_field.remote_field.model.objects.filter(created_by=user)
         elif db_field.name == "coordinator":
-            if user.is_superuser:
+            tenant = get_tenant_context(request)
+            if tenant.is_superuser:
                 kwargs["queryset"] = db_field.remote_field.model.objects.filter(is_staff=True)
+            elif tenant.is_admin:
+                kwargs["queryset"] = db_field.remote_field.model.objects.filter(pk__in=tenant.coordinator_ids)
             else:
-                try:
-                    yt_instance = YTInstance.objects.get(admin=user)
-                    kwargs["queryset"] = yt_instance.coordinators.all()
-                except YTInstance.DoesNotExist:
-                    kwargs["queryset"] = db_field.remote_field.model.objects.none()
+                kwargs["queryset"] = db_field.remote_field.model.objects.none()
 
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
@@ -79,26 +101,59 @@ class StudentAdmin(UserOwnedQuerysetMixin, AutoCreatedByMixin, admin.ModelAdmin)
     list_display = ("first_name", "last_name", "access_code", "created_by",)
     search_fields = ("first_name", "last_name", "access_code")
     readonly_fields = ("access_code", "created_by",)
+    list_select_related = ("created_by",)
+    change_list_template = "admin/main/student/change_list.html"
 
-    def filter_for_user(self, qs, request):
-        user = request.user
+    def get_urls(self):
+        return [
+            path("import/", self.admin_site.admin_view(self.import_view), name="main_student_import"),
+        ] + super().get_urls()
 
-        if user.is_superuser:
-            return qs
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
 
-        try:
-            yt_instance = YTInstance.objects.get(admin=user)
-            coordinator_ids = yt_instance.coordinators.values_list("id", flat=True)
-            return qs.filter(Q(created_by=user) | Q(created_by__in=coordinator_ids))
-        except YTInstance.DoesNotExist:
-            pass
+        groups = Group.objects.select_related("course")
+        if not request.user.is_superuser:
+            groups = groups.filter(Q(coordinator=request.user) | Q(course__created_by=request.user))
 
-        try:
-            yt_instance = YTInstance.objects.get(coordinators=user)
-            return qs.filter(Q(created_by=user) | Q(created_by=yt_instance.admin))
-        except YTInstance.DoesNotExist:
-            pass
+        if request.method == "POST":
+            form = StudentImportForm(request.POST, request.FILES, groups=groups)
+            if form.is_valid():
+                upload, group = form.cleaned_data["file"], form.cleaned_data["group"]
+                try:
+                    result = import_student_file(upload, upload.name, group, request.user)
+                except StudentImportError as exc:
+                    form.add_error("file", str(exc))
+                else:
+                    self.message_user(request, f"Imported {len(result.students)} students into {group}.",
+                                      messages.SUCCESS)
+                    for line, reason in result.skipped:
+                        self.message_user(request, f"Skipped line {line}: {reason}", messages.WARNING)
+                    response = HttpResponse(result.report(), content_type="text/csv")
+                    response["Content-Disposition"] = f'attachment; filename="access-codes-{group.access_code}.csv"'
+                    return response
+        else:
+            form = StudentImportForm(groups=groups)
+
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Import students",
+            "opts": self.model._meta,
+            "form": form,
+        }
+        return TemplateResponse(request, "admin/main/student/import.html", context)
+
+    def filter_for_user(self, qs, request):
+        user = request.user
+        tenant = get_tenant_context(request)
 
+        if tenant.is_superuser:
+            return qs
+        if tenant.is_admin:
+            return qs.filter(Q(created_by=user) | Q(created_by__in=tenant.coordinator_ids))
+        if tenant.is_coordinator:
+            return qs.filter(Q(created_by=user) | Q(created_by=tenant.admin_id))
         return qs.filter(created_by=user)
 
 
@@ -108,6 +163,11 @@ class EnrollmentAdmin(UserOwnedQuerysetMixin, admin.ModelAdmin):
     list_filter = ("is_active", )
     search_fields = ("student__first_name", "student__last_name", "group__name")
     readonly_fields = ("total_points", "rank", "balance")
+    list_select_related = ("student", "group__course")
+    actions = [award_points_action, revoke_student_tokens_action]
+
+    def has_award_permission(self, request):
+        return request.user.has_perm("main.add_pointentry")
 
     def student_access_code(self, obj):
         if obj and obj.student:
@@ -130,21 +190,16 @@ class EnrollmentAdmin(UserOwnedQuerysetMixin, admin.ModelAdmin):
 
         elif db_field.name == "group":
             GroupModel = db_field.remote_field.model
+            tenant = get_tenant_context(request)
 
-            if user.is_superuser:
+            if tenant.is_superuser:
                 kwargs["queryset"] = GroupModel.objects.all()
-
+            elif tenant.is_admin:
+                kwargs["queryset"] = GroupModel.objects.filter(course__created_by=user)
+            elif tenant.is_coordinator:
+                kwargs["queryset"] = GroupModel.objects.filter(coordinator=user)
             else:
-                try:
-                    yt_instance = YTInstance.objects.get(admin=user)
-                    kwargs["queryset"] = GroupModel.objects.filter(course__created_by=user)
-
-                except YTInstance.DoesNotExist:
-                    try:
-                        yt_instance = YTInstance.objects.get(coordinators=user)
-                        kwargs["queryset"] = GroupModel.objects.filter(coordinator=user)
-                    except YTInstance.DoesNotExist:
-                        kwargs["queryset"] = GroupModel.objects.none()
+                kwargs["queryset"] = GroupModel.objects.none()
 
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
@@ -155,17 +210,10 @@ class PointReasonAdmin(UserOwnedQuerysetMixin, admin.ModelAdmin):
     search_fields = ("name", )
 
     def filter_for_user(self, qs, request):
-        user = request.user
-
-        try:
-            yt_instance = YTInstance.objects.get(admin=user)
-            return yt_instance.point_reasons
-        except YTInstance.DoesNotExist:
-            try:
-                yt_instance = YTInstance.objects.get(coordinators=user)
-                return yt_instance.point_reasons
-            except YTInstance.DoesNotExist:
-                return PointReason.objects.none()
+        tenant = get_tenant_context(request)
+        if not tenant.has_instance:
+            return qs.none()
+        return qs.filter(pk__in=tenant.point_reason_ids)
 
 
 @admin.register(PointEntry)
@@ -177,6 +225,7 @@ class PointEntryAdmin(UserOwnedQuerysetMixin, admin.ModelAdmin):
         "enrollment__student__access_code",
         "reason__name",
     )
+    list_select_related = ("enrollment__student", "enrollment__group__course", "reason")
     date_hierarchy = "for_date"
 
     def filter_for_user(self, qs, request):
@@ -189,9 +238,8 @@ class PointEntryAdmin(UserOwnedQuerysetMixin, admin.ModelAdmin):
 
                 kwargs["queryset"] = _Enrollment.objects.filter(group__coordinator=request.user)
             elif db_field.name == "reason":
-                yt_instance = YTInstance.objects.get(coordinators=request.user)
-                kwargs["queryset"] = yt_instance.point_reasons
-
+                tenant = get_tenant_context(request)
+                kwargs["queryset"] = PointReason.objects.filter(pk__in=tenant.point_reason_ids)
 
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
@@ -200,6 +248,7 @@ class PointEntryAdmin(UserOwnedQuerysetMixin, admin.ModelAdmin):
 class RewardAdmin(UserOwnedQuerysetMixin, admin.ModelAdmin):
     list_display = ("name", "cost", "course")
     search_fields = ("name", "course__name")
+    list_select_related = ("course",)
 
     def filter_for_user(self, qs, request):
         return qs.filter(course__created_by=request.user)
@@ -218,6 +267,7 @@ class RewardAdmin(UserOwnedQuerysetMixin, admin.ModelAdmin):
 @admin.register(RewardRedemption)
 class RewardRedemptionAdmin(UserOwnedQuerysetMixin, admin.ModelAdmin):
     list_display = ("enrollment", "reward", "created_at")
+    list_select_related = ("enrollment__student", "enrollment__group__course", "reward__course")
 
     def filter_for_user(self, qs, request):
         return qs.filter(enrollment__student__created_by=request.user)
@@ -228,8 +278,78 @@ class ActivityEntryAdmin(UserOwnedQuerysetMixin, admin.ModelAdmin):
     list_display = ("enrollment", "action", "points", "coins_change", "for_date")
     list_filter = ("action", "for_date")
     search_fields = ("enrollment__student__first_name", "enrollment__student__last_name")
+    list_select_related = ("enrollment__student", "enrollment__group__course")
     ordering = ("-for_date",)
     date_hierarchy = "for_date"
 
     def filter_for_user(self, qs, request):
         return qs.filter(Q(enrollment__student__created_by=request.user) | Q(enrollment__group__coordinator=request.user))
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("idempotency_key", "topic", "status", "attempts", "available_at", "created_at", "sent_at")
+    list_filter = ("status", "topic")
+    search_fields = ("idempotency_key",)
+    readonly_fields = ("topic", "idempotency_key", "payload", "status", "attempts", "available_at",
+                       "last_error", "created_at", "sent_at")
+    ordering = ("-id",)
+    actions = [requeue_outbox_messages_action]
+
+    def has_add_permission(self, request):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {**(extra_context or {}), "backlog": backlog_stats()}
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "method", "path", "view_name", "status_code", "duration_ms", "samples",
+                    "trigger", "user", "downloads")
+    list_filter = ("trigger", "method", "status_code")
+    search_fields = ("path", "view_name")
+    list_select_related = ("user",)
+    readonly_fields = [field.name for field in RequestProfile._meta.fields] + ["downloads"]
+
+    def has_module_permission(self, request):
+        return request.user.is_superuser
+
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+    def get_urls(self):
+        return [
+            path("<int:object_id>/download/<str:kind>/", self.admin_site.admin_view(self.download_view),
+                 name="main_requestprofile_download"),
+        ] + super().get_urls()
+
+    @admin.display(description="Files")
+    def downloads(self, obj):
+        return format_html(
+            '<a href="{}">cProfile</a> / <a href="{}">collapsed</a>',
+            reverse("admin:main_requestprofile_download", args=[obj.pk, "prof"]),
+            reverse("admin:main_requestprofile_download", args=[obj.pk, "collapsed"]),
+        )
+
+    def download_view(self, request, object_id, kind):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        profile = self.get_object(request, str(object_id))
+        if profile is None or kind not in PROFILE_SUFFIXES:
+            raise Http404
+        try:
+            handle = open(profile_file(profile.file_stem, kind), "rb")
+        except FileNotFoundError:
+            raise Http404("The profile file is gone.")
+        return FileResponse(handle, as_attachment=True, filename=f"{profile.file_stem}{PROFILE_SUFFIXES[kind]}")
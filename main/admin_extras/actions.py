@@ -0,0 +1,62 @@
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.template.response import TemplateResponse
+
+from main.admin_extras.forms import AwardPointsForm
+from main.authentication import revoke_student_tokens
+from main.models import Enrollment, Group
+from main.outbox import requeue
+from main.services import award_points, enrollments_for_user, point_reasons_for_user
+
+
+@admin.action(description="Award points to selected", permissions=["award"])
+def award_points_action(modeladmin, request, queryset):
+    if queryset.model is Group:
+        enrollments = Enrollment.objects.filter(group__in=queryset)
+    else:
+        enrollments = queryset
+    enrollments = enrollments_for_user(request.user).filter(
+        id__in=enrollments.values("id"), is_active=True
+    )
+
+    reasons = point_reasons_for_user(request.user)
+
+    if "apply" in request.POST:
+        form = AwardPointsForm(request.POST, reasons=reasons)
+        if form.is_valid():
+            enrollment_ids = list(enrollments.values_list("id", flat=True))
+            point_entries = award_points(
+                form.cleaned_data["reason"], form.cleaned_data["for_date"], enrollment_ids
+            )
+            modeladmin.message_user(
+                request,
+                f"Awarded \"{form.cleaned_data['reason']}\" to {len(point_entries)} enrollments.",
+                messages.SUCCESS,
+            )
+            return None
+    else:
+        form = AwardPointsForm(reasons=reasons)
+
+    context = {
+        **modeladmin.admin_site.each_context(request),
+        "title": "Award points",
+        "opts": modeladmin.model._meta,
+        "form": form,
+        "queryset": queryset,
+        "enrollment_count": enrollments.count(),
+        "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+        "action": "award_points_action",
+    }
+    return TemplateResponse(request, "admin/main/award_points.html", context)
+
+
+@admin.action(description="Log out selected students (revoke tokens)")
+def revoke_student_tokens_action(modeladmin, request, queryset):
+    revoked = revoke_student_tokens(queryset.values_list("id", flat=True))
+    modeladmin.message_user(request, f"Revoked login tokens for {revoked} enrollments.", messages.SUCCESS)
+
+
+@admin.action(description="Retry selected messages now")
+def requeue_outbox_messages_action(modeladmin, request, queryset):
+    requeued = requeue(queryset)
+    modeladmin.message_user(request, f"Queued {requeued} messages for delivery.", messages.SUCCESS)
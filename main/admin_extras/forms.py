@@ -0,0 +1,24 @@
+from django import forms
+from django.utils import timezone
+
+from main.models import Group, PointReason
+
+
+class AwardPointsForm(forms.Form):
+    reason = forms.ModelChoiceField(queryset=PointReason.objects.none())
+    for_date = forms.DateField(initial=timezone.localdate, widget=forms.DateInput(attrs={"type": "date"}))
+
+    def __init__(self, *args, reasons=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if reasons is not None:
+            self.fields["reason"].queryset = reasons
+
+
+class StudentImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV (UTF-8) or .xlsx with first_name and last_name columns.")
+    group = forms.ModelChoiceField(queryset=Group.objects.none(), help_text="Every imported student is enrolled here.")
+
+    def __init__(self, *args, groups=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if groups is not None:
+            self.fields["group"].queryset = groups
@@ -1,7 +1,8 @@
 import nested_admin
 from django.contrib import admin
 
-from main.models import Enrollment, Group, Student, YTInstance
+from main.models import Enrollment, Group, Student
+from main.tenancy import get_tenant_context
 
 
 class EnrollmentInline(nested_admin.NestedTabularInline):
@@ -37,13 +38,12 @@ class GroupInline(nested_admin.NestedStackedInline):
         if db_field.name == "course" and not user.is_superuser:
             kwargs["queryset"] = db_field.remote_field.model.objects.filter(created_by=user)
         elif db_field.name == "coordinator":
-            if user.is_superuser:
+            tenant = get_tenant_context(request)
+            if tenant.is_superuser:
                 kwargs["queryset"] = db_field.remote_field.model.objects.filter(is_staff=True)
+            elif tenant.is_admin:
+                kwargs["queryset"] = db_field.remote_field.model.objects.filter(pk__in=tenant.coordinator_ids)
             else:
-                try:
-                    yt_instance = YTInstance.objects.get(admin=user)
-                    kwargs["queryset"] = yt_instance.coordinators.all()
-                except YTInstance.DoesNotExist:
-                    kwargs["queryset"] = db_field.remote_field.model.objects.none()
+                kwargs["queryset"] = db_field.remote_field.model.objects.none()
 
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
@@ -1,7 +1,10 @@
+from main.tenancy import get_tenant_context
+
+
 class UserOwnedQuerysetMixin:
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        if request.user.is_superuser:
+        if get_tenant_context(request).is_superuser:
             return qs
         return self.filter_for_user(qs, request)
 
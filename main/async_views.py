@@ -0,0 +1,250 @@
+"""Async versions of the student endpoints for ASGI deployments.
+
+These are plain Django async views rather than DRF ``APIView`` subclasses
+(DRF has no async request cycle), but they reuse the same serializers and
+the API's renderer, so every payload is byte-for-byte the one the sync
+view would return. Reads go through the async ORM and the
+async cache API; the reward claim runs the sync ``claim_reward`` service in
+a thread because Django transactions are not available in async code.
+
+Serve with any ASGI server, e.g. ``uvicorn YouTrack.asgi:application``.
+"""
+import io
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.shortcuts import aget_object_or_404
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from .authentication import MissingAccessCodes, EnrollmentNotFound, InvalidStudentToken, aauthenticate_student, \
+    aresolve_enrollment, aget_token_version, issue_student_token, invalidate_enrollment
+from .caching import aget_group_leaderboard, aget_course_leaderboard, build_live_leaderboards
+from .leaderboard import get_leaderboard
+from .models import Student, Group, Enrollment, Reward, RewardRedemption, ActivityEntry
+from .pagination import ACTIVITY_PAGE_SIZE, ACTIVITY_CURSOR_FIELDS, InvalidCursor, apaginate_activities
+from .performance import span
+from .renderers import FastJSONRenderer
+from .serializers import EnrollmentCheckSerializer, GroupSerializer, EnrollmentSerializer, \
+    RewardRedemptionSerializer, RewardSerializer, ActivityPageSerializer, ACTIVITY_ROW_FIELDS, activity_rows
+from .services import claim_reward, RewardAlreadyClaimed, InsufficientBalance
+
+_renderer = FastJSONRenderer()
+
+
+def render_json(data, status=status.HTTP_200_OK):
+    return HttpResponse(_renderer.render(data), status=status, content_type=_renderer.media_type)
+
+
+def parse_request_data(request):
+    """``request.data`` as DRF would build it for JSON and form bodies."""
+    if request.content_type == "application/json":
+        if not request.body:
+            return {}
+        return JSONParser().parse(io.BytesIO(request.body), parser_context={"request": request})
+    return request.POST
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncAPIView(View):
+    http_method_names = ["post"]
+
+    async def dispatch(self, request, *args, **kwargs):
+        handler = getattr(self, request.method.lower(), None)
+        if request.method.lower() not in self.http_method_names or handler is None:
+            return render_json(
+                {"detail": f'Method "{request.method}" not allowed.'},
+                status=status.HTTP_405_METHOD_NOT_ALLOWED,
+            )
+
+        try:
+            request.data = parse_request_data(request)
+            response = await self.initial(request)
+            if response is None:
+                response = await handler(request, *args, **kwargs)
+        except ParseError as exc:
+            response = render_json({"detail": exc.detail}, status=exc.status_code)
+        except Http404 as exc:
+            response = render_json({"detail": str(exc)}, status=status.HTTP_404_NOT_FOUND)
+        return response
+
+    async def initial(self, request):
+        """Hook run before the handler; return a response to short-circuit it."""
+        return None
+
+
+class AsyncStudentAPIView(AsyncAPIView):
+    """Async counterpart of ``StudentAPIView``; sets ``request.auth`` to the caller's StudentContext."""
+    missing_codes_message = MissingAccessCodes.default_detail
+
+    async def initial(self, request):
+        try:
+            with span("auth"):
+                request.auth = await aauthenticate_student(request, request.data)
+        except (MissingAccessCodes, EnrollmentNotFound, InvalidStudentToken) as exc:
+            return self.student_error(exc)
+        return None
+
+    def student_error(self, exc):
+        message = self.missing_codes_message if isinstance(exc, MissingAccessCodes) else str(exc.detail)
+        return render_json({"success": False, "message": message}, status=exc.status_code)
+
+
+class AsyncCheckEnrollmentView(AsyncAPIView):
+    async def post(self, request, *args, **kwargs):
+        serializer = EnrollmentCheckSerializer(data=request.data)
+        if not serializer.is_valid():
+            return render_json(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        student_code = serializer.validated_data["student_code"]
+        group_code = serializer.validated_data["group_code"]
+
+        context = await aresolve_enrollment(student_code, group_code)
+        token_version = await aget_token_version(context.enrollment_id) if context is not None else None
+        if token_version is None:
+            if context is not None:
+                invalidate_enrollment(context.enrollment_id)
+            if not await Student.objects.filter(access_code=student_code).aexists():
+                message = "Student not found"
+            elif not await Group.objects.filter(access_code=group_code).aexists():
+                message = "Group not found"
+            else:
+                message = "You're not enrolled in this group"
+            return render_json(
+                {"success": False, "message": message},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        token, expires_at = issue_student_token(context, token_version)
+
+        return render_json({"success": True, "message": "ok", "token": token, "expires_at": expires_at})
+
+
+class AsyncDashboardView(AsyncStudentAPIView):
+    async def post(self, request, *args, **kwargs):
+        try:
+            enrollment = await Enrollment.objects.select_related("student", "group__course").aget(
+                pk=request.auth.enrollment_id
+            )
+        except Enrollment.DoesNotExist:
+            return self.student_error(EnrollmentNotFound())
+        group = enrollment.group
+
+        enrollment_data = EnrollmentSerializer(enrollment).data
+        group_data = GroupSerializer(group).data
+
+        course = group.course
+        course_data = {
+            "name": course.name,
+        }
+
+        leaderboard = get_leaderboard()
+        if leaderboard is None:
+            group_data["enrollments"] = await aget_group_leaderboard(group)
+            course_data["enrollments"] = await aget_course_leaderboard(course.id)
+        else:
+            position, group_data["enrollments"], course_data["enrollments"], course_data["around"] = (
+                await sync_to_async(build_live_leaderboards)(leaderboard, group, enrollment.id)
+            )
+            if position is not None:
+                enrollment_data["rank"], enrollment_data["total_points"] = position
+
+        return render_json(
+            {
+                "success": True,
+                "data": {
+                    "enrollment": enrollment_data,
+                    "group": group_data,
+                    "course": course_data,
+                },
+            }
+        )
+
+
+class AsyncRewardListView(AsyncStudentAPIView):
+    missing_codes_message = "Missing student_code or group_code"
+
+    async def post(self, request, *args, **kwargs):
+        context = request.auth
+
+        claimed_qs = RewardRedemption.objects.filter(enrollment_id=context.enrollment_id).select_related("reward")
+        claimed = RewardRedemptionSerializer([redemption async for redemption in claimed_qs], many=True).data
+
+        claimed_reward_ids = [redemption["reward"]["id"] for redemption in claimed]
+        available_qs = (
+            Reward.objects.filter(course_id=context.course_id)
+            .exclude(id__in=claimed_reward_ids)
+            .order_by("cost")
+        )
+        available = RewardSerializer([reward async for reward in available_qs], many=True).data
+
+        return render_json({"success": True, "data": {"available": available, "claimed": claimed}})
+
+
+class AsyncRewardClaimView(AsyncStudentAPIView):
+    missing_codes_message = "Missing required fields"
+
+    async def post(self, request, *args, **kwargs):
+        reward_id = request.data.get("reward_id")
+
+        if not reward_id:
+            return render_json(
+                {"success": False, "message": "Missing required fields"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        reward = await aget_object_or_404(Reward, id=reward_id, course_id=request.auth.course_id)
+
+        try:
+            redemption = await sync_to_async(claim_reward)(request.auth.enrollment_id, reward)
+        except RewardAlreadyClaimed:
+            return render_json(
+                {"success": False, "message": "Reward already claimed"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except InsufficientBalance as exc:
+            return render_json(
+                {"success": False, "message": str(exc)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return render_json({"success": True, "data": RewardRedemptionSerializer(redemption).data})
+
+
+class AsyncActivitiesView(AsyncStudentAPIView):
+    missing_codes_message = "Missing student_code or group_code"
+
+    async def post(self, request, *args, **kwargs):
+        params = ActivityPageSerializer(data=request.data)
+        if not params.is_valid():
+            return render_json(params.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = params.validated_data
+
+        activities_qs = (
+            ActivityEntry.objects.filter(enrollment_id=request.auth.enrollment_id)
+            .values(*ACTIVITY_ROW_FIELDS, *ACTIVITY_CURSOR_FIELDS)
+        )
+        if params.get("date_from"):
+            activities_qs = activities_qs.filter(for_date__gte=params["date_from"])
+        if params.get("date_to"):
+            activities_qs = activities_qs.filter(for_date__lte=params["date_to"])
+
+        try:
+            page, next_cursor = await apaginate_activities(
+                activities_qs,
+                cursor=params.get("cursor"),
+                page_size=params.get("page_size", ACTIVITY_PAGE_SIZE),
+            )
+        except InvalidCursor as exc:
+            return render_json(
+                {"success": False, "message": str(exc)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        activities = activity_rows(page)
+
+        return render_json({"success": True, "data": activities, "next_cursor": next_cursor})
@@ -0,0 +1,309 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import status
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import APIException
+
+from .models import Enrollment
+
+
+class StudentContext(NamedTuple):
+    enrollment_id: int
+    student_id: int
+    group_id: int
+    course_id: int
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key, (value, _) in self._data.items() if predicate(value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_cache_options = getattr(settings, "ACCESS_CODE_CACHE", {})
+access_code_cache = TTLCache(
+    maxsize=_cache_options.get("MAXSIZE", 10000),
+    ttl=_cache_options.get("TTL", 300),
+)
+
+
+def resolve_enrollment(student_code, group_code):
+    """Map a ``(student_code, group_code)`` pair to its active enrollment.
+
+    One joined query on a miss, none on a hit. Only successful lookups are
+    cached, so newly created or re-activated enrollments resolve immediately.
+    """
+    key = (student_code, group_code)
+    context = access_code_cache.get(key)
+    if context is not None:
+        return context
+
+    row = _enrollment_context_query(student_code, group_code).first()
+    return _remember_context(key, row)
+
+
+async def aresolve_enrollment(student_code, group_code):
+    """Async version of ``resolve_enrollment``, sharing its cache."""
+    key = (student_code, group_code)
+    context = access_code_cache.get(key)
+    if context is not None:
+        return context
+
+    row = await _enrollment_context_query(student_code, group_code).afirst()
+    return _remember_context(key, row)
+
+
+def _enrollment_context_query(student_code, group_code):
+    return (
+        Enrollment.objects
+        .filter(student__access_code=student_code, group__access_code=group_code, is_active=True)
+        .values_list("id", "student_id", "group_id", "group__course_id")
+    )
+
+
+def _remember_context(key, row):
+    if row is None:
+        return None
+
+    context = StudentContext(*row)
+    access_code_cache.set(key, context)
+    return context
+
+
+def invalidate_enrollment(enrollment_id):
+    access_code_cache.discard_where(lambda context: context.enrollment_id == enrollment_id)
+
+
+STUDENT_TOKEN_SALT = "main.student-token"
+STUDENT_TOKEN_MAX_AGE = getattr(settings, "STUDENT_TOKEN_MAX_AGE", 60 * 60 * 24 * 30)
+STUDENT_TOKEN_KEYWORD = "Bearer"
+
+
+def _token_version_key(enrollment_id):
+    return f"enrollment:{enrollment_id}:token_version"
+
+
+def get_token_version(enrollment_id):
+    """Current token version of an active enrollment, or None if it may not log in.
+
+    Served from the shared cache; the key is dropped whenever the enrollment
+    is saved or deleted.
+    """
+    key = _token_version_key(enrollment_id)
+    version = cache.get(key)
+    if version is None:
+        row = Enrollment.objects.filter(pk=enrollment_id).values_list("is_active", "token_version").first()
+        version = row[1] if row and row[0] else -1
+        cache.set(key, version, timeout=STUDENT_TOKEN_MAX_AGE)
+    return None if version < 0 else version
+
+
+async def aget_token_version(enrollment_id):
+    key = _token_version_key(enrollment_id)
+    version = await cache.aget(key)
+    if version is None:
+        row = await Enrollment.objects.filter(pk=enrollment_id).values_list("is_active", "token_version").afirst()
+        version = row[1] if row and row[0] else -1
+        await cache.aset(key, version, timeout=STUDENT_TOKEN_MAX_AGE)
+    return None if version < 0 else version
+
+
+def forget_token_version(enrollment_id):
+    cache.delete(_token_version_key(enrollment_id))
+
+
+def revoke_student_tokens(enrollment_ids):
+    """Invalidate every token issued so far for the given enrollments."""
+    enrollment_ids = list(enrollment_ids)
+    updated = Enrollment.objects.filter(pk__in=enrollment_ids).update(token_version=F("token_version") + 1)
+    cache.delete_many([_token_version_key(enrollment_id) for enrollment_id in enrollment_ids])
+    return updated
+
+
+def issue_student_token(context, token_version):
+    """Sign ``context`` into a compact token. Returns ``(token, expires_at)``.
+
+    ``token_version`` must come from ``get_token_version``; None means the
+    enrollment may not log in, and such a token could never be revoked.
+    """
+    if token_version is None:
+        raise ValueError("Refusing to issue a token for an inactive or deleted enrollment")
+    token = signing.dumps([*context, token_version], salt=STUDENT_TOKEN_SALT, compress=True)
+    expires_at = timezone.now() + timedelta(seconds=STUDENT_TOKEN_MAX_AGE)
+    return token, expires_at
+
+
+def _unsign_student_token(token):
+    try:
+        *ids, token_version = signing.loads(token, salt=STUDENT_TOKEN_SALT, max_age=STUDENT_TOKEN_MAX_AGE)
+        return StudentContext(*ids), token_version
+    except (signing.BadSignature, TypeError, ValueError):
+        return None, None
+
+
+def read_student_token(token):
+    """Return the token's StudentContext, or None if it is forged, expired or revoked."""
+    context, token_version = _unsign_student_token(token)
+    if context is None:
+        return None
+    # None (inactive or deleted) must never match, not even a token that carries None itself.
+    current_version = get_token_version(context.enrollment_id)
+    if current_version is None or current_version != token_version:
+        return None
+    return context
+
+
+async def aread_student_token(token):
+    context, token_version = _unsign_student_token(token)
+    if context is None:
+        return None
+    current_version = await aget_token_version(context.enrollment_id)
+    if current_version is None or current_version != token_version:
+        return None
+    return context
+
+
+class MissingAccessCodes(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = "student_code and group_code are required"
+    default_code = "missing_access_codes"
+
+
+class EnrollmentNotFound(APIException):
+    status_code = status.HTTP_404_NOT_FOUND
+    default_detail = "Enrollment not found"
+    default_code = "enrollment_not_found"
+
+
+class InvalidStudentToken(APIException):
+    status_code = status.HTTP_401_UNAUTHORIZED
+    default_detail = "Invalid or expired token"
+    default_code = "invalid_student_token"
+
+
+class StudentPrincipal:
+    is_authenticated = True
+    is_anonymous = False
+    is_staff = False
+    is_superuser = False
+
+    def __init__(self, context):
+        self.context = context
+
+    @cached_property
+    def enrollment(self):
+        try:
+            return Enrollment.objects.select_related("student", "group__course").get(pk=self.context.enrollment_id)
+        except Enrollment.DoesNotExist:
+            # Deleted after the request authenticated.
+            raise EnrollmentNotFound()
+
+
+class AccessCodeAuthentication(BaseAuthentication):
+    """Authenticate a student from ``student_code``/``group_code`` in the request body."""
+
+    def authenticate(self, request):
+        student_code = request.data.get("student_code")
+        group_code = request.data.get("group_code")
+
+        if not student_code or not group_code:
+            raise MissingAccessCodes()
+
+        context = resolve_enrollment(student_code, group_code)
+        if context is None:
+            raise EnrollmentNotFound()
+
+        return StudentPrincipal(context), context
+
+
+def _bearer_token(request):
+    """The raw token of an ``Authorization: Bearer`` header, or None if the header is absent."""
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != STUDENT_TOKEN_KEYWORD.lower().encode():
+        return None
+    if len(auth) != 2:
+        raise InvalidStudentToken()
+    return auth[1].decode(errors="replace")
+
+
+class StudentTokenAuthentication(BaseAuthentication):
+    """Authenticate a student from an ``Authorization: Bearer <token>`` header issued at login."""
+
+    def authenticate(self, request):
+        token = _bearer_token(request)
+        if token is None:
+            return None
+
+        context = read_student_token(token)
+        if context is None:
+            raise InvalidStudentToken()
+
+        return StudentPrincipal(context), context
+
+    def authenticate_header(self, request):
+        return STUDENT_TOKEN_KEYWORD
+
+
+async def aauthenticate_student(request, data):
+    """Async equivalent of ``StudentTokenAuthentication`` then ``AccessCodeAuthentication``.
+
+    Returns the caller's StudentContext or raises the same exceptions.
+    """
+    token = _bearer_token(request)
+    if token is not None:
+        context = await aread_student_token(token)
+        if context is None:
+            raise InvalidStudentToken()
+        return context
+
+    student_code = data.get("student_code")
+    group_code = data.get("group_code")
+    if not student_code or not group_code:
+        raise MissingAccessCodes()
+
+    context = await aresolve_enrollment(student_code, group_code)
+    if context is None:
+        raise EnrollmentNotFound()
+    return context
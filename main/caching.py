@@ -0,0 +1,180 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Enrollment, Group
+from .performance import span
+from .serializers import ENROLLMENT_ROW_FIELDS, enrollment_rows
+
+DASHBOARD_CACHE_TIMEOUT = getattr(settings, "DASHBOARD_CACHE_TIMEOUT", 60 * 60)
+COURSE_LEADERBOARD_SIZE = 50
+
+
+def _version_key(course_id):
+    return f"course:{course_id}:version"
+
+
+def get_course_version(course_id):
+    version = cache.get(_version_key(course_id))
+    if version is None:
+        # Seed from the clock rather than 1 so an evicted counter can never
+        # come back to a version whose blobs are still cached.
+        cache.add(_version_key(course_id), int(time.time() * 1000), timeout=None)
+        version = cache.get(_version_key(course_id))
+    return version
+
+
+async def aget_course_version(course_id):
+    version = await cache.aget(_version_key(course_id))
+    if version is None:
+        await cache.aadd(_version_key(course_id), int(time.time() * 1000), timeout=None)
+        version = await cache.aget(_version_key(course_id))
+    return version
+
+
+def bump_course_version(course_id):
+    """Invalidate every cached leaderboard of a course."""
+    try:
+        return cache.incr(_version_key(course_id))
+    except ValueError:
+        return get_course_version(course_id)
+
+
+def bump_course_versions(course_ids):
+    for course_id in set(course_ids):
+        bump_course_version(course_id)
+
+
+def _group_key(group_id, version):
+    return f"dashboard:group:{group_id}:v{version}"
+
+
+def _course_key(course_id, version):
+    return f"dashboard:course:{course_id}:v{version}"
+
+
+# Leaderboards are built straight from value tuples (student names joined in
+# the same query) instead of model instances and EnrollmentSerializer; the
+# rows are identical and several times cheaper for large groups.
+
+def _group_leaderboard_query(group_id):
+    return (
+        Enrollment.objects.filter(group_id=group_id, is_active=True)
+        .order_by("rank")
+        .values_list(*ENROLLMENT_ROW_FIELDS)
+    )
+
+
+def _course_leaderboard_query(course_id):
+    return (
+        Enrollment.objects.filter(group__course_id=course_id, is_active=True)
+        .order_by("rank")
+        .values_list(*ENROLLMENT_ROW_FIELDS)[:COURSE_LEADERBOARD_SIZE]
+    )
+
+
+def build_group_leaderboard(group_id):
+    return enrollment_rows(_group_leaderboard_query(group_id))
+
+
+def build_course_leaderboard(course_id):
+    return enrollment_rows(_course_leaderboard_query(course_id))
+
+
+def get_group_leaderboard(group):
+    with span("leaderboard"):
+        key = _group_key(group.id, get_course_version(group.course_id))
+        return cache.get_or_set(key, lambda: build_group_leaderboard(group.id), DASHBOARD_CACHE_TIMEOUT)
+
+
+def get_course_leaderboard(course_id):
+    with span("leaderboard"):
+        key = _course_key(course_id, get_course_version(course_id))
+        return cache.get_or_set(key, lambda: build_course_leaderboard(course_id), DASHBOARD_CACHE_TIMEOUT)
+
+
+async def _aget_or_build(key, queryset):
+    data = await cache.aget(key)
+    if data is None:
+        data = enrollment_rows([row async for row in queryset])
+        await cache.aset(key, data, DASHBOARD_CACHE_TIMEOUT)
+    return data
+
+
+async def aget_group_leaderboard(group):
+    with span("leaderboard"):
+        key = _group_key(group.id, await aget_course_version(group.course_id))
+        return await _aget_or_build(key, _group_leaderboard_query(group.id))
+
+
+async def aget_course_leaderboard(course_id):
+    with span("leaderboard"):
+        key = _course_key(course_id, await aget_course_version(course_id))
+        return await _aget_or_build(key, _course_leaderboard_query(course_id))
+
+
+LIVE_AROUND_RADIUS = 2
+_PERSON_FIELDS = ("student__first_name", "student__last_name", "balance")
+
+
+def build_live_leaderboards(leaderboard, group, enrollment_id):
+    """The dashboard's standings read from the sorted-set engine instead of ``Enrollment.rank``.
+
+    Returns ``(position, group_rows, course_rows, around_rows)``: the
+    caller's ``(rank, total_points)``, or None when the set lacks it, then
+    rows shaped like ``enrollment_rows``. Every rank and total comes from
+    the set, so one response never mixes live and persisted standings;
+    names and balances take two queries. Nothing here is cached.
+    """
+    course_id = group.course_id
+    top = leaderboard.top(course_id, COURSE_LEADERBOARD_SIZE)
+    around = leaderboard.around(course_id, enrollment_id, LIVE_AROUND_RADIUS)
+
+    people = {
+        enrollment: person for enrollment, *person in
+        Enrollment.objects.filter(group_id=group.id, is_active=True).values_list("id", *_PERSON_FIELDS)
+    }
+    positions = leaderboard.positions(course_id, people)
+    missing = {row["enrollment_id"] for row in top + around} - people.keys()
+    if missing:
+        people.update(
+            (enrollment, person) for enrollment, *person in
+            Enrollment.objects.filter(id__in=missing).values_list("id", *_PERSON_FIELDS)
+        )
+
+    def rows(entries):
+        return enrollment_rows(
+            (*people[enrollment][:2], total_points, rank, people[enrollment][2])
+            for enrollment, rank, total_points in entries
+            if enrollment in people
+        )
+
+    def entries(live_rows):
+        return [(row["enrollment_id"], row["rank"], row["total_points"]) for row in live_rows]
+
+    group_entries = sorted(
+        ((enrollment, rank, total_points) for enrollment, (rank, total_points) in positions.items()),
+        key=lambda entry: entry[1],
+    )
+    return positions.get(enrollment_id), rows(group_entries), rows(entries(top)), rows(entries(around))
+
+
+def prerender_course_leaderboards(course_id):
+    """Warm the course top list and every group leaderboard for the current version."""
+    version = get_course_version(course_id)
+    group_ids = list(Group.objects.filter(course_id=course_id).values_list("id", flat=True))
+
+    keys = [_course_key(course_id, version)] + [_group_key(group_id, version) for group_id in group_ids]
+    cached = cache.get_many(keys)
+
+    blobs = {}
+    if _course_key(course_id, version) not in cached:
+        blobs[_course_key(course_id, version)] = build_course_leaderboard(course_id)
+    for group_id in group_ids:
+        if _group_key(group_id, version) not in cached:
+            blobs[_group_key(group_id, version)] = build_group_leaderboard(group_id)
+
+    if blobs:
+        cache.set_many(blobs, DASHBOARD_CACHE_TIMEOUT)
+    return len(blobs)
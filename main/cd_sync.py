@@ -0,0 +1,165 @@
+"""Outbound sync of students to the CD mock service.
+
+Every student is sent once, the first time they are enrolled anywhere:
+enrolling queues an outbox message keyed by the student's access code, so
+joining more groups never queues a second one, and ``Student.cd_synced_at``
+records a successful send. The outbox relay hands this module whole batches
+of messages, which are posted in chunks from a small thread pool over one
+pooled, keep-alive ``requests.Session`` per process, so a cohort import
+costs a handful of connections instead of one TLS handshake per enrollment.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .models import Enrollment, Student
+from .outbox import register_handler
+
+CD_MOCK_TOPIC = "cd_mock.add_candidate"
+
+
+class Candidate(NamedTuple):
+    access_code: str
+    first_name: str
+    last_name: str
+    created_by: str
+
+    @classmethod
+    def for_enrollment(cls, enrollment_id):
+        """The enrollment's student as a candidate, or None once the student is synced.
+
+        One query, whatever relations the caller's instance has loaded.
+        """
+        row = (
+            Enrollment.objects
+            .filter(pk=enrollment_id, student__cd_synced_at__isnull=True)
+            .values_list("student__access_code", "student__first_name", "student__last_name",
+                         "group__course__created_by__username")
+            .first()
+        )
+        return cls(*row) if row else None
+
+    @property
+    def idempotency_key(self):
+        return f"cd_mock:student:{self.access_code}"
+
+    def payload(self):
+        return {
+            "candidate_id": self.access_code,
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "created_by": self.created_by,
+        }
+
+
+class SyncResult(NamedTuple):
+    sent: list
+    failed: dict
+
+
+def _option(name, default):
+    return getattr(settings, f"CD_MOCK_{name}", default)
+
+
+class CDMockClient:
+    def __init__(self, pool_size=None):
+        pool_size = pool_size or _option("CONCURRENCY", 4)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def send(self, candidate):
+        """Post one candidate; raises ``requests.RequestException`` on failure."""
+        response = self.session.post(
+            settings.CD_MOCK_URL,
+            json=candidate.payload(),
+            headers={"X-API-KEY": settings.CD_MOCK_API_KEY, "Idempotency-Key": candidate.idempotency_key},
+            timeout=_option("TIMEOUT", 5),
+        )
+        response.raise_for_status()
+        return response
+
+    def send_chunk(self, chunk):
+        sent, failed = [], {}
+        for candidate in chunk:
+            try:
+                self.send(candidate)
+            except requests.RequestException as exc:
+                failed[candidate.access_code] = str(exc)
+            else:
+                sent.append(candidate.access_code)
+        return sent, failed
+
+    def send_many(self, candidates):
+        """Send ``candidates`` once per access code, in chunks, with bounded concurrency."""
+        unique = {}
+        for candidate in candidates:
+            unique.setdefault(candidate.access_code, candidate)
+        unique = list(unique.values())
+
+        batch_size = _option("BATCH_SIZE", 50)
+        chunks = [unique[i:i + batch_size] for i in range(0, len(unique), batch_size)]
+
+        result = SyncResult(sent=[], failed={})
+        if not chunks:
+            return result
+
+        with ThreadPoolExecutor(max_workers=min(_option("CONCURRENCY", 4), len(chunks))) as pool:
+            for sent, failed in pool.map(self.send_chunk, chunks):
+                result.sent.extend(sent)
+                result.failed.update(failed)
+        return result
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = CDMockClient()
+        return _client
+
+
+def reset_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting.startswith("CD_MOCK_"):
+        reset_client()
+
+
+@register_handler(CD_MOCK_TOPIC)
+def deliver_candidates(messages):
+    """Outbox handler: send a batch of candidate messages and mark accepted students synced."""
+    candidates = {message.id: Candidate(**message.payload) for message in messages}
+    result = get_client().send_many(candidates.values())
+
+    synced_at = timezone.now()
+    for i in range(0, len(result.sent), 500):
+        Student.objects.filter(access_code__in=result.sent[i:i + 500]).update(cd_synced_at=synced_at)
+
+    return {
+        message_id: result.failed[candidate.access_code]
+        for message_id, candidate in candidates.items()
+        if candidate.access_code in result.failed
+    }
@@ -0,0 +1,275 @@
+"""Optional live course leaderboard kept in sorted sets.
+
+Each course has one sorted set whose members are enrollment ids. Scores pack
+the total points and the enrollment id together so that Redis' own ordering
+matches ``Enrollment.rank`` semantics (points descending, then id ascending)::
+
+    score = total_points * SCORE_SCALE - enrollment_id
+
+Scores stay exact doubles while total points are below ``2 ** 21``.
+
+Enable it with ``LEADERBOARD_BACKEND = "main.leaderboard.RedisLeaderboardBackend"``;
+``InMemoryLeaderboardBackend`` implements the same handful of commands for tests.
+"""
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Enrollment
+
+SCORE_SCALE = 2 ** 32
+
+
+class InMemoryLeaderboardBackend:
+    """Process-local stand-in for the subset of Redis sorted-set commands we use."""
+
+    def __init__(self, **kwargs):
+        self._sets = {}
+
+    def _ordered(self, key):
+        members = self._sets.get(key, {})
+        return sorted(members.items(), key=lambda item: (-item[1], item[0]))
+
+    def zincrby(self, key, amount, member):
+        members = self._sets.setdefault(key, {})
+        members[member] = members.get(member, 0) + amount
+        return members[member]
+
+    def zadd(self, key, mapping, nx=False, xx=False, incr=False):
+        members = self._sets.get(key, {})
+        added, result = 0, None
+        for member, score in mapping.items():
+            exists = member in members
+            if (nx and exists) or (xx and not exists):
+                continue
+            if incr:
+                score = result = members.get(member, 0) + score
+            added += not exists
+            members[member] = score
+        if members:
+            self._sets[key] = members
+        return result if incr else added
+
+    def zrem(self, key, *members):
+        existing = self._sets.get(key, {})
+        return sum(existing.pop(member, None) is not None for member in members)
+
+    def zscore(self, key, member):
+        return self._sets.get(key, {}).get(member)
+
+    def zrevrank(self, key, member):
+        for idx, (candidate, _) in enumerate(self._ordered(key)):
+            if candidate == member:
+                return idx
+        return None
+
+    def zrevrange(self, key, start, end, withscores=False):
+        ordered = self._ordered(key)
+        end = len(ordered) - 1 if end == -1 else end
+        window = ordered[start:end + 1]
+        return window if withscores else [member for member, _ in window]
+
+    def zcard(self, key):
+        return len(self._sets.get(key, {}))
+
+    def exists(self, key):
+        return int(key in self._sets)
+
+    def delete(self, key):
+        return int(self._sets.pop(key, None) is not None)
+
+    def pipeline(self, transaction=True):
+        return _InMemoryPipeline(self)
+
+
+class _InMemoryPipeline:
+    """Queues commands and runs them on ``execute()``, like a redis-py pipeline."""
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self._backend, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        return [method(*args, **kwargs) for method, args, kwargs in commands]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._commands = []
+
+
+class RedisLeaderboardBackend:
+    def __init__(self, url=None, **kwargs):
+        import redis
+
+        url = url or getattr(settings, "LEADERBOARD_REDIS_URL", settings.CELERY_BROKER_URL)
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class CourseLeaderboard:
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def key(course_id):
+        return f"yt:leaderboard:{course_id}"
+
+    @staticmethod
+    def encode(total_points, enrollment_id):
+        return total_points * SCORE_SCALE - enrollment_id
+
+    @staticmethod
+    def decode(score, enrollment_id):
+        return round((float(score) + enrollment_id) / SCORE_SCALE)
+
+    def _ensure(self, course_id):
+        if not self.backend.exists(self.key(course_id)):
+            self.rebuild(course_id)
+
+    def increment(self, course_id, enrollment_id, points):
+        if not points:
+            return
+        # ZADD XX INCR checks and increments in one command and never creates
+        # a member. An unknown one (new enrollment or evicted set) is seeded
+        # from the DB, which already includes this delta.
+        score = self.backend.zadd(self.key(course_id), {str(enrollment_id): points * SCORE_SCALE}, xx=True, incr=True)
+        if score is None:
+            self.rebuild(course_id)
+
+    def add(self, course_id, enrollment_id, total_points, only_new=False):
+        self.backend.zadd(
+            self.key(course_id),
+            {str(enrollment_id): self.encode(total_points, enrollment_id)},
+            nx=only_new,
+        )
+
+    def remove(self, course_id, enrollment_id):
+        self.backend.zrem(self.key(course_id), str(enrollment_id))
+
+    def rank(self, course_id, enrollment_id):
+        self._ensure(course_id)
+        position = self.backend.zrevrank(self.key(course_id), str(enrollment_id))
+        return None if position is None else position + 1
+
+    def positions(self, course_id, enrollment_ids):
+        """``{enrollment_id: (rank, total_points)}`` for those of ``enrollment_ids`` in the set, in one round trip."""
+        self._ensure(course_id)
+        key = self.key(course_id)
+        members = [str(enrollment_id) for enrollment_id in enrollment_ids]
+        with self.backend.pipeline(transaction=False) as pipe:
+            for member in members:
+                pipe.zrevrank(key, member)
+                pipe.zscore(key, member)
+            replies = pipe.execute()
+
+        positions = {}
+        for member, position, score in zip(members, replies[::2], replies[1::2]):
+            if position is not None and score is not None:
+                positions[int(member)] = (position + 1, self.decode(score, int(member)))
+        return positions
+
+    def _rows(self, course_id, start, end):
+        rows = self.backend.zrevrange(self.key(course_id), start, end, withscores=True)
+        return [
+            {
+                "enrollment_id": int(member),
+                "total_points": self.decode(score, int(member)),
+                "rank": start + idx + 1,
+            }
+            for idx, (member, score) in enumerate(rows)
+        ]
+
+    def top(self, course_id, n=50):
+        self._ensure(course_id)
+        return self._rows(course_id, 0, n - 1)
+
+    def around(self, course_id, enrollment_id, radius=2):
+        position = self.rank(course_id, enrollment_id)
+        if position is None:
+            return []
+        start = max(position - 1 - radius, 0)
+        return self._rows(course_id, start, position - 1 + radius)
+
+    def rebuild(self, course_id):
+        key = self.key(course_id)
+        rows = Enrollment.objects.filter(group__course_id=course_id, is_active=True).values_list(
+            "id", "total_points"
+        )
+        mapping = {str(enrollment_id): self.encode(points, enrollment_id) for enrollment_id, points in rows}
+        # One MULTI/EXEC, so readers and increments never see the set missing or half-filled.
+        with self.backend.pipeline() as pipe:
+            pipe.delete(key)
+            if mapping:
+                pipe.zadd(key, mapping)
+            pipe.execute()
+        return len(mapping)
+
+    def persist(self, course_id):
+        """Write the live ranks back to ``Enrollment`` rows that differ.
+
+        Totals belong to the database, which keeps them exact with ``F()``
+        deltas, and are never copied from the set. A set whose totals
+        disagree with the rows has drifted and is rebuilt before its ranks
+        are used.
+        """
+        self._ensure(course_id)
+        live = {row["enrollment_id"]: row for row in self._rows(course_id, 0, -1)}
+        enrollments = list(Enrollment.objects.filter(id__in=live.keys()).only("id", "total_points", "rank"))
+        if len(enrollments) != len(live) or any(e.total_points != live[e.id]["total_points"] for e in enrollments):
+            self.rebuild(course_id)
+            live = {row["enrollment_id"]: row for row in self._rows(course_id, 0, -1)}
+            enrollments = list(Enrollment.objects.filter(id__in=live.keys()).only("id", "total_points", "rank"))
+
+        to_update = []
+        for e in enrollments:
+            if e.rank != live[e.id]["rank"]:
+                e.rank = live[e.id]["rank"]
+                to_update.append(e)
+
+        if to_update:
+            with transaction.atomic():
+                Enrollment.objects.bulk_update(to_update, ["rank"])
+        return len(to_update)
+
+
+_leaderboard = None
+
+
+def get_leaderboard():
+    """Return the configured CourseLeaderboard, or None when the engine is disabled."""
+    global _leaderboard
+
+    backend_path = getattr(settings, "LEADERBOARD_BACKEND", None)
+    if not backend_path:
+        return None
+
+    if _leaderboard is None:
+        backend_cls = import_string(backend_path)
+        _leaderboard = CourseLeaderboard(backend_cls(**getattr(settings, "LEADERBOARD_OPTIONS", {})))
+    return _leaderboard
+
+
+def reset_leaderboard():
+    global _leaderboard
+    _leaderboard = None
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting.startswith("LEADERBOARD_"):
+        reset_leaderboard()
@@ -0,0 +1,257 @@
+import json
+import logging
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, close_old_connections, reset_queries
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from YouTrack.celery import app as celery_app
+from main.seeding import SeedConfig, dataset_context, seed_dataset, use_sqlite_file
+from main.tasks import reconcile_totals_for_course_task, update_ranks_for_course_task
+from main.urls import urlpatterns
+
+LOCAL_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+METRICS = ("p50_ms", "p95_ms", "queries", "peak_kib")
+
+
+def _student_body(ctx, rng, **extra):
+    student_code, group_code, _ = rng.choice(ctx.logins)
+    return {"student_code": student_code, "group_code": group_code, **extra}
+
+
+def _claim_body(ctx, rng):
+    student_code, group_code, course_id = rng.choice(ctx.logins)
+    reward_ids = ctx.reward_ids.get(course_id) or [0]
+    return {"student_code": student_code, "group_code": group_code, "reward_id": rng.choice(reward_ids)}
+
+
+# URL name (without the "async-" prefix) -> (method, staff only, request data).
+ENDPOINTS = {
+    "check-enrollment": ("post", False, _student_body),
+    "dashboard": ("post", False, _student_body),
+    "rewards-list": ("post", False, _student_body),
+    "rewards-claim": ("post", False, _claim_body),
+    "activities": ("post", False, _student_body),
+    "points-award": ("post", True, lambda ctx, rng: {
+        "reason_id": rng.choice(ctx.reason_ids), "group_id": rng.choice(ctx.group_ids),
+    }),
+    "analytics-daily": ("get", True, lambda ctx, rng: {"course": rng.choice(ctx.course_ids)}),
+}
+
+TASKS = {
+    "task:update_ranks": update_ranks_for_course_task,
+    "task:reconcile_totals": reconcile_totals_for_course_task,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every /api/ endpoint (and the rank tasks) through the Django test client: p50/p95 latency, "
+        "queries per call and peak Python memory. Seeds a throwaway test database unless --database points at "
+        "one made by seed_data. Celery tasks run inline, so their cost shows up in the endpoint that queues them."
+    )
+
+    def add_arguments(self, parser):
+        defaults = SeedConfig()
+        parser.add_argument("--database", help="Benchmark this seeded SQLite file instead of a fresh dataset.")
+        parser.add_argument("--students", type=int, default=2000)
+        parser.add_argument("--enrollments", type=int, default=None)
+        parser.add_argument("--groups", type=int, default=defaults.groups)
+        parser.add_argument("--courses", type=int, default=defaults.courses)
+        parser.add_argument("--instances", type=int, default=defaults.instances)
+        parser.add_argument("--activities", type=int, default=defaults.activities)
+        parser.add_argument("--rewards", type=int, default=defaults.rewards)
+        parser.add_argument("--iterations", type=int, default=30, help="Timed calls per endpoint.")
+        parser.add_argument("--warmup", type=int, default=3, help="Untimed calls per endpoint first.")
+        parser.add_argument("--only", action="append", help="Only run endpoints whose name contains this.")
+        parser.add_argument("--local-cache", action="store_true",
+                            help="Use a process-local cache instead of the configured one.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--save-baseline", help="Write the results to this JSON file.")
+        parser.add_argument("--compare", help="Compare against a baseline JSON file written by --save-baseline.")
+        parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="Relative latency/memory increase reported as a regression (default 0.2).")
+        parser.add_argument("--fail-on-regression", action="store_true",
+                            help="Exit with an error when --compare finds regressions.")
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 2:
+            raise CommandError("--iterations must be at least 2")
+
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Could not read baseline: {exc}")
+
+        caches = override_settings(CACHES=LOCAL_CACHES) if options["local_cache"] else override_settings()
+        always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        # Repeated reward claims are expected to answer 4xx; don't log each one.
+        request_logger = logging.getLogger("django.request")
+        request_level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+
+        # Without DEBUG only the capture in _bench logs queries.
+        setup_test_environment(debug=False)
+        old_name = None
+        try:
+            if options["database"]:
+                use_sqlite_file(options["database"])
+            else:
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+            with caches:
+                if options["database"]:
+                    ctx = dataset_context(seed=options["seed"])
+                else:
+                    config = SeedConfig(**{
+                        field: options[field] for field in SeedConfig._fields if field in options
+                    })
+                    self.stdout.write("Seeding...")
+                    ctx = seed_dataset(config, username_prefix="bench")
+                if not ctx.logins:
+                    raise CommandError("The dataset has no active enrollments to log in with.")
+
+                self.stdout.write(", ".join(f"{name}={count}" for name, count in ctx.counts.items()))
+                results = {name: self._bench(name, call, options) for name, call in self._plan(ctx, options)}
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        finally:
+            close_old_connections()
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            celery_app.conf.task_always_eager = always_eager
+            request_logger.setLevel(request_level)
+
+        self._report(results, baseline, options["tolerance"])
+
+        if options["save_baseline"]:
+            with open(options["save_baseline"], "w") as f:
+                json.dump({"dataset": ctx.counts, "results": results}, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Baseline written to {options['save_baseline']}")
+
+        regressions = self._regressions(results, baseline, options["tolerance"]) if baseline else []
+        if regressions and options["fail_on_regression"]:
+            raise CommandError(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+
+    def _plan(self, ctx, options):
+        rng = random.Random(options["seed"])
+        student, staff = Client(), Client()
+        staff.force_login(ctx.staff_user)
+
+        plan = []
+        for pattern in urlpatterns:
+            name = pattern.name
+            spec = ENDPOINTS.get(name.removeprefix("async-"))
+            if spec is None:
+                self.stderr.write(f"No benchmark for endpoint {name!r}; add it to ENDPOINTS")
+                continue
+            method, staff_only, make_data = spec
+            client = staff if staff_only else student
+            url = reverse(name)
+
+            if method == "get":
+                def call(client=client, url=url, make_data=make_data):
+                    return client.get(url, make_data(ctx, rng)).status_code
+            else:
+                def call(client=client, url=url, make_data=make_data):
+                    return client.post(url, make_data(ctx, rng), content_type="application/json").status_code
+            plan.append((name, call))
+
+        for name, task in TASKS.items():
+            def call(task=task):
+                task(rng.choice(ctx.course_ids))
+                return 200
+            plan.append((name, call))
+
+        only = options["only"]
+        return [(name, call) for name, call in plan if not only or any(part in name for part in only)]
+
+    def _bench(self, name, call, options):
+        for _ in range(options["warmup"]):
+            call()
+
+        latencies, errors = [], 0
+        for _ in range(options["iterations"]):
+            started = time.perf_counter()
+            status_code = call()
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += status_code >= 400
+
+        # Queries and memory come from one extra call each so their
+        # instrumentation does not skew the timings above. The query log is
+        # capped, and CaptureQueriesContext counts by its length, so a full
+        # log would read as zero queries.
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            call()
+        tracemalloc.start()
+        try:
+            call()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        return {
+            "p50_ms": round(percentiles[49], 3),
+            "p95_ms": round(percentiles[94], 3),
+            "queries": len(queries.captured_queries),
+            "peak_kib": round(peak / 1024, 1),
+            "errors": errors,
+        }
+
+    def _report(self, results, baseline, tolerance):
+        previous = (baseline or {}).get("results", {})
+        self.stdout.write(
+            f"{'endpoint':>28} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'peak KiB':>9} {'errors':>7}"
+            + ("  vs baseline" if baseline else "")
+        )
+        for name, result in results.items():
+            line = (
+                f"{name:>28} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['queries']:>8} "
+                f"{result['peak_kib']:>9.1f} {result['errors']:>7}"
+            )
+            if baseline:
+                line += "  " + self._diff(result, previous.get(name), tolerance)
+            self.stdout.write(line)
+
+    def _diff(self, result, old, tolerance):
+        if old is None:
+            return "new"
+        parts = []
+        for metric in METRICS:
+            if not old.get(metric):
+                continue  # nothing to compare against (or a zero baseline)
+            change = result[metric] / old[metric] - 1
+            if self._regressed(metric, result[metric], old[metric], tolerance):
+                parts.append(self.style.ERROR(f"{metric} {change:+.0%}"))
+            elif abs(change) > tolerance:
+                parts.append(self.style.SUCCESS(f"{metric} {change:+.0%}"))
+        return ", ".join(parts) or "ok"
+
+    @staticmethod
+    def _regressed(metric, new, old, tolerance):
+        if metric == "queries":
+            return new > old
+        return new > old * (1 + tolerance)
+
+    def _regressions(self, results, baseline, tolerance):
+        previous = baseline.get("results", {})
+        return [
+            f"{name} {metric}"
+            for name, result in results.items()
+            for metric in METRICS
+            if previous.get(name, {}).get(metric)
+            and self._regressed(metric, result[metric], previous[name][metric], tolerance)
+        ]
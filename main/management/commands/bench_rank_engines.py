@@ -0,0 +1,86 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from main.models import Course, Group, Student, Enrollment
+from main.ranking import rank_course_python, rank_course_sql, sql_rank_engine_supported
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the python and sql rank engines on synthetic courses of increasing size "
+        "and report where sql starts winning. All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="50,200,1000,5000,20000",
+                            help="Comma-separated enrollment counts per course.")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per engine and size (best is kept).")
+        parser.add_argument("--groups", type=int, default=10, help="Groups the course is split into.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not sql_rank_engine_supported():
+            raise CommandError("The configured database does not support the sql rank engine.")
+
+        sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+        rng = random.Random(options["seed"])
+
+        try:
+            with transaction.atomic():
+                results = [self._bench_size(size, options, rng) for size in sizes]
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f"{'enrollments':>12} {'python ms':>10} {'sql ms':>10} {'speedup':>8}")
+        crossover = None
+        for size, python_ms, sql_ms in results:
+            self.stdout.write(f"{size:>12} {python_ms:>10.2f} {sql_ms:>10.2f} {python_ms / sql_ms:>7.2f}x")
+            if crossover is None and sql_ms < python_ms:
+                crossover = size
+
+        if crossover is None:
+            self.stdout.write("sql never beat python in the measured range")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"sql engine is faster from {crossover} enrollments per course"))
+
+    def _bench_size(self, size, options, rng):
+        user = get_user_model().objects.create(username=f"bench-ranks-{size}-{rng.random()}")
+        course = Course.objects.create(name=f"bench {size}", created_by=user)
+        groups = Group.objects.bulk_create([
+            Group(name=f"g{i}", course=course, access_code=f"BR-{size}-{i}")
+            for i in range(options["groups"])
+        ])
+        students = Student.objects.bulk_create([
+            Student(first_name="S", last_name=str(i), created_by=user, access_code=f"BR-{size}-S{i}")
+            for i in range(size)
+        ])
+        enrollments = Enrollment.objects.bulk_create([
+            Enrollment(student=student, group=groups[i % len(groups)])
+            for i, student in enumerate(students)
+        ])
+
+        timings = {}
+        for name, engine in (("python", rank_course_python), ("sql", rank_course_sql)):
+            best = None
+            for _ in range(options["repeat"]):
+                # Shuffle totals so every run has to rewrite (almost) every rank.
+                for e in enrollments:
+                    e.total_points = rng.randint(0, size * 5)
+                Enrollment.objects.bulk_update(enrollments, ["total_points"], batch_size=1000)
+
+                started = time.perf_counter()
+                engine(course.id)
+                elapsed = (time.perf_counter() - started) * 1000
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+
+        return size, timings["python"], timings["sql"]
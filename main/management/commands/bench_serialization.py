@@ -0,0 +1,90 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from main.models import Course, Group, Student, Enrollment, ActivityEntry
+from main.renderers import FastJSONRenderer, orjson
+from main.serializers import EnrollmentSerializer, ActivitySerializer, ENROLLMENT_ROW_FIELDS, enrollment_rows, \
+    ACTIVITY_ROW_FIELDS, activity_rows
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the serializer + DRF renderer path with the value-row + orjson path for group "
+        "leaderboards and activity pages of increasing size. All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="50,200,1000,5000", help="Comma-separated row counts.")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per path and size (best is kept).")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed; the fast path renders with DRF's encoder"))
+
+        try:
+            with transaction.atomic():
+                results = [self._bench_size(size, options["repeat"]) for size in sizes]
+                raise Rollback
+        except Rollback:
+            pass
+
+        self.stdout.write(f"{'payload':>12} {'rows':>6} {'serializer ms':>14} {'fast ms':>8} {'speedup':>8}")
+        for size, timings in results:
+            for payload, (slow_ms, fast_ms) in timings.items():
+                self.stdout.write(f"{payload:>12} {size:>6} {slow_ms:>14.2f} {fast_ms:>8.2f} {slow_ms / fast_ms:>7.2f}x")
+
+    def _bench_size(self, size, repeat):
+        user = get_user_model().objects.create(username=f"bench-serialization-{size}")
+        course = Course.objects.create(name=f"bench {size}", created_by=user)
+        group = Group.objects.create(name="g", course=course, access_code=f"BS-{size}")
+        students = Student.objects.bulk_create([
+            Student(first_name="Student", last_name=f"Nümber {i}", created_by=user, access_code=f"BS-{size}-S{i}")
+            for i in range(size)
+        ])
+        enrollments = Enrollment.objects.bulk_create([
+            Enrollment(student=student, group=group, total_points=i * 3, rank=i + 1, balance=i)
+            for i, student in enumerate(students)
+        ])
+        ActivityEntry.objects.bulk_create([
+            ActivityEntry(enrollment=enrollments[0], action=f"Homework {i}", points=5, coins_change=2)
+            for i in range(size)
+        ])
+
+        enrollment_qs = Enrollment.objects.filter(group=group, is_active=True).order_by("rank")
+        activity_qs = ActivityEntry.objects.filter(enrollment=enrollments[0]).order_by("-id")
+        paths = {
+            "leaderboard": (
+                lambda: JSONRenderer().render(EnrollmentSerializer(enrollment_qs.select_related("student"), many=True).data),
+                lambda: FastJSONRenderer().render(enrollment_rows(enrollment_qs.values_list(*ENROLLMENT_ROW_FIELDS))),
+            ),
+            "activities": (
+                lambda: JSONRenderer().render(ActivitySerializer(activity_qs, many=True).data),
+                lambda: FastJSONRenderer().render(activity_rows(activity_qs.values(*ACTIVITY_ROW_FIELDS))),
+            ),
+        }
+
+        timings = {}
+        for payload, (slow, fast) in paths.items():
+            if slow() != fast():
+                raise CommandError(f"{payload}: fast path output differs from the serializer output")
+            timings[payload] = (self._best_ms(slow, repeat), self._best_ms(fast, repeat))
+        return size, timings
+
+    @staticmethod
+    def _best_ms(func, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,109 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+PROFILES = {
+    # What Django does out of the box: rollback journal, 5s python timeout,
+    # deferred transactions.
+    "default": {"pragmas": [], "timeout": 5, "begin": "BEGIN"},
+    "concurrent": {
+        "pragmas": settings.SQLITE_PRAGMAS,
+        "timeout": settings.SQLITE_BUSY_TIMEOUT,
+        "begin": "BEGIN IMMEDIATE",
+    },
+}
+
+SCHEMA = """
+CREATE TABLE enrollment (id INTEGER PRIMARY KEY, total_points INTEGER NOT NULL, balance INTEGER NOT NULL);
+CREATE TABLE activity (id INTEGER PRIMARY KEY, enrollment_id INTEGER NOT NULL, points INTEGER NOT NULL);
+"""
+
+
+def _connect(path, profile):
+    conn = sqlite3.connect(path, timeout=profile["timeout"], isolation_level=None)
+    for pragma in profile["pragmas"]:
+        conn.execute(pragma)
+    return conn
+
+
+def _worker(args):
+    path, profile_name, writes, rows, seed = args
+    profile = PROFILES[profile_name]
+    rng = random.Random(seed)
+    conn = _connect(path, profile)
+
+    ok = locked = 0
+    for _ in range(writes):
+        enrollment_id = rng.randint(1, rows)
+        try:
+            conn.execute(profile["begin"])
+            # Read-then-write, like the rank task and the web write paths.
+            conn.execute("SELECT total_points FROM enrollment WHERE id = ?", (enrollment_id,)).fetchone()
+            conn.execute("INSERT INTO activity (enrollment_id, points) VALUES (?, 1)", (enrollment_id,))
+            conn.execute(
+                "UPDATE enrollment SET total_points = total_points + 1, balance = balance + 1 WHERE id = ?",
+                (enrollment_id,),
+            )
+            conn.execute("COMMIT")
+            ok += 1
+        except sqlite3.OperationalError as exc:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            if "locked" not in str(exc) and "busy" not in str(exc):
+                raise
+            locked += 1
+    conn.close()
+    return ok, locked
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer a scratch SQLite file from several processes with Django's default settings "
+        "and with the concurrent profile, and compare throughput and lock errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=8)
+        parser.add_argument("--writes", type=int, default=300, help="Write transactions per process.")
+        parser.add_argument("--rows", type=int, default=200, help="Enrollment rows to spread writes over.")
+        parser.add_argument("--profile", choices=sorted(PROFILES), action="append", dest="profiles")
+
+    def handle(self, *args, **options):
+        profiles = options["profiles"] or ["default", "concurrent"]
+
+        self.stdout.write(f"{'profile':>12} {'commits':>8} {'locked':>8} {'error %':>8} {'tx/s':>9} {'seconds':>8}")
+        for profile_name in profiles:
+            ok, locked, elapsed = self._run(profile_name, options)
+            total = ok + locked
+            self.stdout.write(
+                f"{profile_name:>12} {ok:>8} {locked:>8} {100 * locked / total:>7.1f}% "
+                f"{ok / elapsed:>9.1f} {elapsed:>8.2f}"
+            )
+
+    def _run(self, profile_name, options):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "contention.sqlite3")
+            conn = _connect(path, PROFILES[profile_name])
+            conn.executescript(SCHEMA)
+            conn.executemany(
+                "INSERT INTO enrollment (id, total_points, balance) VALUES (?, 0, 0)",
+                [(i,) for i in range(1, options["rows"] + 1)],
+            )
+            conn.close()
+
+            jobs = [
+                (path, profile_name, options["writes"], options["rows"], seed)
+                for seed in range(options["processes"])
+            ]
+            started = time.perf_counter()
+            with multiprocessing.get_context("fork").Pool(options["processes"]) as pool:
+                results = pool.map(_worker, jobs)
+            elapsed = time.perf_counter() - started
+
+        return sum(r[0] for r in results), sum(r[1] for r in results), elapsed
@@ -0,0 +1,140 @@
+import asyncio
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, close_old_connections
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from main.models import Course, Group, Student, Enrollment, Reward, ActivityEntry
+
+ENDPOINTS = ("dashboard/", "rewards", "activities")
+MODES = {
+    # name: (url prefix, use the ASGI handler)
+    "wsgi": ("/api/", False),
+    "asgi-sync": ("/api/", True),
+    "asgi": ("/api/async/", True),
+}
+LOCAL_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the student endpoints in-process: the sync views under WSGI with a thread per "
+        "in-flight request, the sync views under ASGI, and the async views under ASGI. Runs against "
+        "a scratch test database that is seeded here and destroyed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=600, help="Requests per mode.")
+        parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight at once.")
+        parser.add_argument("--students", type=int, default=300)
+        parser.add_argument("--groups", type=int, default=10)
+        parser.add_argument("--activities", type=int, default=40, help="Activity rows per enrollment.")
+        parser.add_argument("--mode", choices=sorted(MODES), action="append", dest="modes")
+        parser.add_argument("--local-cache", action="store_true",
+                            help="Use a process-local cache instead of the configured one.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        modes = options["modes"] or list(MODES)
+        caches = override_settings(CACHES=LOCAL_CACHES) if options["local_cache"] else override_settings()
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with caches:
+                bodies = self._seed(options)
+                rng = random.Random(options["seed"])
+                plan = [(rng.choice(ENDPOINTS), rng.choice(bodies)) for _ in range(options["requests"])]
+
+                self.stdout.write(
+                    f"{'mode':>10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7}"
+                )
+                for mode in modes:
+                    self._report(mode, *self._run(mode, plan, options["concurrency"]))
+        finally:
+            close_old_connections()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def _seed(self, options):
+        user = get_user_model().objects.create(username="loadtest")
+        course = Course.objects.create(name="Load test", created_by=user)
+        groups = Group.objects.bulk_create([
+            Group(name=f"g{i}", course=course, access_code=f"LT-G{i}") for i in range(options["groups"])
+        ])
+        students = Student.objects.bulk_create([
+            Student(first_name="S", last_name=str(i), created_by=user, access_code=f"LT-S{i}")
+            for i in range(options["students"])
+        ])
+        enrollments = Enrollment.objects.bulk_create([
+            Enrollment(student=student, group=groups[i % len(groups)], total_points=i * 7 % 500, rank=i + 1)
+            for i, student in enumerate(students)
+        ])
+        Reward.objects.bulk_create([Reward(name=f"R{i}", cost=i * 10, course=course) for i in range(10)])
+        ActivityEntry.objects.bulk_create(
+            [
+                ActivityEntry(enrollment=enrollment, action="Homework", points=5, coins_change=2)
+                for enrollment in enrollments
+                for _ in range(options["activities"])
+            ],
+            batch_size=2000,
+        )
+        return [
+            {"student_code": student.access_code, "group_code": enrollment.group.access_code}
+            for student, enrollment in zip(students, enrollments)
+        ]
+
+    def _run(self, mode, plan, concurrency):
+        prefix, use_asgi = MODES[mode]
+        if use_asgi:
+            return asyncio.run(self._run_asgi(prefix, plan, concurrency))
+        return self._run_wsgi(prefix, plan, concurrency)
+
+    def _run_wsgi(self, prefix, plan, concurrency):
+        def call(item):
+            endpoint, body = item
+            started = time.perf_counter()
+            try:
+                response = Client().post(prefix + endpoint, body, content_type="application/json")
+            finally:
+                close_old_connections()
+            return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(call, plan))
+        return results, time.perf_counter() - started
+
+    async def _run_asgi(self, prefix, plan, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(item):
+            endpoint, body = item
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(prefix + endpoint, body, content_type="application/json")
+                return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(call(item) for item in plan))
+        elapsed = time.perf_counter() - started
+        # The ORM ran in asgiref's shared sync thread; close its connections there.
+        await sync_to_async(connections.close_all)()
+        return results, elapsed
+
+    def _report(self, mode, results, elapsed):
+        latencies = sorted(seconds * 1000 for seconds, _ in results)
+        errors = sum(1 for _, status_code in results if status_code != 200)
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        self.stdout.write(
+            f"{mode:>10} {len(results) / elapsed:>8.1f} {percentiles[49]:>8.2f} {percentiles[94]:>8.2f} "
+            f"{percentiles[98]:>8.2f} {latencies[-1]:>8.2f} {errors:>7}"
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from main.tasks import prune_results_task, get_result_write_stats
+
+
+class Command(BaseCommand):
+    help = "Prune stored Celery task results and delivered outbox messages now, then print result-write counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None,
+                            help="Keep task results this many days (defaults to CELERY_RESULT_RETENTION_DAYS).")
+
+    def handle(self, *args, **options):
+        self.stdout.write(prune_results_task(options["days"]))
+        for name, value in get_result_write_stats().items():
+            self.stdout.write(f"{name}: {value}")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from main.models import Course, Enrollment
+from main.rollups import rebuild_daily_stats
+from main.tasks import reconcile_totals_for_course_task
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-day enrollment rollups from ActivityEntry rows, then reconcile totals."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--course", type=int, action="append", dest="courses",
+                            help="Only rebuild enrollments of this course (repeatable).")
+        parser.add_argument("--skip-reconcile", action="store_true",
+                            help="Do not re-derive Enrollment totals/ranks afterwards.")
+
+    def handle(self, *args, **options):
+        course_ids = options["courses"]
+
+        if course_ids:
+            enrollment_ids = list(
+                Enrollment.objects.filter(group__course_id__in=course_ids).values_list("id", flat=True)
+            )
+            written = rebuild_daily_stats(enrollment_ids)
+        else:
+            course_ids = list(Course.objects.values_list("id", flat=True))
+            written = rebuild_daily_stats()
+
+        self.stdout.write(f"Wrote {written} daily rollup rows")
+
+        if not options["skip_reconcile"]:
+            for course_id in course_ids:
+                self.stdout.write(reconcile_totals_for_course_task(course_id))
+
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import Course
+from main.tasks import reconcile_totals_for_course_task
+
+
+class Command(BaseCommand):
+    help = "Rebuild Enrollment totals/balances from the activity history and re-rank."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--course", type=int, action="append", dest="courses",
+                            help="Course id to reconcile (repeatable). Defaults to all courses.")
+        parser.add_argument("--async", action="store_true", dest="use_async",
+                            help="Queue the reconciliation on Celery instead of running inline.")
+
+    def handle(self, *args, **options):
+        course_ids = options["courses"] or list(Course.objects.values_list("id", flat=True))
+
+        missing = set(course_ids) - set(Course.objects.filter(id__in=course_ids).values_list("id", flat=True))
+        if missing:
+            raise CommandError(f"Unknown course id(s): {', '.join(map(str, sorted(missing)))}")
+
+        for course_id in course_ids:
+            if options["use_async"]:
+                reconcile_totals_for_course_task.delay(course_id)
+                self.stdout.write(f"Queued reconciliation for course {course_id}")
+            else:
+                self.stdout.write(reconcile_totals_for_course_task(course_id))
+
+        self.stdout.write(self.style.SUCCESS(f"Done ({len(course_ids)} courses)"))
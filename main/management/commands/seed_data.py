@@ -0,0 +1,52 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import Enrollment
+from main.seeding import SeedConfig, seed_dataset, use_sqlite_file
+
+
+class Command(BaseCommand):
+    help = ("Seed a synthetic dataset (instances, courses, groups, students, enrollments, activities, rewards). "
+            "Use --scratch to write to a separate SQLite file instead of the configured database.")
+
+    def add_arguments(self, parser):
+        defaults = SeedConfig()
+        parser.add_argument("--scratch", help="SQLite file to create/migrate and seed instead of the configured DB.")
+        parser.add_argument("--instances", type=int, default=defaults.instances)
+        parser.add_argument("--courses", type=int, default=defaults.courses)
+        parser.add_argument("--groups", type=int, default=defaults.groups)
+        parser.add_argument("--students", type=int, default=defaults.students)
+        parser.add_argument("--enrollments", type=int, default=None,
+                            help="Total enrollments (>= students; extra ones join a second group).")
+        parser.add_argument("--activities", type=int, default=defaults.activities,
+                            help="Average activity rows per enrollment.")
+        parser.add_argument("--rewards", type=int, default=defaults.rewards, help="Rewards per course.")
+        parser.add_argument("--days", type=int, default=defaults.days, help="Spread activities over this many days.")
+        parser.add_argument("--seed", type=int, default=defaults.seed)
+        parser.add_argument("--prefix", default="seed", help="Username prefix for generated staff users.")
+        parser.add_argument("--allow-existing", action="store_true",
+                            help="Seed even if the database already has enrollments.")
+
+    def handle(self, *args, **options):
+        if options["scratch"]:
+            try:
+                use_sqlite_file(options["scratch"])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            call_command("migrate", verbosity=0, interactive=False)
+
+        if Enrollment.objects.exists() and not options["allow_existing"]:
+            raise CommandError("The database already has enrollments; use --scratch or pass --allow-existing.")
+
+        config = SeedConfig(**{field: options[field] for field in SeedConfig._fields})
+        started = time.perf_counter()
+        try:
+            result = seed_dataset(config, username_prefix=options["prefix"])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        for name, count in result.counts.items():
+            self.stdout.write(f"{name}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.perf_counter() - started:.1f}s"))
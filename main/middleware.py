@@ -0,0 +1,208 @@
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .models import RequestProfile
+from .performance import current_trace, end_trace, install_query_recorder, start_trace
+from .profiling import Capture, store_capture
+
+perf_logger = logging.getLogger("main.performance")
+profiler_logger = logging.getLogger("main.profiling")
+
+
+class PerformanceMiddleware:
+    """Trace a sample of requests: queries, DB time, slowest statements and named spans.
+
+    Enabled by ``PERF_SAMPLE_RATE`` (0 to 1). At 0 a request costs one
+    settings lookup and queries run unwrapped. Results go out as a
+    ``Server-Timing`` header (unless ``PERF_SERVER_TIMING`` is off) and one
+    JSON log line on the ``main.performance`` logger, tagged with the URL
+    name.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        if getattr(settings, "PERF_SAMPLE_RATE", 0) > 0:
+            self._install_query_recorder()
+
+    @staticmethod
+    def _install_query_recorder():
+        # New connections get the recorder from connection_created; the loop
+        # covers the ones this thread already has open.
+        connection_created.connect(install_query_recorder, dispatch_uid="main.performance.install_query_recorder")
+        for conn in connections.all(initialized_only=True):
+            install_query_recorder(conn)
+
+    def _sampled(self):
+        rate = getattr(settings, "PERF_SAMPLE_RATE", 0)
+        return rate > 0 and (rate >= 1 or random.random() < rate)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        trace, token = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_trace(token)
+        self._finish(request, response, trace)
+        return response
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        trace, token = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_trace(token)
+        self._finish(request, response, trace)
+        return response
+
+    def _start(self):
+        self._install_query_recorder()
+        return start_trace(slow_query_limit=getattr(settings, "PERF_SLOW_QUERIES", 3))
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        trace = current_trace()
+        if trace is not None:
+            trace.view_started = time.perf_counter()
+
+    def _finish(self, request, response, trace):
+        finished = time.perf_counter()
+        match = request.resolver_match
+        view_name = (match.url_name or match.view_name) if match else None
+
+        timings = [("total", finished - trace.started, None)]
+        if trace.view_started is not None:
+            timings.append(("view", finished - trace.view_started, view_name))
+        timings.append(("db", trace.db_time, f"{trace.queries} queries"))
+        timings.extend((name, seconds, None) for name, seconds in sorted(trace.spans.items()))
+
+        if getattr(settings, "PERF_SERVER_TIMING", True):
+            header = ", ".join(
+                f'{name};dur={seconds * 1000:.2f}' + (f';desc="{desc}"' if desc else "")
+                for name, seconds, desc in timings
+            )
+            if response.has_header("Server-Timing"):
+                header = f"{response['Server-Timing']}, {header}"
+            response["Server-Timing"] = header
+
+        perf_logger.info(json.dumps({
+            "event": "request_performance",
+            "view": view_name,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            **{f"{name}_ms": round(seconds * 1000, 2) for name, seconds, _ in timings},
+            "queries": trace.queries,
+            "slow_queries": [
+                {"ms": round(seconds * 1000, 2), "sql": sql[:500]} for seconds, sql in trace.slow_queries
+            ],
+        }))
+
+
+class ProfilerMiddleware:
+    """Profile single requests on demand or at ``PROFILER_SAMPLE_RATE``.
+
+    Superusers ask for a profile with the ``X-Profile: 1`` header or the
+    ``PROFILER_QUERY_PARAM`` query flag (removed from ``request.GET`` so
+    admin changelists don't take it for a filter). Captures land in the
+    ring buffer of ``main.profiling`` and are listed under Request profiles
+    in the admin. Both profilers follow the thread that runs the middleware.
+    For async views that is the event loop's thread, so work pushed to
+    ``sync_to_async`` threads shows up only as waiting, and any other
+    request the loop runs meanwhile is mixed into the capture; profile
+    async endpoints on an otherwise idle worker. Must come after
+    ``AuthenticationMiddleware``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _asked(self, request):
+        param = getattr(settings, "PROFILER_QUERY_PARAM", "_profile")
+        asked = request.headers.get("X-Profile") == "1"
+        if param in request.GET:
+            request.GET = request.GET.copy()
+            del request.GET[param]
+            asked = True
+        return asked
+
+    def _trigger(self, requested):
+        if requested:
+            return RequestProfile.REQUESTED
+        rate = getattr(settings, "PROFILER_SAMPLE_RATE", 0)
+        if rate > 0 and random.random() < rate:
+            return RequestProfile.SAMPLED
+        return None
+
+    @staticmethod
+    def _is_superuser(request):
+        user = getattr(request, "user", None)
+        return user is not None and user.is_superuser
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        trigger = self._trigger(self._asked(request) and self._is_superuser(request))
+        if trigger is None:
+            return self.get_response(request)
+
+        with Capture() as capture:
+            response = self.get_response(request)
+        self._store(request, response, capture, trigger)
+        return response
+
+    async def __acall__(self, request):
+        # Loading request.user may query, so only asked-for requests pay for the thread hop.
+        trigger = self._trigger(self._asked(request) and await sync_to_async(self._is_superuser)(request))
+        if trigger is None:
+            return await self.get_response(request)
+
+        # Captures the whole loop thread, not just this request (see the class docstring).
+        with Capture() as capture:
+            response = await self.get_response(request)
+        await sync_to_async(self._store)(request, response, capture, trigger)
+        return response
+
+    def _store(self, request, response, capture, trigger):
+        match = request.resolver_match
+        # API views replace request.user with their own principal (e.g. a student).
+        user = getattr(request, "user", None)
+        try:
+            profile = store_capture(
+                capture,
+                trigger=trigger,
+                user=user if isinstance(user, get_user_model()) else None,
+                method=request.method,
+                path=request.path[:500],
+                view_name=(match.view_name if match else "")[:200],
+                status_code=response.status_code,
+            )
+        except Exception:
+            # Never fail the profiled request because the capture could not be saved.
+            profiler_logger.exception("Could not store the profile of %s %s", request.method, request.path)
+        else:
+            response["X-Profile-Id"] = str(profile.pk)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_ytinstance_point_reasons'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollment',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
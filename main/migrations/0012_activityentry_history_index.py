@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_enrollment_token_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activityentry',
+            index=models.Index(fields=['enrollment', '-for_date', '-created_at', '-id'], name='activity_history_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_activityentry_history_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['group', 'rank'], name='enrollment_active_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pointentry',
+            index=models.Index(fields=['for_date'], name='pointentry_for_date_idx'),
+        ),
+    ]
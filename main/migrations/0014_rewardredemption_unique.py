@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:57
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_redemptions(apps, schema_editor):
+    RewardRedemption = apps.get_model("main", "RewardRedemption")
+
+    keep_ids = (
+        RewardRedemption.objects
+        .values("enrollment_id", "reward_id")
+        .annotate(keep_id=Min("id"))
+        .values_list("keep_id", flat=True)
+    )
+    RewardRedemption.objects.exclude(id__in=list(keep_ids)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_redemptions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='rewardredemption',
+            constraint=models.UniqueConstraint(fields=('enrollment', 'reward'), name='unique_reward_redemption'),
+        ),
+    ]
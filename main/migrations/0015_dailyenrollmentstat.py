@@ -0,0 +1,57 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_daily_stats(apps, schema_editor):
+    ActivityEntry = apps.get_model("main", "ActivityEntry")
+    DailyEnrollmentStat = apps.get_model("main", "DailyEnrollmentStat")
+
+    rows = (
+        ActivityEntry.objects
+        .annotate(day=Coalesce("for_date", TruncDate("created_at")))
+        .values("enrollment_id", "day")
+        .annotate(points_sum=Sum("points"), coins_sum=Sum("coins_change"), entry_count=Count("id"))
+        .order_by()
+    )
+    DailyEnrollmentStat.objects.bulk_create(
+        [
+            DailyEnrollmentStat(
+                enrollment_id=row["enrollment_id"],
+                for_date=row["day"],
+                points=row["points_sum"] or 0,
+                coins=row["coins_sum"] or 0,
+                entries=row["entry_count"],
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_rewardredemption_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyEnrollmentStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('for_date', models.DateField()),
+                ('points', models.IntegerField(default=0)),
+                ('coins', models.IntegerField(default=0)),
+                ('entries', models.IntegerField(default=0)),
+                ('enrollment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='main.enrollment')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('enrollment', 'for_date'), name='unique_daily_enrollment_stat')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
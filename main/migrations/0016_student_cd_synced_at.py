@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:08
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_students_synced(apps, schema_editor):
+    # Students enrolled before this migration were already posted one by one
+    # when their enrollments were created; don't send them all again.
+    Student = apps.get_model("main", "Student")
+    Student.objects.filter(enrollments__isnull=False).update(cd_synced_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_dailyenrollmentstat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='cd_synced_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the student was first accepted by the CD mock service', null=True),
+        ),
+        migrations.RunPython(mark_existing_students_synced, migrations.RunPython.noop),
+    ]
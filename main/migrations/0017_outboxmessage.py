@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:11
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def queue_unsynced_students(apps, schema_editor):
+    # Students enrolled since cd_synced_at was added and not sent yet.
+    Enrollment = apps.get_model("main", "Enrollment")
+    OutboxMessage = apps.get_model("main", "OutboxMessage")
+
+    messages = {}
+    rows = (
+        Enrollment.objects.filter(student__cd_synced_at__isnull=True)
+        .order_by("student_id", "id")
+        .values_list("student__access_code", "student__first_name", "student__last_name",
+                     "group__course__created_by__username")
+    )
+    for access_code, first_name, last_name, created_by in rows:
+        key = f"cd_mock:student:{access_code}"
+        messages.setdefault(key, OutboxMessage(
+            topic="cd_mock.add_candidate",
+            idempotency_key=key,
+            payload={"access_code": access_code, "first_name": first_name,
+                     "last_name": last_name, "created_by": created_by},
+        ))
+    OutboxMessage.objects.bulk_create(messages.values(), batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_student_cd_synced_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(max_length=100)),
+                ('idempotency_key', models.CharField(max_length=255, unique=True)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('dead', 'Dead')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['available_at', 'id'], name='outbox_due_idx')],
+            },
+        ),
+        migrations.RunPython(queue_unsynced_students, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,10 @@
-import string
-import random
-
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
 
-User = get_user_model()
+from .codes import allocate_codes, assign_access_codes
 
-def generate_access_code(prefix, length):
-    digits = ''.join(random.choices(string.digits, k=length))
-    return f"{prefix}{digits}"
+User = get_user_model()
 
 YT_INSTANCE_LIMIT = {"is_staff": True, "is_superuser": False}
 
@@ -21,6 +17,31 @@ class TimestampedModel(models.Model):
         abstract = True
 
 
+class AccessCodeManager(models.Manager):
+    """Fills in missing access codes for ``bulk_create`` with one allocation per batch."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = assign_access_codes(list(objs))
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+class AccessCodeModel(models.Model):
+    ACCESS_CODE_PREFIX = ""
+    ACCESS_CODE_WIDTH = 6
+
+    access_code = models.CharField(max_length=20, unique=True, editable=False, blank=True)
+
+    objects = AccessCodeManager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self.access_code:
+            self.access_code = allocate_codes(type(self), self.ACCESS_CODE_PREFIX, self.ACCESS_CODE_WIDTH, 1)[0]
+        super().save(*args, **kwargs)
+
+
 class Course(TimestampedModel):
     name = models.CharField(max_length=255)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -29,37 +50,27 @@ class Course(TimestampedModel):
         return self.name
 
 
-class Group(TimestampedModel):
+class Group(AccessCodeModel, TimestampedModel):
+    ACCESS_CODE_PREFIX = "YT-G"
+    ACCESS_CODE_WIDTH = 4
+
     name = models.CharField(max_length=255)
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name="groups")
     coordinator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
-    access_code = models.CharField(max_length=20, unique=True, editable=False, blank=True)
-
-    def save(self, *args, **kwargs):
-        if not self.access_code:
-            code = generate_access_code("YT-G", 4)
-            while Group.objects.filter(access_code=code).exists():
-                code = generate_access_code("YT-G", 4)
-            self.access_code = code
-        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name} | {self.course}"
 
 
-class Student(TimestampedModel):
+class Student(AccessCodeModel, TimestampedModel):
+    ACCESS_CODE_PREFIX = "YT-E"
+    ACCESS_CODE_WIDTH = 6
+
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
-    access_code = models.CharField(max_length=20, unique=True, editable=False, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
-
-    def save(self, *args, **kwargs):
-        if not self.access_code:
-            code = generate_access_code("YT-E", 6)
-            while Student.objects.filter(access_code=code).exists():
-                code = generate_access_code("YT-E", 6)
-            self.access_code = code
-        super().save(*args, **kwargs)
+    cd_synced_at = models.DateTimeField(null=True, blank=True, editable=False,
+                                        help_text="When the student was first accepted by the CD mock service")
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -72,9 +83,16 @@ class Enrollment(TimestampedModel):
     balance = models.IntegerField(default=0)
     rank = models.IntegerField(default=0)
     is_active = models.BooleanField(default=True)
+    token_version = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         unique_together = ("student", "group")
+        indexes = [
+            # Group leaderboards and per-group probes of the course top list.
+            # Partial on is_active so it matches Django's bare boolean filter.
+            models.Index(fields=["group", "rank"], condition=models.Q(is_active=True),
+                         name="enrollment_active_rank_idx"),
+        ]
 
     def __str__(self):
         return f"{self.student} | {self.group}"
@@ -107,6 +125,11 @@ class PointEntry(TimestampedModel):
     enrollment = models.ForeignKey(Enrollment, on_delete=models.CASCADE, related_name="point_entries")
     for_date = models.DateField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["for_date"], name="pointentry_for_date_idx"),
+        ]
+
     def __str__(self):
         return f"{self.enrollment} - {self.reason} ({self.reason.default_points})"
 
@@ -125,6 +148,11 @@ class RewardRedemption(TimestampedModel):
     enrollment = models.ForeignKey(Enrollment, on_delete=models.CASCADE, related_name="redemptions")
     reward = models.ForeignKey(Reward, on_delete=models.CASCADE, related_name="redemptions")
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["enrollment", "reward"], name="unique_reward_redemption"),
+        ]
+
     def __str__(self):
         return f"{self.enrollment} redeemed {self.reward}"
 
@@ -137,5 +165,96 @@ class ActivityEntry(TimestampedModel):
     linked_point_entry = models.ForeignKey(PointEntry, on_delete=models.CASCADE, null=True, blank=True)
     for_date = models.DateField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["enrollment", "-for_date", "-created_at", "-id"], name="activity_history_idx"),
+        ]
+
     def __str__(self):
         return f"{self.enrollment.student} | {self.action} | XP: {self.points} | Coins: {self.coins_change}"
+
+
+class DailyEnrollmentStat(models.Model):
+    """Per-day rollup of an enrollment's ActivityEntry rows, maintained on write.
+
+    Activities without a ``for_date`` are counted on the local date they were created.
+    """
+    enrollment = models.ForeignKey(Enrollment, on_delete=models.CASCADE, related_name="daily_stats")
+    for_date = models.DateField()
+    points = models.IntegerField(default=0)
+    coins = models.IntegerField(default=0)
+    entries = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["enrollment", "for_date"], name="unique_daily_enrollment_stat"),
+        ]
+
+    def __str__(self):
+        return f"{self.enrollment} | {self.for_date} | XP: {self.points} | Coins: {self.coins}"
+
+
+class OutboxMessage(models.Model):
+    """An external side effect recorded in the transaction that caused it.
+
+    The relay (``main.outbox``) delivers pending messages after commit and
+    retries failures with backoff until they are sent or dead-lettered.
+    """
+    PENDING = "pending"
+    SENT = "sent"
+    DEAD = "dead"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (DEAD, "Dead"),
+    ]
+
+    topic = models.CharField(max_length=100)
+    idempotency_key = models.CharField(max_length=255, unique=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The relay's "due messages" scan; sent/dead rows never touch it.
+            models.Index(fields=["available_at", "id"], condition=models.Q(status="pending"),
+                         name="outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} | {self.idempotency_key} | {self.status}"
+
+
+class RequestProfile(models.Model):
+    """A captured request profile; the data lives in files under ``PROFILER_DIR``.
+
+    Only the newest ``PROFILER_MAX_PROFILES`` are kept (see ``main.profiling``).
+    """
+    REQUESTED = "requested"
+    SAMPLED = "sampled"
+    TRIGGER_CHOICES = [
+        (REQUESTED, "Requested"),
+        (SAMPLED, "Sampled"),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    samples = models.PositiveIntegerField(default=0, help_text="Stack samples taken for the collapsed output")
+    file_stem = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        ordering = ["-id"]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
@@ -0,0 +1,142 @@
+"""Transactional outbox for external side effects.
+
+Producers call ``enqueue`` inside the transaction that makes the change (see
+``tasks.publish``, which also kicks the relay on commit), so a message exists
+exactly when its rows do. ``relay_due_messages`` hands due messages to the
+handler registered for their topic, one batch per topic, and records the
+outcome: sent, retried later with exponential backoff, or dead-lettered
+after ``OUTBOX_MAX_ATTEMPTS``. Delivery is at least once; handlers pass the
+message's idempotency key on so receivers can drop repeats.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def register_handler(topic):
+    """Register ``func(messages) -> {message_id: error}`` as the batch handler for ``topic``.
+
+    Messages missing from the returned mapping count as delivered.
+    """
+    def decorator(func):
+        _handlers[topic] = func
+        return func
+    return decorator
+
+
+def enqueue(topic, payload, idempotency_key):
+    """Record a message in the current transaction; repeats of a key are ignored."""
+    enqueue_many(topic, [(payload, idempotency_key)])
+
+
+def enqueue_many(topic, messages):
+    """Record ``(payload, idempotency_key)`` pairs for ``topic`` with batched inserts."""
+    OutboxMessage.objects.bulk_create(
+        [OutboxMessage(topic=topic, payload=payload, idempotency_key=key) for payload, key in messages],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def retry_delay(attempts):
+    base = getattr(settings, "OUTBOX_RETRY_BACKOFF", 30)
+    cap = getattr(settings, "OUTBOX_RETRY_BACKOFF_MAX", 60 * 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), cap))
+
+
+def due_messages(batch_size):
+    return list(
+        OutboxMessage.objects
+        .filter(status=OutboxMessage.PENDING, available_at__lte=timezone.now())
+        .order_by("available_at", "id")[:batch_size]
+    )
+
+
+def _deliver(topic, messages):
+    handler = _handlers.get(topic)
+    if handler is None:
+        return {message.id: f"No handler registered for topic {topic!r}" for message in messages}
+    try:
+        return handler(messages) or {}
+    except Exception as exc:
+        logger.exception("Outbox handler for %s failed", topic)
+        return {message.id: repr(exc) for message in messages}
+
+
+def relay_due_messages(batch_size=None):
+    """Deliver one batch of due messages. Returns ``(sent, retried, dead)`` counts."""
+    batch_size = batch_size or getattr(settings, "OUTBOX_BATCH_SIZE", 100)
+    max_attempts = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 8)
+
+    by_topic = defaultdict(list)
+    for message in due_messages(batch_size):
+        by_topic[message.topic].append(message)
+
+    now = timezone.now()
+    processed = []
+    sent = retried = dead = 0
+    for topic, messages in by_topic.items():
+        errors = _deliver(topic, messages)
+        for message in messages:
+            message.attempts += 1
+            error = errors.get(message.id)
+            if error is None:
+                message.status = OutboxMessage.SENT
+                message.sent_at = now
+                message.last_error = ""
+                sent += 1
+            elif message.attempts >= max_attempts:
+                message.status = OutboxMessage.DEAD
+                message.last_error = error
+                dead += 1
+                logger.error("Outbox message %s dead-lettered after %s attempts: %s",
+                             message.idempotency_key, message.attempts, error)
+            else:
+                message.available_at = now + retry_delay(message.attempts)
+                message.last_error = error
+                retried += 1
+            processed.append(message)
+
+    if processed:
+        OutboxMessage.objects.bulk_update(
+            processed, ["status", "attempts", "available_at", "last_error", "sent_at"], batch_size=500
+        )
+    return sent, retried, dead
+
+
+def requeue(queryset):
+    """Make dead (or delayed) messages due again with a fresh attempt budget."""
+    return queryset.exclude(status=OutboxMessage.SENT).update(
+        status=OutboxMessage.PENDING, attempts=0, available_at=timezone.now()
+    )
+
+
+def prune_sent(older_than):
+    """Delete delivered messages older than ``older_than`` (a timedelta)."""
+    cutoff = timezone.now() - older_than
+    deleted, _ = OutboxMessage.objects.filter(status=OutboxMessage.SENT, sent_at__lt=cutoff).delete()
+    return deleted
+
+
+def backlog_stats():
+    counts = dict(
+        OutboxMessage.objects.filter(status__in=[OutboxMessage.PENDING, OutboxMessage.DEAD])
+        .values_list("status").annotate(n=Count("id")).order_by()
+    )
+    oldest = OutboxMessage.objects.filter(status=OutboxMessage.PENDING).aggregate(oldest=Min("created_at"))["oldest"]
+    return {
+        "pending": counts.get(OutboxMessage.PENDING, 0),
+        "dead": counts.get(OutboxMessage.DEAD, 0),
+        "oldest_pending": oldest,
+        "oldest_pending_age": timezone.now() - oldest if oldest else None,
+    }
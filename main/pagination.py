@@ -0,0 +1,101 @@
+"""Keyset pagination over a student's activity history.
+
+Pages are ordered by ``(for_date, created_at, id)`` descending and each page
+continues strictly after the last row of the previous one, so every page is
+an index range scan on ``activity_history_idx`` no matter how deep the
+student scrolls. Cursors are opaque url-safe strings.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from django.db import connection
+from django.db.models import Q
+
+ACTIVITY_PAGE_SIZE = 50
+ACTIVITY_PAGE_SIZE_MAX = 100
+ACTIVITY_ORDERING = ("-for_date", "-created_at", "-id")
+ACTIVITY_CURSOR_FIELDS = ("for_date", "created_at", "id")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(activity):
+    """Cursor after ``activity``, a model instance or a ``values()`` row holding ACTIVITY_CURSOR_FIELDS."""
+    if isinstance(activity, dict):
+        for_date, created_at, pk = (activity[field] for field in ACTIVITY_CURSOR_FIELDS)
+    else:
+        for_date, created_at, pk = activity.for_date, activity.created_at, activity.pk
+    position = [
+        for_date.isoformat() if for_date else None,
+        created_at.isoformat(),
+        pk,
+    ]
+    raw = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        for_date, created_at, pk = json.loads(raw)
+        return (
+            date.fromisoformat(for_date) if for_date else None,
+            datetime.fromisoformat(created_at),
+            int(pk),
+        )
+    except (TypeError, ValueError, UnicodeDecodeError) as exc:
+        raise InvalidCursor("Invalid cursor") from exc
+
+
+def _after(for_date, created_at, pk):
+    """Rows that sort strictly after the cursor position in ACTIVITY_ORDERING."""
+    # NULL for_date rows sort first in a DESC scan where the backend treats
+    # NULL as the largest value (PostgreSQL) and last where it is the
+    # smallest (SQLite); follow the database's own order so the index is used.
+    nulls_first = connection.features.nulls_order_largest
+
+    if for_date is None:
+        condition = Q(for_date__isnull=True) & (
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+        if nulls_first:
+            condition |= Q(for_date__isnull=False)
+        return condition
+
+    condition = (
+        Q(for_date__lt=for_date) |
+        Q(for_date=for_date, created_at__lt=created_at) |
+        Q(for_date=for_date, created_at=created_at, id__lt=pk)
+    )
+    if not nulls_first:
+        condition |= Q(for_date__isnull=True)
+    return condition
+
+
+def _page_queryset(queryset, cursor, page_size):
+    queryset = queryset.order_by(*ACTIVITY_ORDERING)
+    if cursor:
+        queryset = queryset.filter(_after(*decode_cursor(cursor)))
+    return queryset[:page_size + 1]
+
+
+def _split_page(rows, page_size):
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def paginate_activities(queryset, cursor=None, page_size=ACTIVITY_PAGE_SIZE):
+    """Return ``(rows, next_cursor)`` for one page of ``queryset``."""
+    page_size = max(1, min(page_size, ACTIVITY_PAGE_SIZE_MAX))
+    return _split_page(list(_page_queryset(queryset, cursor, page_size)), page_size)
+
+
+async def apaginate_activities(queryset, cursor=None, page_size=ACTIVITY_PAGE_SIZE):
+    page_size = max(1, min(page_size, ACTIVITY_PAGE_SIZE_MAX))
+    rows = [row async for row in _page_queryset(queryset, cursor, page_size)]
+    return _split_page(rows, page_size)
@@ -0,0 +1,88 @@
+"""Per-request performance traces for sampled requests.
+
+``PerformanceMiddleware`` (see ``main.middleware``) starts a ``RequestTrace``
+for a sample of requests and keeps it in a context variable, which follows
+the request into ``sync_to_async`` threads. Every database connection gets
+``record_query`` as an execute wrapper, and hot spots in the code mark
+themselves with ``span("name")``. Without an active trace both cost one
+context-variable lookup.
+"""
+import heapq
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_trace = ContextVar("performance_trace", default=None)
+
+
+class RequestTrace:
+    def __init__(self, slow_query_limit=3):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.spans = defaultdict(float)
+        self.slow_query_limit = slow_query_limit
+        self._slowest = []  # min-heap of (duration, sequence, sql)
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        if not self.slow_query_limit:
+            return
+        item = (duration, self.queries, sql)
+        if len(self._slowest) < self.slow_query_limit:
+            heapq.heappush(self._slowest, item)
+        else:
+            heapq.heappushpop(self._slowest, item)
+
+    @property
+    def slow_queries(self):
+        """``(seconds, sql)`` of the slowest statements, slowest first."""
+        return [(duration, sql) for duration, _, sql in sorted(self._slowest, reverse=True)]
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def start_trace(**kwargs):
+    """Start tracing the current context; pass the returned token to ``end_trace``."""
+    trace = RequestTrace(**kwargs)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+@contextmanager
+def span(name):
+    """Add the time spent in the block to the current trace under ``name``."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans[name] += time.perf_counter() - started
+
+
+def record_query(execute, sql, params, many, context):
+    trace = _current_trace.get()
+    if trace is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        trace.record_query(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(connection, **kwargs):
+    """Add ``record_query`` to a connection once; also usable as a ``connection_created`` receiver."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
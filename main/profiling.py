@@ -0,0 +1,129 @@
+"""On-demand request profiles kept in a bounded on-disk ring buffer.
+
+A profiled request runs under ``cProfile`` while a background thread
+samples the request thread's stack every ``PROFILER_INTERVAL`` seconds.
+Each capture writes two files under ``PROFILER_DIR``:
+
+* ``<stem>.prof``: cProfile stats, for ``python -m pstats`` or snakeviz.
+* ``<stem>.collapsed``: one ``frame;frame;frame count`` line per sampled
+  stack, the input format of flamegraph.pl and speedscope.
+
+A ``RequestProfile`` row describes each capture. Once there are more than
+``PROFILER_MAX_PROFILES`` rows, the oldest rows and their files are
+deleted, so the directory never grows without bound.
+"""
+import cProfile
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import RequestProfile
+
+PROFILE_SUFFIXES = {"prof": ".prof", "collapsed": ".collapsed"}
+
+
+def profile_dir():
+    return Path(getattr(settings, "PROFILER_DIR", Path(settings.BASE_DIR) / "profiles"))
+
+
+def profile_file(stem, kind):
+    return profile_dir() / f"{stem}{PROFILE_SUFFIXES[kind]}"
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+class StackSampler(threading.Thread):
+    """Counts the stacks of one thread, sampled at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name="request-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Capture:
+    """Profile the block it wraps: ``with Capture() as capture: ...``."""
+
+    def __init__(self, interval=None):
+        self.interval = interval or getattr(settings, "PROFILER_INTERVAL", 0.005)
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), self.interval)
+        self.duration = None
+
+    def __enter__(self):
+        self.sampler.start()
+        self._started = time.perf_counter()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self.duration = time.perf_counter() - self._started
+        self.sampler.stop()
+        return False
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.sampler.stacks.most_common())
+
+
+def store_capture(capture, **fields):
+    """Write a capture's files, record it and trim the ring buffer. Returns the ``RequestProfile``."""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    capture.profiler.dump_stats(profile_file(stem, "prof"))
+    profile_file(stem, "collapsed").write_text(capture.collapsed(), encoding="utf-8")
+
+    profile = RequestProfile.objects.create(
+        file_stem=stem,
+        duration_ms=round(capture.duration * 1000, 2),
+        samples=sum(capture.sampler.stacks.values()),
+        **fields,
+    )
+    prune_profiles()
+    return profile
+
+
+def delete_profile_files(stem):
+    for kind in PROFILE_SUFFIXES:
+        try:
+            profile_file(stem, kind).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def prune_profiles(keep=None):
+    """Delete all but the newest ``keep`` profiles (rows and files). Returns how many were removed."""
+    keep = getattr(settings, "PROFILER_MAX_PROFILES", 50) if keep is None else keep
+    # The post_delete receiver in signals removes each row's files.
+    stale = list(RequestProfile.objects.order_by("-id").values_list("id", flat=True)[keep:])
+    if not stale:
+        return 0
+    RequestProfile.objects.filter(id__in=stale).delete()
+    return len(stale)
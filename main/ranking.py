@@ -0,0 +1,84 @@
+"""Rank engines for ``Enrollment.rank``.
+
+Both engines give the same result: active enrollments of a course ordered by
+``total_points`` descending, ties broken by ``id`` ascending, numbered from 1
+(``ROW_NUMBER`` semantics, so tied students still get distinct ranks).
+
+* ``python`` loads the enrollments, sorts them and ``bulk_update``s changes.
+* ``sql`` runs a single ``UPDATE ... FROM (SELECT ROW_NUMBER() OVER ...)`` in
+  the database. It needs PostgreSQL or SQLite >= 3.33.
+
+``RANK_ENGINE = "auto"`` picks ``sql`` whenever the database supports it.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Enrollment, Group
+
+RANK_ENGINES = ("auto", "sql", "python")
+
+
+def sql_rank_engine_supported(conn=connection):
+    if conn.vendor == "postgresql":
+        return True
+    if conn.vendor == "sqlite":
+        import sqlite3
+
+        return sqlite3.sqlite_version_info >= (3, 33, 0)
+    return False
+
+
+def rank_course_python(course_id):
+    enrollments = Enrollment.objects.filter(group__course_id=course_id, is_active=True).only(
+        "id", "total_points", "rank"
+    )
+
+    enrollments_sorted = sorted(enrollments, key=lambda x: (-x.total_points, x.id))
+    to_update_ranks = []
+    for idx, e in enumerate(enrollments_sorted, start=1):
+        if e.rank != idx:
+            e.rank = idx
+            to_update_ranks.append(e)
+
+    if to_update_ranks:
+        with transaction.atomic():
+            Enrollment.objects.bulk_update(to_update_ranks, ["rank"])
+
+    return len(to_update_ranks)
+
+
+def rank_course_sql(course_id):
+    qn = connection.ops.quote_name
+    enrollment_table = qn(Enrollment._meta.db_table)
+    group_table = qn(Group._meta.db_table)
+
+    sql = f"""
+        UPDATE {enrollment_table}
+        SET {qn("rank")} = ranked.new_rank
+        FROM (
+            SELECT e.{qn("id")} AS id,
+                   ROW_NUMBER() OVER (ORDER BY e.{qn("total_points")} DESC, e.{qn("id")} ASC) AS new_rank
+            FROM {enrollment_table} e
+            INNER JOIN {group_table} g ON g.{qn("id")} = e.{qn("group_id")}
+            WHERE g.{qn("course_id")} = %s AND e.{qn("is_active")} = %s
+        ) AS ranked
+        WHERE {enrollment_table}.{qn("id")} = ranked.id
+          AND {enrollment_table}.{qn("rank")} <> ranked.new_rank
+    """
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, [course_id, True])
+        return cursor.rowcount
+
+
+def recompute_ranks_for_course(course_id, engine=None):
+    engine = engine or getattr(settings, "RANK_ENGINE", "auto")
+    if engine not in RANK_ENGINES:
+        raise ValueError(f"Unknown rank engine {engine!r}; expected one of {', '.join(RANK_ENGINES)}")
+
+    if engine == "auto":
+        engine = "sql" if sql_rank_engine_supported() else "python"
+
+    if engine == "sql":
+        return rank_course_sql(course_id)
+    return rank_course_python(course_id)
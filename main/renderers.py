@@ -0,0 +1,53 @@
+"""JSON rendering through orjson, byte-compatible with DRF's ``JSONRenderer`` except for floats.
+
+Floats that Python writes in exponent form come out as ``1e16`` rather than
+``1e+16`` (the parsed value is the same), and NaN or infinity render as
+``null`` where DRF's strict mode raises. The API payloads carry integers, so
+the fast path does not check for either.
+
+orjson is optional: without it, or for anything else the fast path does not
+reproduce exactly (indented output, non-default JSON settings, values
+orjson refuses), rendering falls back to DRF's encoder.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .performance import span
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# datetimes go through DRF's encoder so UTC keeps its "Z" suffix.
+ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+_drf_encoder = JSONEncoder()
+
+
+def _default(obj):
+    return _drf_encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with span("serialize"):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if data is None or orjson is None or not self._fast_path_applies(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping DRF applies so the output stays valid JavaScript.
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+    def _fast_path_applies(self, accepted_media_type, renderer_context):
+        if self.ensure_ascii or not self.compact or not self.strict:
+            return False
+        return self.get_indent(accepted_media_type, renderer_context or {}) is None
+
@@ -0,0 +1,92 @@
+"""Maintenance of the ``DailyEnrollmentStat`` rollup table.
+
+Writers call :func:`apply_daily_deltas` next to every ActivityEntry insert,
+delete or edit; :func:`rebuild_daily_stats` re-derives the table from the raw
+activity rows (``manage.py rebuild_daily_stats``).
+
+The bulk writers in ``services`` update the rollups inside their own
+transaction. The signal receivers run after the activity row is saved, so
+under autocommit the two commit separately, and queryset ``update()`` or
+``delete()`` skips them altogether; a rebuild settles either case.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import ActivityEntry, DailyEnrollmentStat
+
+
+def rollup_date(for_date, created_at=None):
+    if for_date:
+        return for_date
+    return timezone.localdate(created_at) if created_at else timezone.localdate()
+
+
+def apply_daily_deltas(for_date, enrollment_ids, points, coins, entries=1):
+    """Add the same delta to the (enrollment, for_date) rollup of every given enrollment.
+
+    For additions missing rows are inserted as zeros first and then
+    incremented, so the two statements are safe against concurrent writers
+    creating the same row. Removals only touch existing rows: during a
+    cascading Enrollment delete the rollups are already gone.
+    """
+    enrollment_ids = list(enrollment_ids)
+    if not enrollment_ids or not (points or coins or entries):
+        return
+
+    with transaction.atomic(savepoint=False):
+        if entries > 0:
+            DailyEnrollmentStat.objects.bulk_create(
+                [DailyEnrollmentStat(enrollment_id=enrollment_id, for_date=for_date) for enrollment_id in enrollment_ids],
+                ignore_conflicts=True,
+            )
+        DailyEnrollmentStat.objects.filter(enrollment_id__in=enrollment_ids, for_date=for_date).update(
+            points=F("points") + points,
+            coins=F("coins") + coins,
+            entries=F("entries") + entries,
+        )
+
+
+def apply_activity_to_rollup(activity, sign=1):
+    apply_daily_deltas(
+        rollup_date(activity.for_date, activity.created_at),
+        [activity.enrollment_id],
+        sign * activity.points,
+        sign * activity.coins_change,
+        sign,
+    )
+
+
+def rebuild_daily_stats(enrollment_ids=None, batch_size=1000):
+    """Recompute rollups from ActivityEntry rows. Returns the number of rows written."""
+    activities = ActivityEntry.objects.all()
+    stats = DailyEnrollmentStat.objects.all()
+    if enrollment_ids is not None:
+        activities = activities.filter(enrollment_id__in=enrollment_ids)
+        stats = stats.filter(enrollment_id__in=enrollment_ids)
+
+    rows = (
+        activities
+        .annotate(day=Coalesce("for_date", TruncDate("created_at")))
+        .values("enrollment_id", "day")
+        .annotate(points_sum=Sum("points"), coins_sum=Sum("coins_change"), entry_count=Count("id"))
+        .order_by()
+    )
+
+    with transaction.atomic():
+        stats.delete()
+        created = DailyEnrollmentStat.objects.bulk_create(
+            (
+                DailyEnrollmentStat(
+                    enrollment_id=row["enrollment_id"],
+                    for_date=row["day"],
+                    points=row["points_sum"] or 0,
+                    coins=row["coins_sum"] or 0,
+                    entries=row["entry_count"],
+                )
+                for row in rows.iterator()
+            ),
+            batch_size=batch_size,
+        )
+    return len(created)
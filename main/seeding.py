@@ -0,0 +1,212 @@
+"""Synthetic datasets for benchmarks and local profiling.
+
+``seed_dataset`` builds instances with their admins and coordinators,
+courses, groups, students, enrollments, a dated activity history and
+rewards. Everything goes through ``bulk_create`` in fixed-size chunks, so
+100k enrollments with a few million activities stay within a bounded amount
+of memory; rollups, totals and ranks are then derived from the activities
+with ``rebuild_daily_stats`` and a reconcile per course. The same ``seed``
+always produces the same rows, apart from the random access codes.
+
+``dataset_context`` samples an already seeded database for the benchmark
+runner.
+"""
+import random
+from datetime import timedelta
+from typing import NamedTuple
+
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import ActivityEntry, Course, Enrollment, Group, PointReason, Reward, Student, YTInstance
+from .rollups import rebuild_daily_stats
+from .tasks import reconcile_totals_for_course_task
+
+FIRST_NAMES = ("Aziz", "Dilnoza", "Jasur", "Madina", "Otabek", "Sevara", "Timur", "Zarina", "Bekzod", "Nodira")
+LAST_NAMES = ("Karimov", "Rakhimova", "Tursunov", "Yusupova", "Aliyev", "Nazarova", "Saidov", "Ergasheva")
+REASONS = (("Homework", 5, 1), ("Attendance", 2, 0), ("Speaking club", 10, 2), ("Mock exam", 20, 5))
+CHUNK_SIZE = 2000
+
+
+class SeedConfig(NamedTuple):
+    instances: int = 2
+    courses: int = 4
+    groups: int = 40
+    students: int = 10_000
+    enrollments: int = None  # defaults to one per student
+    activities: int = 20  # per enrollment, on average
+    rewards: int = 10  # per course
+    days: int = 90
+    seed: int = 0
+
+
+class SeedResult(NamedTuple):
+    staff_user: object
+    course_ids: list
+    group_ids: list
+    reason_ids: list
+    # (student_code, group_code, course_id) of a sample of active enrollments, for API calls.
+    logins: list
+    reward_ids: dict  # course_id -> [reward_id, ...]
+    counts: dict
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def seed_dataset(config=SeedConfig(), username_prefix="seed"):
+    rng = random.Random(config.seed)
+    User = get_user_model()
+    enrollment_count = config.enrollments or config.students
+    if enrollment_count < config.students:
+        raise ValueError("enrollments must be at least the number of students")
+    if enrollment_count > config.students * config.groups:
+        raise ValueError("not enough groups for that many enrollments per student")
+
+    # One transaction: on SQLite every autocommitted batch would otherwise be its own fsync.
+    with transaction.atomic():
+        reasons = [
+            PointReason.objects.get_or_create(name=name, defaults={"default_points": points, "default_coins": coins})[0]
+            for name, points, coins in REASONS
+        ]
+
+        staff_user = User.objects.create_superuser(username=f"{username_prefix}-root", password=None)
+        instances = []
+        for i in range(config.instances):
+            admin = User.objects.create_user(username=f"{username_prefix}-admin-{i}", is_staff=True)
+            coordinators = User.objects.bulk_create(
+                User(username=f"{username_prefix}-coordinator-{i}-{c}", is_staff=True) for c in range(3)
+            )
+            instance = YTInstance.objects.create(name=f"{username_prefix} instance {i}", admin=admin)
+            instance.coordinators.set(coordinators)
+            instance.point_reasons.set(reasons)
+            instances.append((admin, coordinators))
+
+        courses = Course.objects.bulk_create(
+            Course(name=f"Course {i}", created_by=instances[i % len(instances)][0]) for i in range(config.courses)
+        )
+        owner_instance = {course.pk: instances[i % len(instances)] for i, course in enumerate(courses)}
+        groups = Group.objects.bulk_create(
+            Group(
+                name=f"Group {i}",
+                course=courses[i % len(courses)],
+                coordinator=rng.choice(owner_instance[courses[i % len(courses)].pk][1]),
+            )
+            for i in range(config.groups)
+        )
+
+        students = []
+        for chunk in _chunks(range(config.students)):
+            students += Student.objects.bulk_create(
+                Student(
+                    first_name=rng.choice(FIRST_NAMES),
+                    last_name=rng.choice(LAST_NAMES),
+                    created_by=groups[i % len(groups)].course.created_by,
+                )
+                for i in chunk
+            )
+
+        pairs = [(student, groups[i % len(groups)]) for i, student in enumerate(students)]
+        taken = {(student.pk, group.pk) for student, group in pairs}
+        while len(pairs) < enrollment_count:
+            student, group = rng.choice(students), rng.choice(groups)
+            if (student.pk, group.pk) not in taken:
+                taken.add((student.pk, group.pk))
+                pairs.append((student, group))
+
+        enrollments = []
+        for chunk in _chunks(pairs):
+            enrollments += Enrollment.objects.bulk_create(Enrollment(student=s, group=g) for s, g in chunk)
+
+        today = timezone.localdate()
+        activity_count = 0
+        for chunk in _chunks(enrollments, max(1, CHUNK_SIZE // max(config.activities, 1))):
+            rows = []
+            for enrollment in chunk:
+                for _ in range(rng.randint(0, 2 * config.activities)):
+                    name, points, coins = rng.choice(REASONS)
+                    rows.append(ActivityEntry(
+                        enrollment=enrollment, action=name, points=points, coins_change=coins,
+                        for_date=today - timedelta(days=rng.randrange(config.days)),
+                    ))
+            ActivityEntry.objects.bulk_create(rows, batch_size=CHUNK_SIZE)
+            activity_count += len(rows)
+
+        rewards = Reward.objects.bulk_create(
+            Reward(name=f"Reward {r}", cost=10 * (r + 1), course=course)
+            for course in courses
+            for r in range(config.rewards)
+        )
+        reward_ids = {}
+        for reward in rewards:
+            reward_ids.setdefault(reward.course_id, []).append(reward.pk)
+
+    rebuild_daily_stats()
+    for course in courses:
+        reconcile_totals_for_course_task(course.pk)
+
+    sample = rng.sample(pairs, min(len(pairs), 200))
+    return SeedResult(
+        staff_user=staff_user,
+        course_ids=[course.pk for course in courses],
+        group_ids=[group.pk for group in groups],
+        reason_ids=[reason.pk for reason in reasons],
+        logins=[(student.access_code, group.access_code, group.course_id) for student, group in sample],
+        reward_ids=reward_ids,
+        counts={
+            "instances": config.instances,
+            "courses": len(courses),
+            "groups": len(groups),
+            "students": len(students),
+            "enrollments": len(enrollments),
+            "activities": activity_count,
+            "rewards": len(courses) * config.rewards,
+        },
+    )
+
+
+def dataset_context(sample_size=200, seed=0, username="bench-root"):
+    """Describe an existing dataset the way ``seed_dataset`` does, sampling logins from the database."""
+    User = get_user_model()
+    staff_user = User.objects.filter(is_superuser=True).order_by("id").first()
+    if staff_user is None:
+        staff_user = User.objects.create_superuser(username=username, password=None)
+
+    enrollment_ids = list(Enrollment.objects.filter(is_active=True).values_list("id", flat=True))
+    sample = random.Random(seed).sample(enrollment_ids, min(len(enrollment_ids), sample_size))
+    reward_ids = {}
+    for reward_id, course_id in Reward.objects.values_list("id", "course_id"):
+        reward_ids.setdefault(course_id, []).append(reward_id)
+
+    return SeedResult(
+        staff_user=staff_user,
+        course_ids=list(Course.objects.values_list("id", flat=True)),
+        group_ids=list(Group.objects.values_list("id", flat=True)),
+        reason_ids=list(PointReason.objects.values_list("id", flat=True)),
+        logins=list(
+            Enrollment.objects.filter(id__in=sample)
+            .values_list("student__access_code", "group__access_code", "group__course_id")
+        ),
+        reward_ids=reward_ids,
+        counts={
+            "instances": YTInstance.objects.count(),
+            "courses": Course.objects.count(),
+            "groups": Group.objects.count(),
+            "students": Student.objects.count(),
+            "enrollments": Enrollment.objects.count(),
+            "activities": ActivityEntry.objects.count(),
+            "rewards": Reward.objects.count(),
+        },
+    )
+
+
+def use_sqlite_file(path, alias="default"):
+    """Point ``alias`` at another SQLite file, e.g. a scratch database for seeding or benchmarks."""
+    conn = connections[alias]
+    if conn.vendor != "sqlite":
+        raise ValueError("Scratch database files are only supported on SQLite")
+    conn.close()
+    conn.settings_dict["NAME"] = str(path)
@@ -1,4 +1,7 @@
 # serializers.py
+from datetime import timedelta
+
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Student, Group, Enrollment, Course, Reward, RewardRedemption, PointEntry, ActivityEntry
 
@@ -8,6 +11,49 @@ class EnrollmentCheckSerializer(serializers.Serializer):
     group_code = serializers.CharField()
 
 
+class AwardPointsSerializer(serializers.Serializer):
+    reason_id = serializers.IntegerField()
+    for_date = serializers.DateField(required=False)
+    group_id = serializers.IntegerField(required=False)
+    enrollment_ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+
+    def validate(self, attrs):
+        if not attrs.get("group_id") and not attrs.get("enrollment_ids"):
+            raise serializers.ValidationError("Either group_id or enrollment_ids is required")
+        return attrs
+
+
+class ActivityPageSerializer(serializers.Serializer):
+    cursor = serializers.CharField(required=False, allow_blank=True)
+    page_size = serializers.IntegerField(required=False, min_value=1)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+
+class DailyAnalyticsQuerySerializer(serializers.Serializer):
+    MAX_DAYS = 366
+
+    course = serializers.IntegerField(required=False)
+    group = serializers.IntegerField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    DEFAULT_DAYS = 30
+
+    def validate(self, attrs):
+        if not attrs.get("course") and not attrs.get("group"):
+            raise serializers.ValidationError("Either course or group is required")
+
+        # Fill in the defaults first so a lone date_from is still bounded.
+        attrs["date_to"] = attrs.get("date_to") or timezone.localdate()
+        attrs["date_from"] = attrs.get("date_from") or attrs["date_to"] - timedelta(days=self.DEFAULT_DAYS - 1)
+        if attrs["date_from"] > attrs["date_to"]:
+            raise serializers.ValidationError("date_from must not be after date_to")
+        if (attrs["date_to"] - attrs["date_from"]).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f"Date range is limited to {self.MAX_DAYS} days")
+        return attrs
+
+
 class GroupSerializer(serializers.ModelSerializer):
     class Meta:
         model = Group
@@ -25,6 +71,17 @@ class EnrollmentSerializer(serializers.ModelSerializer):
         return f"{obj.student.first_name} {obj.student.last_name}"
 
 
+ENROLLMENT_ROW_FIELDS = ("student__first_name", "student__last_name", "total_points", "rank", "balance")
+
+
+def enrollment_rows(rows):
+    """``EnrollmentSerializer(many=True).data`` for ``values_list(*ENROLLMENT_ROW_FIELDS)`` rows."""
+    return [
+        {"full_name": f"{first_name} {last_name}", "total_points": total_points, "rank": rank, "balance": balance}
+        for first_name, last_name, total_points, rank, balance in rows
+    ]
+
+
 class RewardSerializer(serializers.ModelSerializer):
     class Meta:
         model = Reward
@@ -50,4 +107,20 @@ class RewardRedemptionSerializer(serializers.ModelSerializer):
 class ActivitySerializer(serializers.ModelSerializer):
     class Meta:
         model = ActivityEntry
-        fields = ["action", "for_date", "points", "coins_change"]
\ No newline at end of file
+        fields = ["action", "for_date", "points", "coins_change"]
+
+
+ACTIVITY_ROW_FIELDS = ("action", "for_date", "points", "coins_change")
+
+
+def activity_rows(rows):
+    """``ActivitySerializer(many=True).data`` for ``values()`` rows holding ACTIVITY_ROW_FIELDS."""
+    return [
+        {
+            "action": row["action"],
+            "for_date": row["for_date"].isoformat() if row["for_date"] else None,
+            "points": row["points"],
+            "coins_change": row["coins_change"],
+        }
+        for row in rows
+    ]
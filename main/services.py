@@ -0,0 +1,219 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .caching import bump_course_versions
+from .leaderboard import get_leaderboard
+from .models import Enrollment, PointEntry, ActivityEntry, PointReason, RewardRedemption, Group, \
+    DailyEnrollmentStat
+from .rollups import apply_daily_deltas, rollup_date
+from .tasks import schedule_rank_update
+from .tenancy import resolve_tenant_context
+
+
+def apply_activity_delta(enrollment_id, points, coins_change):
+    """Shift an enrollment's stored totals by a single activity's points and coins.
+
+    Runs as one ``UPDATE ... SET total_points = total_points + %s`` so concurrent
+    writers never lose each other's increments. Inactive enrollments are left
+    alone, as the full recompute does; returns the number of rows shifted.
+    """
+    if not points and not coins_change:
+        return 0
+
+    return Enrollment.objects.filter(pk=enrollment_id, is_active=True).update(
+        total_points=F("total_points") + points,
+        balance=F("balance") + coins_change,
+    )
+
+
+def get_course_id_for_enrollment(enrollment_id):
+    return (
+        Enrollment.objects
+        .filter(pk=enrollment_id)
+        .values_list("group__course_id", flat=True)
+        .first()
+    )
+
+
+def award_points(reason, for_date, enrollments):
+    """Award ``reason`` to every given enrollment in a single transaction.
+
+    ``enrollments`` may be Enrollment instances or ids. PointEntry and
+    ActivityEntry rows are bulk-inserted (bypassing the per-row signals), the
+    totals are shifted with one UPDATE, and each affected course gets exactly
+    one rank refresh once the transaction commits. Returns the created
+    PointEntry rows.
+    """
+    enrollment_ids = list(dict.fromkeys(
+        e.pk if isinstance(e, Enrollment) else e for e in enrollments
+    ))
+    if not enrollment_ids:
+        return []
+
+    action = reason.name.lower().capitalize()
+
+    with transaction.atomic():
+        point_entries = PointEntry.objects.bulk_create([
+            PointEntry(reason=reason, enrollment_id=enrollment_id, for_date=for_date)
+            for enrollment_id in enrollment_ids
+        ])
+        ActivityEntry.objects.bulk_create([
+            ActivityEntry(
+                enrollment_id=entry.enrollment_id,
+                action=action,
+                points=reason.default_points,
+                coins_change=reason.default_coins,
+                linked_point_entry=entry,
+                for_date=for_date,
+            )
+            for entry in point_entries
+        ])
+
+        apply_daily_deltas(
+            rollup_date(for_date), enrollment_ids, reason.default_points, reason.default_coins
+        )
+
+        if getattr(settings, "INCREMENTAL_TOTALS", True) and (reason.default_points or reason.default_coins):
+            Enrollment.objects.filter(pk__in=enrollment_ids, is_active=True).update(
+                total_points=F("total_points") + reason.default_points,
+                balance=F("balance") + reason.default_coins,
+            )
+
+        course_by_enrollment = dict(
+            Enrollment.objects.filter(pk__in=enrollment_ids, is_active=True).values_list("id", "group__course_id")
+        )
+        transaction.on_commit(lambda: _after_bulk_award(course_by_enrollment, reason.default_points))
+
+    return point_entries
+
+
+def _after_bulk_award(course_by_enrollment, points):
+    course_ids = set(course_by_enrollment.values())
+    bump_course_versions(course_ids)
+
+    leaderboard = get_leaderboard()
+    if leaderboard is not None and points:
+        for enrollment_id, course_id in course_by_enrollment.items():
+            leaderboard.increment(course_id, enrollment_id, points)
+
+    for course_id in course_ids:
+        schedule_rank_update(course_id)
+
+
+class RewardAlreadyClaimed(Exception):
+    pass
+
+
+class InsufficientBalance(Exception):
+    def __init__(self, cost, balance):
+        super().__init__(f"Reward costs {cost} coins, you only have {balance}")
+        self.cost = cost
+        self.balance = balance
+
+
+def claim_reward(enrollment_id, reward):
+    """Redeem ``reward`` for an enrollment, atomically and at most once.
+
+    The balance is only decremented if it still covers the cost and the
+    unique (enrollment, reward) constraint rolls the charge back for a
+    duplicate, so parallel requests can neither overspend nor double-claim.
+    The spending ActivityEntry is inserted without signals because the
+    balance has already been charged here.
+    """
+    try:
+        with transaction.atomic():
+            charged = Enrollment.objects.filter(pk=enrollment_id, balance__gte=reward.cost).update(
+                balance=F("balance") - reward.cost
+            )
+            if not charged:
+                raise InsufficientBalance(reward.cost, None)
+
+            redemption = RewardRedemption.objects.create(enrollment_id=enrollment_id, reward=reward)
+            for_date = timezone.localdate()
+            ActivityEntry.objects.bulk_create([
+                ActivityEntry(
+                    enrollment_id=enrollment_id,
+                    action=f'Claimed "{reward.name}"',
+                    points=0,
+                    coins_change=-reward.cost,
+                    for_date=for_date,
+                )
+            ])
+            apply_daily_deltas(for_date, [enrollment_id], 0, -reward.cost)
+            transaction.on_commit(lambda: bump_course_versions([reward.course_id]))
+    except IntegrityError:
+        raise RewardAlreadyClaimed()
+    except InsufficientBalance:
+        # Failure path only: report a duplicate first, as before, then the balance.
+        if RewardRedemption.objects.filter(enrollment_id=enrollment_id, reward=reward).exists():
+            raise RewardAlreadyClaimed()
+        balance = Enrollment.objects.filter(pk=enrollment_id).values_list("balance", flat=True).first()
+        raise InsufficientBalance(reward.cost, balance or 0)
+
+    return redemption
+
+
+def enrollments_for_user(user):
+    qs = Enrollment.objects.all()
+    if user.is_superuser:
+        return qs
+    return qs.filter(
+        Q(student__created_by=user) |
+        Q(group__coordinator=user) |
+        Q(group__course__created_by=user)
+    )
+
+
+def point_reasons_for_user(user):
+    tenant = resolve_tenant_context(user)
+    if tenant.is_superuser:
+        return PointReason.objects.all()
+    if not tenant.has_instance:
+        return PointReason.objects.none()
+    return PointReason.objects.filter(pk__in=tenant.point_reason_ids)
+
+
+def groups_for_user(user):
+    qs = Group.objects.all()
+    if user.is_superuser:
+        return qs
+    return qs.filter(Q(coordinator=user) | Q(course__created_by=user))
+
+
+def daily_series(groups, date_from, date_to):
+    """Per-group and combined daily points/coins/entries from the rollup table.
+
+    One grouped query over ``DailyEnrollmentStat``; the cost follows
+    enrollments x days in range, not the number of activity rows.
+    """
+    groups = list(groups)
+    rows = (
+        DailyEnrollmentStat.objects
+        .filter(enrollment__group__in=groups, for_date__range=(date_from, date_to))
+        .values("enrollment__group_id", "for_date")
+        .annotate(points=Sum("points"), coins=Sum("coins"), entries=Sum("entries"))
+        .order_by("for_date")
+    )
+
+    by_group = {group.id: [] for group in groups}
+    combined = {}
+    for row in rows:
+        point = {
+            "date": row["for_date"],
+            "points": row["points"],
+            "coins": row["coins"],
+            "entries": row["entries"],
+        }
+        by_group[row["enrollment__group_id"]].append(point)
+
+        total = combined.setdefault(row["for_date"], {"date": row["for_date"], "points": 0, "coins": 0, "entries": 0})
+        total["points"] += point["points"]
+        total["coins"] += point["coins"]
+        total["entries"] += point["entries"]
+
+    return (
+        [{"id": group.id, "name": group.name, "series": by_group[group.id]} for group in groups],
+        list(combined.values()),
+    )
@@ -1,25 +1,86 @@
 import requests
-from django.db.models.signals import post_save, post_delete
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import PointEntry, ActivityEntry, Student, Enrollment, YTInstance
-from .tasks import update_ranks_for_course_task, send_student_to_cd_mock
+from .models import PointEntry, ActivityEntry, Student, Enrollment, Group, YTInstance, RequestProfile
+from .authentication import invalidate_enrollment, forget_token_version
+from .caching import bump_course_version, bump_course_versions
+from .cd_sync import CD_MOCK_TOPIC, Candidate
+from .leaderboard import get_leaderboard
+from .profiling import delete_profile_files
+from .rollups import apply_activity_to_rollup
+from .services import apply_activity_delta, get_course_id_for_enrollment
+from .tasks import schedule_rank_update, publish
+from .tenancy import invalidate_tenant_contexts
+
+
+def _incremental_totals_enabled():
+    return getattr(settings, "INCREMENTAL_TOTALS", True)
+
+
+def _increment_leaderboard(course_id, enrollment_id, points):
+    leaderboard = get_leaderboard()
+    if leaderboard is not None:
+        leaderboard.increment(course_id, enrollment_id, points)
+
+
+def _after_activity_delta(course_id, enrollment_id, points):
+    bump_course_version(course_id)
+    _increment_leaderboard(course_id, enrollment_id, points)
+
+
+@receiver(pre_save, sender=ActivityEntry)
+def remember_activityentry_state(sender, instance, **kwargs):
+    if instance.pk is None or kwargs.get("raw"):
+        return
+    instance._previous_state = ActivityEntry.objects.filter(pk=instance.pk).first()
 
 
 @receiver(post_save, sender=ActivityEntry)
 def handle_activityentry_save(sender, instance, created, **kwargs):
+    course_id = get_course_id_for_enrollment(instance.enrollment_id)
+    if course_id is None:
+        return
+
+    previous = getattr(instance, "_previous_state", None)
+    if previous is not None:
+        apply_activity_to_rollup(previous, sign=-1)
+    apply_activity_to_rollup(instance)
+
+    # Cache, sorted-set and task side effects wait for the commit so a
+    # rolled-back write never reaches them.
     if not created:
+        # Edits can change points/coins arbitrarily; let the full
+        # re-aggregation settle the totals instead of guessing the delta.
+        transaction.on_commit(lambda: schedule_rank_update(course_id, reconcile=True))
+        if previous is not None and previous.enrollment_id != instance.enrollment_id:
+            # Moved to another enrollment: the one it left needs settling too.
+            previous_course_id = get_course_id_for_enrollment(previous.enrollment_id)
+            if previous_course_id not in (None, course_id):
+                transaction.on_commit(lambda: schedule_rank_update(previous_course_id, reconcile=True))
         return
 
-    enrollment = instance.enrollment
-    course = enrollment.group.course
-    update_ranks_for_course_task.delay(course.id)
+    if _incremental_totals_enabled():
+        if apply_activity_delta(instance.enrollment_id, instance.points, instance.coins_change):
+            enrollment_id, points = instance.enrollment_id, instance.points
+            transaction.on_commit(lambda: _after_activity_delta(course_id, enrollment_id, points))
+    transaction.on_commit(lambda: schedule_rank_update(course_id))
 
 
 @receiver(post_delete, sender=ActivityEntry)
 def handle_activityentry_delete(sender, instance, **kwargs):
-    enrollment = instance.enrollment
-    course = enrollment.group.course
-    update_ranks_for_course_task.delay(course.id)
+    course_id = get_course_id_for_enrollment(instance.enrollment_id)
+    if course_id is None:
+        return
+
+    apply_activity_to_rollup(instance, sign=-1)
+
+    if _incremental_totals_enabled():
+        if apply_activity_delta(instance.enrollment_id, -instance.points, -instance.coins_change):
+            enrollment_id, points = instance.enrollment_id, -instance.points
+            transaction.on_commit(lambda: _after_activity_delta(course_id, enrollment_id, points))
+    transaction.on_commit(lambda: schedule_rank_update(course_id))
 
 
 @receiver(post_save, sender=PointEntry)
@@ -35,14 +96,74 @@ def handle_pointentry_save(sender, instance, created, **kwargs):
         )
 
 
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def invalidate_enrollment_access(sender, instance, **kwargs):
+    forget_token_version(instance.pk)
+    if not instance.is_active or kwargs.get("signal") is post_delete:
+        invalidate_enrollment(instance.pk)
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def sync_enrollment_leaderboards(sender, instance, **kwargs):
+    course_id = Group.objects.filter(pk=instance.group_id).values_list("course_id", flat=True).first()
+    if course_id is None:
+        return
+
+    saved = kwargs.get("signal") is post_save
+    reconcile = saved and not kwargs.get("created")
+    enrollment_id, total_points = instance.pk, instance.total_points
+    keep = instance.is_active and saved
+
+    def after_commit():
+        bump_course_version(course_id)
+        if reconcile:
+            # A full-instance save may carry totals read before later deltas
+            # landed, or flip is_active; settle both from the activity history.
+            schedule_rank_update(course_id, reconcile=True)
+
+        leaderboard = get_leaderboard()
+        if leaderboard is None:
+            return
+        if keep:
+            leaderboard.add(course_id, enrollment_id, total_points, only_new=True)
+        else:
+            leaderboard.remove(course_id, enrollment_id)
+
+    transaction.on_commit(after_commit)
+
+
+@receiver(post_save, sender=Student)
+def invalidate_student_leaderboards(sender, instance, created, **kwargs):
+    if created:
+        return
+
+    course_ids = list(Enrollment.objects.filter(student=instance).values_list("group__course_id", flat=True))
+    transaction.on_commit(lambda: bump_course_versions(course_ids))
+
+
 @receiver(post_save, sender=Enrollment)
 def create_cd_mock_student(sender, instance, created, **kwargs):
     if not created:
         return
 
-    send_student_to_cd_mock.delay(
-        instance.student.access_code,
-        instance.student.first_name,
-        instance.student.last_name,
-        instance.group.course.created_by.username
-    )
\ No newline at end of file
+    candidate = Candidate.for_enrollment(instance.pk)
+    if candidate is not None:
+        publish(CD_MOCK_TOPIC, candidate._asdict(), candidate.idempotency_key)
+
+
+@receiver(post_save, sender=YTInstance)
+@receiver(post_delete, sender=YTInstance)
+@receiver(m2m_changed, sender=YTInstance.coordinators.through)
+@receiver(m2m_changed, sender=YTInstance.point_reasons.through)
+def invalidate_tenant_membership(sender, **kwargs):
+    action = kwargs.get("action")
+    if action is None or action.startswith("post_"):
+        transaction.on_commit(invalidate_tenant_contexts)
+
+
+@receiver(post_delete, sender=RequestProfile)
+def remove_request_profile_files(sender, instance, **kwargs):
+    stem = instance.file_stem
+    transaction.on_commit(lambda: delete_profile_files(stem))
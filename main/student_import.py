@@ -0,0 +1,153 @@
+"""Bulk import of a cohort of students into one group.
+
+Rows come from a CSV or XLSX file with ``first_name`` and ``last_name``
+columns. Students and enrollments are inserted with ``bulk_create`` (access
+codes are allocated for the whole batch at once), which skips the per-row
+post_save handlers, so their effects are applied here in bulk instead: one
+outbox insert pass queues every student for the CD mock sync, and after
+commit the course's leaderboards are invalidated and re-ranked once.
+"""
+import csv
+import io
+from typing import NamedTuple
+
+from django.db import transaction
+
+from .caching import bump_course_version
+from .cd_sync import CD_MOCK_TOPIC, Candidate
+from .leaderboard import get_leaderboard
+from .models import Course, Enrollment, Student
+from .tasks import publish_many, schedule_rank_update
+
+try:
+    import openpyxl
+except ImportError:  # XLSX support is optional
+    openpyxl = None
+
+REQUIRED_COLUMNS = ("first_name", "last_name")
+REPORT_COLUMNS = ("first_name", "last_name", "access_code", "group_code")
+
+
+class StudentImportError(ValueError):
+    pass
+
+
+class StudentRow(NamedTuple):
+    line: int
+    first_name: str
+    last_name: str
+
+
+class ImportResult(NamedTuple):
+    group: object
+    students: list
+    skipped: list
+
+    def write_report(self, out):
+        """Write the generated codes as CSV to the text stream ``out``."""
+        writer = csv.writer(out)
+        writer.writerow(REPORT_COLUMNS)
+        for student in self.students:
+            writer.writerow((student.first_name, student.last_name, student.access_code, self.group.access_code))
+
+    def report(self):
+        out = io.StringIO()
+        self.write_report(out)
+        return out.getvalue()
+
+
+def _column(name):
+    return str(name or "").strip().lower().replace(" ", "_")
+
+
+def _cell(value):
+    return "" if value is None else str(value).strip()
+
+
+def _csv_rows(fileobj):
+    data = fileobj.read()
+    if isinstance(data, bytes):
+        try:
+            data = data.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise StudentImportError("CSV files must be UTF-8 encoded.")
+    return csv.reader(io.StringIO(data))
+
+
+def _xlsx_rows(fileobj):
+    if openpyxl is None:
+        raise StudentImportError("Reading .xlsx files requires openpyxl; upload a CSV instead.")
+    try:
+        workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    except Exception as exc:
+        raise StudentImportError(f"Could not read the workbook: {exc}")
+    return workbook.active.iter_rows(values_only=True)
+
+
+def read_student_rows(fileobj, filename):
+    """Parse an uploaded file. Returns ``(rows, skipped)``; ``skipped`` holds ``(line, reason)`` pairs."""
+    reader = _xlsx_rows(fileobj) if filename.lower().endswith(".xlsx") else _csv_rows(fileobj)
+
+    header = [_column(name) for name in next(iter(reader), [])]
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if missing:
+        raise StudentImportError(f"Missing column(s): {', '.join(missing)}")
+    first, last = header.index("first_name"), header.index("last_name")
+
+    rows, skipped = [], []
+    for line, values in enumerate(reader, start=2):
+        values = [_cell(value) for value in values]
+        if not any(values):
+            continue
+        values += [""] * (len(header) - len(values))
+        first_name, last_name = values[first], values[last]
+        if not first_name or not last_name:
+            skipped.append((line, "first_name and last_name are required"))
+        elif len(first_name) > 100 or len(last_name) > 100:
+            skipped.append((line, "names are limited to 100 characters"))
+        else:
+            rows.append(StudentRow(line, first_name, last_name))
+    return rows, skipped
+
+
+def import_students(rows, group, created_by, batch_size=500):
+    """Create a student and an active enrollment in ``group`` for every row, in one transaction."""
+    if not rows:
+        return []
+
+    owner = Course.objects.filter(pk=group.course_id).values_list("created_by__username", flat=True).get()
+
+    with transaction.atomic():
+        students = Student.objects.bulk_create(
+            [Student(first_name=row.first_name, last_name=row.last_name, created_by=created_by) for row in rows],
+            batch_size=batch_size,
+        )
+        enrollments = Enrollment.objects.bulk_create(
+            [Enrollment(student=student, group=group) for student in students],
+            batch_size=batch_size,
+        )
+
+        candidates = [Candidate(s.access_code, s.first_name, s.last_name, owner) for s in students]
+        publish_many(CD_MOCK_TOPIC, [(c._asdict(), c.idempotency_key) for c in candidates])
+
+        course_id, enrollment_ids = group.course_id, [e.pk for e in enrollments]
+        transaction.on_commit(lambda: _after_import(course_id, enrollment_ids))
+
+    return students
+
+
+def _after_import(course_id, enrollment_ids):
+    bump_course_version(course_id)
+
+    leaderboard = get_leaderboard()
+    if leaderboard is not None:
+        for enrollment_id in enrollment_ids:
+            leaderboard.add(course_id, enrollment_id, 0, only_new=True)
+
+    schedule_rank_update(course_id)
+
+
+def import_student_file(fileobj, filename, group, created_by):
+    rows, skipped = read_student_rows(fileobj, filename)
+    students = import_students(rows, group, created_by)
+    return ImportResult(group, students, skipped)
@@ -1,28 +1,51 @@
+import uuid
+from datetime import timedelta
+
 import requests
 from celery import shared_task
+from celery.signals import task_postrun
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.core.signals import setting_changed
 from django.db import transaction
 from django.db.models import Sum
+from django.dispatch import receiver
+from django.utils import timezone
+from django_celery_results.models import TaskResult
 
-from .models import Enrollment, Course, ActivityEntry
+from .caching import bump_course_version, prerender_course_leaderboards
+from .cd_sync import Candidate, get_client
+from .leaderboard import get_leaderboard
+from .models import ActivityEntry, Enrollment, Course
+from .outbox import enqueue_many, prune_sent, relay_due_messages
+from .ranking import recompute_ranks_for_course
 
+# Tasks queued per write or by beat whose return value nobody reads: they
+# skip the result backend entirely instead of writing a STARTED row and
+# updating it to SUCCESS on every run.
+FIRE_AND_FORGET = {"ignore_result": True, "track_started": False}
 
-@shared_task
-def update_ranks_for_course_task(course_id):
-    course = Course.objects.get(id=course_id)
 
+def recompute_totals_for_course(course_id):
+    # Sums the raw ActivityEntry rows, not the DailyEnrollmentStat rollups:
+    # this is the repair path, and queryset update()/delete() calls skip the
+    # signals that maintain both, so the rollups can be as wrong as the totals.
     aggs = (
         ActivityEntry.objects
-        .filter(enrollment__group__course=course, enrollment__is_active=True)
+        .filter(enrollment__group__course_id=course_id, enrollment__is_active=True)
         .values("enrollment_id")
         .annotate(points_sum=Sum("points"), coins_sum=Sum("coins_change"))
+        .order_by()
     )
 
     sums_by_enrollment = {
         a["enrollment_id"]: (a["points_sum"] or 0, a["coins_sum"] or 0) for a in aggs
     }
 
-    enrollments_qs = Enrollment.objects.filter(group__course=course, is_active=True)
-    enrollments = list(enrollments_qs)
+    enrollments = Enrollment.objects.filter(group__course_id=course_id, is_active=True).only(
+        "id", "total_points", "balance"
+    )
 
     to_update_totals = []
     for e in enrollments:
@@ -36,41 +59,343 @@ def update_ranks_for_course_task(course_id):
         with transaction.atomic():
             Enrollment.objects.bulk_update(to_update_totals, ["total_points", "balance"])
 
-    enrollments_sorted = sorted(enrollments, key=lambda x: (-x.total_points, x.id))
-    to_update_ranks = []
-    for idx, e in enumerate(enrollments_sorted, start=1):
-        if e.rank != idx:
-            e.rank = idx
-            to_update_ranks.append(e)
+    return len(to_update_totals)
 
-    if to_update_ranks:
-        with transaction.atomic():
-            Enrollment.objects.bulk_update(to_update_ranks, ["rank"])
+
+@shared_task(**FIRE_AND_FORGET)
+def update_ranks_for_course_task(course_id):
+    """Re-rank a course from the stored totals.
+
+    Totals are kept current by the ActivityEntry signals (see
+    ``services.apply_activity_delta``); when ``INCREMENTAL_TOTALS`` is off this
+    falls back to re-aggregating every activity in the course first.
+    """
+    if not getattr(settings, "INCREMENTAL_TOTALS", True):
+        return reconcile_totals_for_course_task(course_id)
+
+    ranks_updated = recompute_ranks_for_course(course_id)
+    if ranks_updated:
+        bump_course_version(course_id)
+    return f"Updated ranks for {ranks_updated} enrollments in course {course_id}"
+
+
+@shared_task(**FIRE_AND_FORGET)
+def reconcile_totals_for_course_task(course_id):
+    """Rebuild totals/balances from the full activity history, then re-rank."""
+    totals_updated = recompute_totals_for_course(course_id)
+    ranks_updated = recompute_ranks_for_course(course_id)
+    if totals_updated or ranks_updated:
+        bump_course_version(course_id)
 
     return (
-        f"Updated totals/balances for {len(to_update_totals)} enrollments and "
-        f"ranks for {len(to_update_ranks)} enrollments in course {course.id}"
+        f"Updated totals/balances for {totals_updated} enrollments and "
+        f"ranks for {ranks_updated} enrollments in course {course_id}"
     )
 
-@shared_task(bind=True, autoretry_for=(requests.RequestException,), retry_backoff=True, max_retries=3)
-def send_student_to_cd_mock(self, access_code, first_name, last_name, created_by_username):
-    url = "https://cd-mock-api.xmichael446.com/api/add_candidate/"
 
-    payload = {
-        "candidate_id": access_code,
-        "first_name": first_name,
-        "last_name": last_name,
-        "created_by": created_by_username,
-    }
+@shared_task
+def reconcile_all_courses_task():
+    course_ids = list(Course.objects.values_list("id", flat=True))
+    for course_id in course_ids:
+        reconcile_totals_for_course_task(course_id)
+    return f"Reconciled {len(course_ids)} courses"
+
+
+RANK_UPDATE_LOCK_TIMEOUT = getattr(settings, "CELERY_TASK_TIME_LIMIT", 300)
+
+
+def _rank_update_debounce():
+    # Read per call so override_settings and runtime changes apply.
+    return getattr(settings, "RANK_UPDATE_DEBOUNCE", 2)
+
+
+def _rank_key(kind, course_id):
+    return f"ranks:{kind}:{course_id}"
+
+
+def _incr_counter(key, delta=1):
+    if cache.add(key, delta, timeout=None):
+        return delta
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, delta, timeout=None)
+        return delta
+
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+_lock_redis = None
+
+
+def _lock_client():
+    """A redis client on the default cache's server, or None when that cache is not Redis.
+
+    Locks are plain strings set and compared on the server directly, under
+    the key the cache would use, so the compare-and-delete needs no access
+    to the cache backend's internals.
+    """
+    global _lock_redis
+    if not isinstance(caches[DEFAULT_CACHE_ALIAS], RedisCache):
+        return None
+    if _lock_redis is None:
+        import redis
+
+        location = settings.CACHES[DEFAULT_CACHE_ALIAS]["LOCATION"]
+        if isinstance(location, str):
+            location = location.split(",")
+        # RedisCache writes to its first server.
+        _lock_redis = redis.Redis.from_url(location[0], decode_responses=True)
+    return _lock_redis
+
+
+@receiver(setting_changed)
+def _reset_lock_client(setting, **kwargs):
+    global _lock_redis
+    if setting == "CACHES":
+        _lock_redis = None
+
+
+def _acquire_lock(key, timeout):
+    """Take ``key`` as a lock; returns this holder's token, or None when it is taken."""
+    token = uuid.uuid4().hex
+    client = _lock_client()
+    if client is None:
+        return token if cache.add(key, token, timeout=timeout) else None
+    return token if client.set(cache.make_and_validate_key(key), token, nx=True, ex=timeout) else None
+
+
+def _release_lock(key, token):
+    """Delete the lock ``key`` only while it still holds ``token``.
+
+    A lock that expired mid-run may already belong to another worker, and an
+    unconditional delete would let a third one in next to it. On Redis the
+    check and the delete run as one script; other backends fall back to
+    get-then-delete.
+    """
+    client = _lock_client()
+    if client is None:
+        if cache.get(key) == token:
+            return cache.delete(key)
+        return False
+    return bool(client.eval(_RELEASE_LOCK_SCRIPT, 1, cache.make_and_validate_key(key), token))
+
+
+def _lock_held(key):
+    client = _lock_client()
+    if client is None:
+        return cache.get(key) is not None
+    return bool(client.exists(cache.make_and_validate_key(key)))
+
+
+def _pop_counter(key):
+    """Take the counter's current value, leaving anything added meanwhile."""
+    value = cache.get(key) or 0
+    if not value:
+        return 0
+    try:
+        remaining = cache.decr(key, value)
+    except ValueError:
+        return value
+    if remaining < 0:
+        # A concurrent pop took part of what we read; give back the overlap.
+        cache.incr(key, -remaining)
+        value += remaining
+    return value
+
 
-    headers = {
-        "Content-Type": "application/json",
-        "X-API-KEY": "QODIRALI_ABDUSAMATOV",
+def schedule_rank_update(course_id, reconcile=False):
+    """Mark a course dirty and make sure exactly one coalesced recompute is queued.
+
+    The first request in a debounce window enqueues the task; every other
+    request that arrives before it starts only bumps the coalesced counter.
+    Returns True when a task was enqueued.
+    """
+    if reconcile:
+        cache.set(_rank_key("reconcile", course_id), 1, timeout=None)
+
+    debounce = _rank_update_debounce()
+    pending_timeout = debounce + RANK_UPDATE_LOCK_TIMEOUT
+    if cache.add(_rank_key("pending", course_id), 1, timeout=pending_timeout):
+        run_coalesced_rank_update_task.apply_async((course_id,), countdown=debounce)
+        return True
+
+    _incr_counter(_rank_key("coalesced", course_id))
+    _incr_counter("ranks:coalesced:total")
+    return False
+
+
+def get_rank_update_stats(course_id=None):
+    stats = {
+        "coalesced_total": cache.get("ranks:coalesced:total") or 0,
+        "runs_total": cache.get("ranks:runs:total") or 0,
     }
+    if course_id is not None:
+        stats.update({
+            "pending": bool(cache.get(_rank_key("pending", course_id))),
+            "running": _lock_held(_rank_key("lock", course_id)),
+            "coalesced_waiting": cache.get(_rank_key("coalesced", course_id)) or 0,
+        })
+    return stats
+
+
+@shared_task(bind=True, max_retries=None, **FIRE_AND_FORGET)
+def run_coalesced_rank_update_task(self, course_id):
+    lock_key = _rank_key("lock", course_id)
+    token = _acquire_lock(lock_key, RANK_UPDATE_LOCK_TIMEOUT)
+    if token is None:
+        # Another worker is recomputing this course; our pending flag is still
+        # set, so anything arriving meanwhile keeps folding into this run.
+        raise self.retry(countdown=_rank_update_debounce())
+
+    try:
+        # Clear the dirty flag before reading so writes landing mid-run
+        # schedule a fresh recompute instead of being lost.
+        cache.delete(_rank_key("pending", course_id))
+        reconcile = bool(cache.get(_rank_key("reconcile", course_id)))
+        if reconcile:
+            cache.delete(_rank_key("reconcile", course_id))
+        coalesced = _pop_counter(_rank_key("coalesced", course_id))
+
+        if reconcile or not getattr(settings, "INCREMENTAL_TOTALS", True):
+            result = reconcile_totals_for_course_task(course_id)
+        else:
+            result = update_ranks_for_course_task(course_id)
+    finally:
+        _release_lock(lock_key, token)
+
+    if getattr(settings, "DASHBOARD_PRERENDER", False):
+        prerender_course_leaderboards(course_id)
+
+    _incr_counter("ranks:runs:total")
+    return f"{result} (coalesced {coalesced} requests)"
+
+
+@shared_task(**FIRE_AND_FORGET)
+def persist_leaderboards_task():
+    """Copy live sorted-set ranks into ``Enrollment`` (no-op when disabled)."""
+    leaderboard = get_leaderboard()
+    if leaderboard is None:
+        return "Leaderboard engine disabled"
+
+    course_ids = list(
+        Enrollment.objects.filter(is_active=True).values_list("group__course_id", flat=True).distinct()
+    )
+    updated = 0
+    for course_id in course_ids:
+        changed = leaderboard.persist(course_id)
+        if changed:
+            bump_course_version(course_id)
+        updated += changed
+    return f"Persisted {updated} enrollments across {len(course_ids)} courses"
+
+
+OUTBOX_RELAY_DEBOUNCE = getattr(settings, "OUTBOX_RELAY_DEBOUNCE", 1)
+OUTBOX_RELAY_LOCK_TIMEOUT = getattr(settings, "CELERY_TASK_TIME_LIMIT", 300)
+OUTBOX_RELAY_MAX_BATCHES = 20
+
+
+def publish(topic, payload, idempotency_key):
+    """Record an external side effect in the current transaction and relay it after commit."""
+    publish_many(topic, [(payload, idempotency_key)])
+
+
+def publish_many(topic, messages):
+    """``publish`` for a batch of ``(payload, idempotency_key)`` pairs: one insert pass, one relay kick."""
+    enqueue_many(topic, messages)
+    transaction.on_commit(schedule_outbox_relay)
 
+
+def schedule_outbox_relay():
+    """Queue one debounced relay run; returns True when a task was enqueued."""
+    pending_timeout = OUTBOX_RELAY_DEBOUNCE + OUTBOX_RELAY_LOCK_TIMEOUT
+    if cache.add("outbox:pending", 1, timeout=pending_timeout):
+        relay_outbox_task.apply_async(countdown=OUTBOX_RELAY_DEBOUNCE)
+        return True
+    return False
+
+
+@shared_task(bind=True, max_retries=None, **FIRE_AND_FORGET)
+def relay_outbox_task(self):
+    """Drain due outbox messages; also run by beat to pick up retries."""
+    token = _acquire_lock("outbox:lock", OUTBOX_RELAY_LOCK_TIMEOUT)
+    if token is None:
+        raise self.retry(countdown=OUTBOX_RELAY_DEBOUNCE)
+
+    totals = [0, 0, 0]
     try:
-        res = requests.post(url, json=payload, headers=headers, timeout=5)
-        res.raise_for_status()
-        return {"status": "success", "response": res.text}
-    except requests.RequestException as e:
-        return {"status": "error", "error": str(e)}
+        # Clear the flag first so messages committed mid-run queue a new run.
+        cache.delete("outbox:pending")
+        for _ in range(OUTBOX_RELAY_MAX_BATCHES):
+            counts = relay_due_messages()
+            totals = [total + count for total, count in zip(totals, counts)]
+            if not any(counts):
+                break
+        else:
+            schedule_outbox_relay()
+    finally:
+        _release_lock("outbox:lock", token)
+
+    return "Sent {}, retrying {}, dead-lettered {} outbox messages".format(*totals)
+
+
+@shared_task(bind=True, autoretry_for=(requests.RequestException,), retry_backoff=True, max_retries=3)
+def send_student_to_cd_mock(self, access_code, first_name, last_name, created_by_username):
+    # Kept so messages queued before the outbox still drain. Errors propagate
+    # so autoretry_for applies and exhausted retries show up as failures.
+    res = get_client().send(Candidate(access_code, first_name, last_name, created_by_username))
+    return {"status": "success", "response": res.text}
+
+
+CELERY_RESULT_RETENTION_DAYS = getattr(settings, "CELERY_RESULT_RETENTION_DAYS", 7)
+OUTBOX_RETENTION_DAYS = getattr(settings, "OUTBOX_RETENTION_DAYS", 7)
+RESULT_PRUNE_BATCH_SIZE = 1000
+
+
+@task_postrun.connect
+def count_skipped_result_writes(sender=None, **kwargs):
+    """Count the result-backend writes a fire-and-forget run did not make."""
+    if sender is None or not sender.name.startswith("main.") or not sender.ignore_result:
+        return
+    _incr_counter("celery:results:skipped_writes", 1 + bool(sender.app.conf.task_track_started))
+
+
+def _delete_in_batches(queryset):
+    # Short delete transactions so request writes are not queued behind one
+    # long lock on the SQLite file.
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list("id", flat=True)[:RESULT_PRUNE_BATCH_SIZE])
+        if not ids:
+            return deleted
+        deleted += queryset.model.objects.filter(id__in=ids).delete()[0]
+
+
+@shared_task
+def prune_results_task(retention_days=None):
+    """Delete stored task results and delivered outbox messages past their retention."""
+    retention_days = CELERY_RESULT_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = timezone.now() - timedelta(days=retention_days)
+
+    results = _delete_in_batches(TaskResult.objects.filter(date_done__lt=cutoff))
+    messages = prune_sent(timedelta(days=OUTBOX_RETENTION_DAYS))
+    if results:
+        _incr_counter("celery:results:pruned", results)
+    if messages:
+        _incr_counter("outbox:pruned", messages)
+    return f"Pruned {results} task results and {messages} delivered outbox messages"
+
+
+def get_result_write_stats():
+    return {
+        "skipped_writes": cache.get("celery:results:skipped_writes") or 0,
+        "pruned_results": cache.get("celery:results:pruned") or 0,
+        "pruned_outbox_messages": cache.get("outbox:pruned") or 0,
+        "stored_results": TaskResult.objects.count(),
+    }
@@ -0,0 +1,103 @@
+"""Which YouTrack instance a staff user belongs to, and in what role.
+
+The admin scopes almost every queryset and dropdown by the user's
+instance: its admin, its coordinators and its point reasons. That is
+resolved once per user and cached under a global membership version, which
+any YTInstance save, delete or membership change bumps, and memoized on the
+request so a change form with nested inlines resolves it once.
+"""
+import time
+from typing import NamedTuple
+
+from django.core.cache import cache
+
+from .models import YTInstance
+
+TENANT_CACHE_TIMEOUT = 10 * 60
+_VERSION_KEY = "tenant:version"
+
+SUPERUSER = "superuser"
+ADMIN = "admin"
+COORDINATOR = "coordinator"
+NONE = "none"
+
+
+class TenantContext(NamedTuple):
+    user_id: int
+    role: str
+    instance_id: int = None
+    admin_id: int = None
+    coordinator_ids: frozenset = frozenset()
+    point_reason_ids: frozenset = frozenset()
+
+    @property
+    def is_superuser(self):
+        return self.role == SUPERUSER
+
+    @property
+    def is_admin(self):
+        return self.role == ADMIN
+
+    @property
+    def is_coordinator(self):
+        return self.role == COORDINATOR
+
+    @property
+    def has_instance(self):
+        return self.instance_id is not None
+
+
+def _get_version():
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        cache.add(_VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(_VERSION_KEY)
+    return version
+
+
+def invalidate_tenant_contexts():
+    """Drop every cached tenant context; membership changes are rare enough not to track per user."""
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        _get_version()
+
+
+def _build(user):
+    role = ADMIN
+    instance = YTInstance.objects.filter(admin=user).values("id", "admin_id").first()
+    if instance is None:
+        role = COORDINATOR
+        instance = YTInstance.objects.filter(coordinators=user).order_by("id").values("id", "admin_id").first()
+    if instance is None:
+        return TenantContext(user.pk, NONE)
+
+    members = YTInstance.coordinators.through.objects.filter(ytinstance_id=instance["id"])
+    reasons = YTInstance.point_reasons.through.objects.filter(ytinstance_id=instance["id"])
+    return TenantContext(
+        user.pk, role, instance["id"], instance["admin_id"],
+        frozenset(members.values_list("user_id", flat=True)),
+        frozenset(reasons.values_list("pointreason_id", flat=True)),
+    )
+
+
+def resolve_tenant_context(user):
+    if user.is_superuser:
+        return TenantContext(user.pk, SUPERUSER)
+
+    key = f"tenant:user:{user.pk}:v{_get_version()}"
+    context = cache.get(key)
+    if context is None:
+        context = _build(user)
+        cache.set(key, tuple(context), TENANT_CACHE_TIMEOUT)
+    else:
+        context = TenantContext(*context)
+    return context
+
+
+def get_tenant_context(request):
+    """The requesting user's tenant context, resolved at most once per request."""
+    context = getattr(request, "_tenant_context", None)
+    if context is None or context.user_id != request.user.pk:
+        context = request._tenant_context = resolve_tenant_context(request.user)
+    return context
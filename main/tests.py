@@ -1,3 +1,1586 @@
-from django.test import TestCase
+import base64
+import json
+import re
+import tempfile
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.contrib import admin
+from django.contrib.auth.models import Permission
+from django.core import signing
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DEFAULT_DB_ALIAS, OperationalError, close_old_connections, connection, connections, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django_celery_results.models import TaskResult
+from rest_framework.renderers import JSONRenderer
+
+from YouTrack.celery import app as celery_app
+from .authentication import STUDENT_TOKEN_SALT, StudentContext, TTLCache, access_code_cache, \
+    forget_token_version, issue_student_token, resolve_enrollment, revoke_student_tokens
+from .caching import build_group_leaderboard, build_course_leaderboard, get_course_leaderboard, \
+    get_course_version, get_group_leaderboard
+from .codes import code_width
+from .leaderboard import SCORE_SCALE, get_leaderboard, reset_leaderboard
+from .cd_sync import Candidate
+from .outbox import backlog_stats, relay_due_messages, requeue
+from .pagination import ACTIVITY_PAGE_SIZE_MAX
+from .profiling import profile_file
+from .models import Course, Group, Student, Enrollment, PointReason, PointEntry, ActivityEntry, Reward, \
+    RewardRedemption, OutboxMessage, YTInstance, RequestProfile, DailyEnrollmentStat
+from .rollups import rebuild_daily_stats
+from .ranking import rank_course_python, rank_course_sql, sql_rank_engine_supported
+from .renderers import FastJSONRenderer
+from .services import award_points
+from .seeding import SeedConfig, dataset_context, seed_dataset
+from .management.commands.bench_api import Command as BenchCommand
+from .serializers import EnrollmentSerializer, ActivitySerializer, ACTIVITY_ROW_FIELDS, activity_rows
+from .student_import import import_student_file
+from .tenancy import resolve_tenant_context
+from .tasks import recompute_totals_for_course, update_ranks_for_course_task, reconcile_all_courses_task, \
+    reconcile_totals_for_course_task, prune_results_task, get_result_write_stats, run_coalesced_rank_update_task, \
+    schedule_rank_update, get_rank_update_stats, _pop_counter
+
+User = get_user_model()
+
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class YouTrackTestMixin:
+    """Runs Celery tasks inline, keeps caches process-local and never relays the outbox on its own."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        cls._cd_mock_patcher = mock.patch("main.tasks.schedule_outbox_relay")
+        cls.schedule_outbox_relay = cls._cd_mock_patcher.start()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._cd_mock_patcher.stop()
+        celery_app.conf.task_always_eager = cls._always_eager
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        access_code_cache.clear()
+
+    @classmethod
+    def create_course(cls, groups=2, students_per_group=5, name="Course"):
+        user = User.objects.create_user(username=f"owner-{name}", is_staff=True)
+        course = Course.objects.create(name=name, created_by=user)
+        enrollments = []
+        for g in range(groups):
+            group = Group.objects.create(name=f"{name} G{g}", course=course, coordinator=user)
+            for s in range(students_per_group):
+                student = Student.objects.create(first_name=f"S{g}", last_name=str(s), created_by=user)
+                enrollments.append(Enrollment.objects.create(student=student, group=group))
+        return user, course, enrollments
+
+    def student_body(self, enrollment, **extra):
+        return {
+            "student_code": enrollment.student.access_code,
+            "group_code": enrollment.group.access_code,
+            **extra,
+        }
+
+
+@override_settings(CACHES=TEST_CACHES, RANK_UPDATE_DEBOUNCE=0)
+class YouTrackTestCase(YouTrackTestMixin, TestCase):
+    pass
+
+
+@override_settings(CACHES=TEST_CACHES, RANK_UPDATE_DEBOUNCE=0)
+class YouTrackTransactionTestCase(YouTrackTestMixin, TransactionTestCase):
+    pass
+
+
+class IncrementalTotalsTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=1, students_per_group=3)
+
+    def assertTotalsMatchHistory(self):
+        history = {
+            row["enrollment_id"]: (row["points"], row["coins"])
+            for row in ActivityEntry.objects.values("enrollment_id")
+            .annotate(points=Sum("points"), coins=Sum("coins_change")).order_by()
+        }
+        for enrollment in Enrollment.objects.filter(group__course=self.course):
+            with self.subTest(enrollment=enrollment.pk):
+                self.assertEqual((enrollment.total_points, enrollment.balance), history.get(enrollment.pk, (0, 0)))
+
+    def test_create_update_and_delete_keep_totals_exact(self):
+        first, second, _ = self.enrollments
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            entry = ActivityEntry.objects.create(enrollment=first, action="Homework", points=5, coins_change=2)
+            ActivityEntry.objects.create(enrollment=second, action="Bonus", points=3, coins_change=0)
+        # Creates shift the stored totals; nothing re-aggregates the history.
+        self.assertFalse([q for q in queries.captured_queries if "SUM(" in q["sql"].upper()])
+        self.assertTotalsMatchHistory()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            entry.points, entry.coins_change = 9, -1
+            entry.save()
+        self.assertTotalsMatchHistory()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            entry.delete()
+        self.assertTotalsMatchHistory()
+
+    def test_reconcile_repairs_drifted_totals(self):
+        ActivityEntry.objects.create(enrollment=self.enrollments[0], action="Homework", points=5, coins_change=2)
+        Enrollment.objects.filter(group__course=self.course).update(total_points=999, balance=-7)
+
+        reconcile_totals_for_course_task(self.course.id)
+        self.assertTotalsMatchHistory()
+
+    def test_inactive_enrollments_keep_their_totals(self):
+        inactive = self.enrollments[2]
+        Enrollment.objects.filter(pk=inactive.pk).update(is_active=False, total_points=7, balance=3)
+        reason = PointReason.objects.create(name="Homework", default_points=5, default_coins=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            entry = ActivityEntry.objects.create(enrollment=inactive, action="Bonus", points=4, coins_change=1)
+            award_points(reason, date(2025, 1, 1), [inactive, self.enrollments[0]])
+            entry.delete()
+
+        inactive.refresh_from_db()
+        self.assertEqual((inactive.total_points, inactive.balance), (7, 3))
+        self.enrollments[0].refresh_from_db()
+        self.assertEqual((self.enrollments[0].total_points, self.enrollments[0].balance), (5, 2))
+
+    def test_moving_an_activity_reconciles_both_courses(self):
+        _, other_course, (other,) = self.create_course(groups=1, students_per_group=1, name="Other")
+        with self.captureOnCommitCallbacks(execute=True):
+            entry = ActivityEntry.objects.create(enrollment=self.enrollments[0], action="Bonus", points=5,
+                                                 coins_change=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            entry.enrollment = other
+            entry.save()
+
+        self.assertTotalsMatchHistory()
+        other.refresh_from_db()
+        self.assertEqual((other.total_points, other.balance), (5, 2))
+
+
+class CoalescedRankUpdateTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=1, students_per_group=2)
+
+    def test_requests_fold_into_one_debounced_run(self):
+        ActivityEntry.objects.create(enrollment=self.enrollments[0], action="Homework", points=5, coins_change=1)
+        Enrollment.objects.filter(pk=self.enrollments[0].pk).update(total_points=0)
+
+        with mock.patch.object(run_coalesced_rank_update_task, "apply_async") as apply_async:
+            self.assertTrue(schedule_rank_update(self.course.id))
+            self.assertFalse(schedule_rank_update(self.course.id))
+            self.assertFalse(schedule_rank_update(self.course.id, reconcile=True))
+        apply_async.assert_called_once_with((self.course.id,), countdown=0)
+        self.assertEqual(get_rank_update_stats(self.course.id), {
+            "coalesced_total": 2, "runs_total": 0, "pending": True, "running": False, "coalesced_waiting": 2,
+        })
+
+        result = run_coalesced_rank_update_task.apply(args=(self.course.id,)).get()
+        self.assertTrue(result.endswith("(coalesced 2 requests)"))
+        # One of the folded requests asked for a reconcile, so the run rebuilt the totals.
+        self.assertEqual(Enrollment.objects.get(pk=self.enrollments[0].pk).total_points, 5)
+        self.assertEqual(get_rank_update_stats(self.course.id), {
+            "coalesced_total": 2, "runs_total": 1, "pending": False, "running": False, "coalesced_waiting": 0,
+        })
+
+        # The run cleared the pending flag: the next write queues a fresh task.
+        with mock.patch.object(run_coalesced_rank_update_task, "apply_async") as apply_async:
+            self.assertTrue(schedule_rank_update(self.course.id))
+        apply_async.assert_called_once()
+
+    @override_settings(RANK_UPDATE_DEBOUNCE=7)
+    def test_debounce_is_read_when_scheduling(self):
+        with mock.patch.object(run_coalesced_rank_update_task, "apply_async") as apply_async:
+            schedule_rank_update(self.course.id)
+        apply_async.assert_called_once_with((self.course.id,), countdown=7)
+
+    def test_concurrent_pops_never_take_a_count_twice(self):
+        key = f"ranks:coalesced:{self.course.id}"
+        cache.set(key, 5)
+        self.assertEqual(_pop_counter(key), 5)
+        cache.incr(key, 2)
+        # A second worker read 5 before the first one's decrement landed.
+        with mock.patch.object(caches[DEFAULT_CACHE_ALIAS], "get", return_value=5):
+            self.assertEqual(_pop_counter(key), 2)
+        self.assertEqual(cache.get(key), 0)
+        self.assertEqual(_pop_counter(key), 0)
+
+    def test_run_never_releases_a_lock_it_no_longer_holds(self):
+        lock_key = f"ranks:lock:{self.course.id}"
+
+        def lock_expires_and_is_taken(course_id):
+            cache.set(lock_key, "other-worker")
+            return "ranked"
+
+        with mock.patch("main.tasks.update_ranks_for_course_task", side_effect=lock_expires_and_is_taken):
+            run_coalesced_rank_update_task.apply(args=(self.course.id,)).get()
+        self.assertEqual(cache.get(lock_key), "other-worker")
+
+
+class AwardPointsTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.course, cls.enrollments = cls.create_course(groups=2, students_per_group=3)
+        cls.group = cls.enrollments[0].group
+        cls.inactive = cls.enrollments[2]
+        Enrollment.objects.filter(pk=cls.inactive.pk).update(is_active=False)
+        cls.reason = PointReason.objects.create(name="Homework", default_points=5, default_coins=2)
+        cls.foreign_reason = PointReason.objects.create(name="Olympiad", default_points=50)
+        instance = YTInstance.objects.create(name="Campus", admin=cls.owner)
+        instance.point_reasons.add(cls.reason)
+        cls.owner.user_permissions.set(Permission.objects.filter(content_type__app_label="main"))
+        cls.outsider = User.objects.create_user(username="outsider", is_staff=True)
+        cls.outsider.user_permissions.add(Permission.objects.get(codename="add_pointentry"))
+        YTInstance.objects.create(name="Elsewhere", admin=cls.outsider).point_reasons.add(cls.reason)
+
+    def award(self, user, **data):
+        self.client.force_login(user)
+        return self.client.post(reverse("points-award"), data, content_type="application/json")
+
+    def points(self):
+        return dict(Enrollment.objects.filter(group__course=self.course).values_list("id", "total_points"))
+
+    def test_endpoint_awards_every_active_enrollment_of_a_group(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.award(self.owner, reason_id=self.reason.id, group_id=self.group.id,
+                                  for_date="2025-03-01")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["data"]["awarded"], 2)
+
+        awarded = {e.pk for e in self.enrollments[:2]}
+        self.assertEqual(self.points(), {e.pk: 5 if e.pk in awarded else 0 for e in self.enrollments})
+        self.assertEqual(
+            set(PointEntry.objects.filter(for_date=date(2025, 3, 1)).values_list("enrollment_id", flat=True)), awarded,
+        )
+        self.assertEqual(ActivityEntry.objects.filter(linked_point_entry__isnull=False, coins_change=2).count(), 2)
+
+    def test_endpoint_is_scoped_to_the_callers_enrollments_and_reasons(self):
+        student = User.objects.create_user(username="not-staff")
+        self.assertEqual(self.award(student, reason_id=self.reason.id, group_id=self.group.id).status_code, 403)
+
+        # The outsider may use the reason but owns none of these enrollments.
+        response = self.award(self.outsider, reason_id=self.reason.id, group_id=self.group.id)
+        self.assertEqual((response.status_code, response.json()["success"]), (404, False))
+        # The owner's instance does not offer this reason.
+        response = self.award(self.owner, reason_id=self.foreign_reason.id, group_id=self.group.id)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(set(self.points().values()), {0})
+        self.assertFalse(PointEntry.objects.exists())
+
+    def test_awarding_needs_the_add_pointentry_permission(self):
+        viewer = User.objects.create_user(username="viewer", is_staff=True)
+        viewer.user_permissions.set(Permission.objects.filter(
+            content_type__app_label="main", codename__in=["view_group", "view_enrollment", "view_pointentry"],
+        ))
+        Group.objects.filter(pk=self.group.pk).update(coordinator=viewer)
+
+        self.assertEqual(self.award(viewer, reason_id=self.reason.id, group_id=self.group.id).status_code, 403)
+
+        for model in ("group", "enrollment"):
+            with self.subTest(model=model):
+                url = reverse(f"admin:main_{model}_changelist")
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                action_form = response.context["action_form"]
+                offered = [name for name, _ in action_form.fields["action"].choices] if action_form else []
+                self.assertNotIn("award_points_action", offered)
+                selected = self.group.pk if model == "group" else self.enrollments[0].pk
+                self.client.post(url, {"action": "award_points_action", "_selected_action": [selected],
+                                       "apply": "1", "reason": self.reason.pk, "for_date": "2025-03-01"})
+        self.assertFalse(PointEntry.objects.exists())
+
+    def test_admin_action_asks_for_a_reason_then_awards(self):
+        self.client.force_login(self.owner)
+        url = reverse("admin:main_group_changelist")
+        selection = {"action": "award_points_action", "_selected_action": [self.group.pk]}
+
+        form_page = self.client.post(url, selection)
+        self.assertEqual(form_page.status_code, 200)
+        self.assertEqual(list(form_page.context["form"].fields["reason"].queryset), [self.reason])
+        self.assertEqual(form_page.context["enrollment_count"], 2)
+
+        rejected = self.client.post(url, {**selection, "apply": "1", "reason": self.foreign_reason.pk,
+                                          "for_date": "2025-03-01"})
+        self.assertIn("reason", rejected.context["form"].errors)
+        self.assertFalse(PointEntry.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {**selection, "apply": "1", "reason": self.reason.pk,
+                                              "for_date": "2025-03-01"})
+        self.assertRedirects(response, url)
+        self.assertEqual(PointEntry.objects.count(), 2)
+        self.assertEqual(sum(self.points().values()), 10)
+
+
+class DashboardCacheTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=2, students_per_group=2)
+        cls.group = cls.enrollments[0].group
+
+    def leaderboards(self):
+        return get_group_leaderboard(self.group), get_course_leaderboard(self.course.id)
+
+    def award(self, enrollment, points):
+        with self.captureOnCommitCallbacks(execute=True):
+            ActivityEntry.objects.create(enrollment=enrollment, action="Bonus", points=points, coins_change=0)
+
+    @override_settings(DASHBOARD_PRERENDER=False)
+    def test_writes_invalidate_group_and_course_leaderboards(self):
+        before = self.leaderboards()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.leaderboards(), before)
+
+        version = get_course_version(self.course.id)
+        self.award(self.enrollments[1], 7)
+        self.assertGreater(get_course_version(self.course.id), version)
+
+        group_rows, course_rows = self.leaderboards()
+        self.assertNotEqual((group_rows, course_rows), before)
+        self.assertEqual(group_rows, build_group_leaderboard(self.group.id))
+        self.assertEqual(course_rows, build_course_leaderboard(self.course.id))
+        self.assertEqual((course_rows[0]["total_points"], course_rows[0]["rank"]), (7, 1))
+
+    @override_settings(DASHBOARD_PRERENDER=True)
+    def test_rank_task_prerenders_the_new_version(self):
+        self.leaderboards()
+        self.award(self.enrollments[3], 4)
+
+        # The rank run already cached every group and the course top list
+        # under the bumped version, so the next dashboard reads nothing.
+        with self.assertNumQueries(0):
+            group_rows, course_rows = self.leaderboards()
+            other_group = get_group_leaderboard(self.enrollments[3].group)
+        self.assertEqual(group_rows, build_group_leaderboard(self.group.id))
+        self.assertEqual(course_rows, build_course_leaderboard(self.course.id))
+        self.assertEqual(other_group[0]["total_points"], 4)
+
+
+@override_settings(LEADERBOARD_BACKEND="main.leaderboard.InMemoryLeaderboardBackend")
+class LeaderboardEngineTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=1, students_per_group=4)
+
+    def setUp(self):
+        super().setUp()
+        reset_leaderboard()
+        self.board = get_leaderboard()
+
+    def add_points(self, enrollment, points):
+        with self.captureOnCommitCallbacks(execute=True):
+            ActivityEntry.objects.create(enrollment=enrollment, action="Bonus", points=points, coins_change=0)
+
+    def standings(self):
+        return [(row["enrollment_id"], row["total_points"], row["rank"]) for row in self.board.top(self.course.id)]
+
+    def test_ties_break_by_enrollment_id(self):
+        e0, e1, e2, e3 = (e.pk for e in self.enrollments)
+        self.assertEqual(self.standings(), [(e0, 0, 1), (e1, 0, 2), (e2, 0, 3), (e3, 0, 4)])
+
+        self.add_points(self.enrollments[2], 5)
+        self.add_points(self.enrollments[1], 5)
+        self.assertEqual(self.standings(), [(e1, 5, 1), (e2, 5, 2), (e0, 0, 3), (e3, 0, 4)])
+        self.assertEqual(self.board.rank(self.course.id, e2), 2)
+        self.assertEqual([row["enrollment_id"] for row in self.board.around(self.course.id, e0, radius=1)],
+                         [e2, e0, e3])
+
+    def test_increments_follow_writes_and_match_a_rebuild(self):
+        self.board.top(self.course.id)
+        self.add_points(self.enrollments[3], 9)
+        self.add_points(self.enrollments[0], 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            ActivityEntry.objects.filter(enrollment=self.enrollments[0]).get().delete()
+
+        db = list(
+            Enrollment.objects.filter(group__course=self.course, is_active=True)
+            .order_by("rank").values_list("id", "total_points", "rank")
+        )
+        self.assertEqual(self.standings(), db)
+
+        self.board.backend.delete(self.board.key(self.course.id))
+        self.assertEqual(self.standings(), db)
+
+        inactive = self.enrollments[3]
+        inactive.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            inactive.save()
+        self.assertNotIn(inactive.pk, [row[0] for row in self.standings()])
+        self.assertEqual(self.board.rebuild(self.course.id), 3)
+
+    def test_increment_never_creates_a_member(self):
+        key, (first, second) = self.board.key(self.course.id), self.enrollments[:2]
+        self.board.top(self.course.id)
+        self.board.remove(self.course.id, first.pk)
+        Enrollment.objects.filter(pk=first.pk).update(total_points=7)
+
+        self.board.increment(self.course.id, first.pk, 7)
+        self.board.increment(self.course.id, second.pk, 3)
+        self.assertEqual(self.board.positions(self.course.id, [first.pk, second.pk, 0]),
+                         {first.pk: (1, 7), second.pk: (2, 3)})
+        self.assertIsNone(self.board.backend.zadd(key, {"0": 1}, xx=True, incr=True))
+        self.assertIsNone(self.board.backend.zscore(key, "0"))
+
+    def test_dashboards_take_every_standing_from_the_engine(self):
+        other_group = Group.objects.create(name="Other", course=self.course, coordinator=self.user)
+        student = Student.objects.create(first_name="Top", last_name="Student", created_by=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            leader = Enrollment.objects.create(student=student, group=other_group)
+        self.add_points(leader, 20)
+        self.add_points(self.enrollments[3], 9)
+        self.add_points(self.enrollments[1], 4)
+        # Persisted ranks and totals lag behind the set.
+        Enrollment.objects.filter(group__course=self.course).update(rank=99, total_points=0)
+
+        names = {e.pk: f"{e.student.first_name} {e.student.last_name}" for e in self.enrollments}
+        names[leader.pk] = "Top Student"
+        order = [(leader.pk, 20), (self.enrollments[3].pk, 9), (self.enrollments[1].pk, 4),
+                 (self.enrollments[0].pk, 0), (self.enrollments[2].pk, 0)]
+        course = [(names[pk], points, rank) for rank, (pk, points) in enumerate(order, 1)]
+
+        def standings(rows):
+            return [(row["full_name"], row["total_points"], row["rank"]) for row in rows]
+
+        for url in ("/api/dashboard/", "/api/async/dashboard/"):
+            with self.subTest(url=url):
+                response = self.client.post(url, self.student_body(self.enrollments[0]),
+                                            content_type="application/json")
+                data = response.json()["data"]
+                self.assertEqual((data["enrollment"]["rank"], data["enrollment"]["total_points"]), (4, 0))
+                self.assertEqual(standings(data["group"]["enrollments"]), course[1:])
+                self.assertEqual(standings(data["course"]["enrollments"]), course)
+                self.assertEqual(standings(data["course"]["around"]), course[1:])
+
+    def test_persist_copies_ranks_but_never_totals(self):
+        self.board.top(self.course.id)
+        last = self.enrollments[3]
+        # A lost decrement leaves the set ahead of the database.
+        self.board.backend.zincrby(self.board.key(self.course.id), 100 * SCORE_SCALE, str(last.pk))
+        Enrollment.objects.filter(group__course=self.course).update(rank=99)
+
+        self.assertEqual(self.board.persist(self.course.id), 4)
+        rows = Enrollment.objects.filter(group__course=self.course).order_by("id").values_list("total_points", "rank")
+        self.assertEqual(list(rows), [(0, 1), (0, 2), (0, 3), (0, 4)])
+        # The drifted set was rebuilt from the rows rather than trusted.
+        self.assertEqual(self.board.rank(self.course.id, last.pk), 4)
+        self.assertEqual(self.board.persist(self.course.id), 0)
+
+
+class RankEngineTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=2, students_per_group=5)
+        _, cls.other_course, cls.other_enrollments = cls.create_course(groups=1, students_per_group=3, name="Other")
+        for enrollment, points in zip(cls.enrollments, (10, 30, 10, 0, 30, 10, 5, 30, 0, 20)):
+            Enrollment.objects.filter(pk=enrollment.pk).update(total_points=points, rank=0)
+        Enrollment.objects.filter(pk__in=[cls.enrollments[1].pk, cls.enrollments[5].pk]).update(
+            is_active=False, rank=77,
+        )
+
+    def ranks(self):
+        return dict(Enrollment.objects.values_list("id", "rank"))
+
+    def test_sql_engine_matches_python_with_ties_and_inactive_enrollments(self):
+        if not sql_rank_engine_supported():
+            self.skipTest("the database has no window functions")
+
+        python_changed = rank_course_python(self.course.id)
+        expected = self.ranks()
+        Enrollment.objects.filter(group__course=self.course, is_active=True).update(rank=0)
+
+        self.assertEqual(rank_course_sql(self.course.id), python_changed)
+        self.assertEqual(self.ranks(), expected)
+        self.assertEqual(rank_course_sql(self.course.id), 0)
+
+        active = Enrollment.objects.filter(group__course=self.course, is_active=True)
+        self.assertEqual(
+            list(active.order_by("rank").values_list("total_points", "rank")),
+            [(30, 1), (30, 2), (20, 3), (10, 4), (10, 5), (5, 6), (0, 7), (0, 8)],
+        )
+        # Ties go to the lower id; inactive rows and other courses are left alone.
+        tied = active.filter(total_points=30).order_by("id")
+        self.assertEqual(list(tied.values_list("rank", flat=True)), [1, 2])
+        self.assertEqual({expected[self.enrollments[1].pk], expected[self.enrollments[5].pk]}, {77})
+        self.assertEqual({expected[e.pk] for e in self.other_enrollments}, {0})
+
+
+class AccessCodeCacheTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=1, students_per_group=2)
+
+    def test_entries_expire_after_the_ttl(self):
+        ttl_cache = TTLCache(maxsize=10, ttl=5)
+        with mock.patch("main.authentication.time.monotonic", return_value=100.0) as monotonic:
+            ttl_cache.set("key", "value")
+            monotonic.return_value = 104.9
+            self.assertEqual(ttl_cache.get("key"), "value")
+            monotonic.return_value = 105.1
+            self.assertIsNone(ttl_cache.get("key"))
+            self.assertEqual(len(ttl_cache._data), 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        ttl_cache = TTLCache(maxsize=2, ttl=60)
+        ttl_cache.set("a", 1)
+        ttl_cache.set("b", 2)
+        ttl_cache.get("a")
+        ttl_cache.set("c", 3)
+        self.assertEqual((ttl_cache.get("a"), ttl_cache.get("b"), ttl_cache.get("c")), (1, None, 3))
+
+    def test_deactivated_and_deleted_enrollments_are_dropped(self):
+        kept, dropped = self.enrollments
+        codes = {e.pk: (e.student.access_code, e.group.access_code) for e in self.enrollments}
+        for enrollment in self.enrollments:
+            self.assertEqual(resolve_enrollment(*codes[enrollment.pk]).enrollment_id, enrollment.pk)
+        with self.assertNumQueries(0):
+            resolve_enrollment(*codes[kept.pk])
+
+        dropped.is_active = False
+        dropped.save()
+        self.assertIsNone(resolve_enrollment(*codes[dropped.pk]))
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_enrollment(*codes[kept.pk]).enrollment_id, kept.pk)
+
+        kept_codes = codes[kept.pk]
+        kept.delete()
+        self.assertIsNone(resolve_enrollment(*kept_codes))
+
+    def test_missing_codes_keep_each_endpoints_message(self):
+        messages = {
+            "dashboard/": "student_code and group_code are required",
+            "rewards": "Missing student_code or group_code",
+            "rewards/claim": "Missing required fields",
+            "activities": "Missing student_code or group_code",
+        }
+        for prefix in ("/api/", "/api/async/"):
+            for path, message in messages.items():
+                with self.subTest(path=prefix + path):
+                    response = self.client.post(prefix + path, {"reward_id": 1}, content_type="application/json")
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json(), {"success": False, "message": message})
+
+    def test_inactive_enrollments_are_refused(self):
+        # Unlike the old per-view lookups, every student endpoint now only serves active enrollments.
+        inactive = self.enrollments[1]
+        Enrollment.objects.filter(pk=inactive.pk).update(is_active=False)
+        reward = Reward.objects.create(name="R", cost=0, course=self.course)
+        body = self.student_body(inactive, reward_id=reward.id)
+        for prefix in ("/api/", "/api/async/"):
+            for path in ("rewards", "rewards/claim", "activities"):
+                with self.subTest(path=prefix + path):
+                    response = self.client.post(prefix + path, body, content_type="application/json")
+                    self.assertEqual(response.status_code, 404)
+                    self.assertEqual(response.json(), {"success": False, "message": "Enrollment not found"})
+        self.assertFalse(RewardRedemption.objects.exists())
+
+    def test_enrollment_deleted_after_authentication(self):
+        enrollment = self.enrollments[0]
+        context = StudentContext(enrollment.pk, enrollment.student_id, enrollment.group_id, self.course.pk)
+        enrollment.delete()
+        for prefix in ("/api/", "/api/async/"):
+            with self.subTest(prefix=prefix), \
+                    mock.patch("main.authentication.resolve_enrollment", return_value=context), \
+                    mock.patch("main.authentication.aresolve_enrollment", return_value=context):
+                response = self.client.post(prefix + "dashboard/", self.student_body(enrollment),
+                                            content_type="application/json")
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json(), {"success": False, "message": "Enrollment not found"})
+
+
+class StudentTokenTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=1, students_per_group=2)
+        cls.enrollment = cls.enrollments[0]
+
+    def login(self):
+        return self.client.post("/api/login/", self.student_body(self.enrollment), content_type="application/json")
+
+    def dashboard(self, token):
+        return self.client.post("/api/dashboard/", {}, content_type="application/json",
+                                HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_revoked_and_deactivated_tokens_are_rejected(self):
+        token = self.login().json()["token"]
+        self.assertEqual(self.dashboard(token).status_code, 200)
+
+        revoke_student_tokens([self.enrollment.pk])
+        self.assertEqual(self.dashboard(token).status_code, 401)
+
+        token = self.login().json()["token"]
+        self.assertEqual(self.dashboard(token).status_code, 200)
+        self.enrollment.is_active = False
+        self.enrollment.save()
+        self.assertEqual(self.dashboard(token).status_code, 401)
+
+    def test_stale_access_code_cache_never_yields_a_token(self):
+        self.assertEqual(self.login().status_code, 200)
+        # Another worker deactivates the enrollment: the shared token version
+        # is dropped, but this process' access-code cache still holds it.
+        Enrollment.objects.filter(pk=self.enrollment.pk).update(is_active=False)
+        forget_token_version(self.enrollment.pk)
+        self.assertIsNotNone(access_code_cache.get((self.enrollment.student.access_code,
+                                                    self.enrollment.group.access_code)))
+
+        response = self.login()
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("token", response.json())
+        self.assertIsNone(resolve_enrollment(self.enrollment.student.access_code, self.enrollment.group.access_code))
+
+        context = StudentContext(self.enrollment.pk, self.enrollment.student_id, self.enrollment.group_id,
+                                 self.course.pk)
+        with self.assertRaises(ValueError):
+            issue_student_token(context, None)
+        unversioned = signing.dumps([*context, None], salt=STUDENT_TOKEN_SALT, compress=True)
+        self.assertEqual(self.dashboard(unversioned).status_code, 401)
+
+    def test_async_views_apply_the_same_checks(self):
+        def alogin():
+            return self.client.post("/api/async/login/", self.student_body(self.enrollment),
+                                    content_type="application/json")
+
+        def adashboard(token):
+            return self.client.post("/api/async/dashboard/", {}, content_type="application/json",
+                                    HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        token = alogin().json()["token"]
+        self.assertEqual(adashboard(token).status_code, 200)
+        revoke_student_tokens([self.enrollment.pk])
+        self.assertEqual(adashboard(token).status_code, 401)
+
+        token = alogin().json()["token"]
+        Enrollment.objects.filter(pk=self.enrollment.pk).update(is_active=False)
+        forget_token_version(self.enrollment.pk)
+        self.assertEqual(adashboard(token).status_code, 401)
+        response = alogin()
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("token", response.json())
+
+        context = StudentContext(self.enrollment.pk, self.enrollment.student_id, self.enrollment.group_id,
+                                 self.course.pk)
+        unversioned = signing.dumps([*context, None], salt=STUDENT_TOKEN_SALT, compress=True)
+        self.assertEqual(adashboard(unversioned).status_code, 401)
+
+
+class ActivityPaginationTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=1, students_per_group=2)
+        cls.enrollment = cls.enrollments[0]
+        base = timezone.now().replace(microsecond=0)
+        # Three timestamps and three dates (one of them NULL) give rows tied
+        # on for_date, on (for_date, created_at), and on both across NULLs.
+        days = [date(2025, 3, 2), date(2025, 3, 1), None]
+        activities = [
+            ActivityEntry(enrollment=cls.enrollment, action=f"a{i}", points=1, for_date=days[i % 3])
+            for i in range(14)
+        ]
+        ActivityEntry.objects.bulk_create(activities)
+        for i, activity in enumerate(activities):
+            ActivityEntry.objects.filter(pk=activity.pk).update(created_at=base - timedelta(minutes=i % 2))
+        ActivityEntry.objects.create(enrollment=cls.enrollments[1], action="other", points=1)
+
+    def expected(self, for_date_from=None, for_date_to=None):
+        rows = list(ActivityEntry.objects.filter(enrollment=self.enrollment).values_list(
+            "action", "for_date", "created_at", "id"))
+        if for_date_from or for_date_to:
+            rows = [row for row in rows if row[1] and for_date_from <= row[1] <= for_date_to]
+        dated = sorted((row for row in rows if row[1]), key=lambda row: row[1:], reverse=True)
+        undated = sorted((row for row in rows if not row[1]), key=lambda row: row[2:], reverse=True)
+        ordered = undated + dated if connection.features.nulls_order_largest else dated + undated
+        return [row[0] for row in ordered]
+
+    def page(self, **extra):
+        response = self.client.post(reverse("activities"), self.student_body(self.enrollment, **extra),
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def walk(self, **extra):
+        actions, cursor = [], None
+        for _ in range(20):
+            body = self.page(**extra, **({"cursor": cursor} if cursor else {}))
+            self.assertLessEqual(len(body["data"]), extra["page_size"])
+            actions += [row["action"] for row in body["data"]]
+            cursor = body["next_cursor"]
+            if cursor is None:
+                return actions
+        self.fail(f"pagination did not end: {actions}")
+
+    def test_pages_return_every_activity_once_in_order(self):
+        expected = self.expected()
+        self.assertEqual(len(expected), 14)
+        # Two and four rows per page end pages on rows tied with the next
+        # one, and one of them straddles the NULL for_date boundary.
+        for page_size in (1, 2, 4, 14, 50):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.walk(page_size=page_size), expected)
+
+    def test_date_filters_keep_applying_with_a_cursor(self):
+        expected = self.expected(date(2025, 3, 1), date(2025, 3, 1))
+        self.assertEqual(len(expected), 5)
+        self.assertEqual(self.walk(page_size=2, date_from="2025-03-01", date_to="2025-03-01"), expected)
+
+    def test_page_size_is_capped(self):
+        ActivityEntry.objects.bulk_create(
+            ActivityEntry(enrollment=self.enrollment, action=f"b{i}", for_date=date(2025, 1, 1)) for i in range(100)
+        )
+        body = self.page(page_size=500)
+        self.assertEqual(len(body["data"]), ACTIVITY_PAGE_SIZE_MAX)
+        self.assertIsNotNone(body["next_cursor"])
+
+    def test_malformed_or_tampered_cursors_are_rejected(self):
+        def encoded(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+        cursors = ["not a cursor!", "bm9wZQ", encoded([1, 2]), encoded(["2025-13-01", "2025-01-01T00:00:00", 1]),
+                   encoded([None, None, 1]), encoded([None, "2025-01-01T00:00:00", [1]]), encoded({"a": 1})]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.post(reverse("activities"), self.student_body(self.enrollment, cursor=cursor),
+                                            content_type="application/json")
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"success": False, "message": "Invalid cursor"})
+
+
+class QueryPlanTests(YouTrackTestCase):
+    """Every hot view/task query must reach main_* tables through an index."""
+
+    FULL_SCAN = re.compile(r"\bSCAN (main_\w+)\b(?! USING)")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=3, students_per_group=10)
+        reason = PointReason.objects.create(name="Homework", default_points=5, default_coins=2)
+        for i, enrollment in enumerate(cls.enrollments):
+            PointEntry.objects.create(reason=reason, enrollment=enrollment, for_date=date(2025, 1, 1) + timedelta(i))
+        for i in range(3):
+            PointEntry.objects.create(reason=reason, enrollment=cls.enrollments[0], for_date=date(2025, 2, 1))
+        Reward.objects.create(name="Sticker", cost=1, course=cls.course)
+
+    def assertIndexedPlans(self, queries):
+        self.assertTrue(queries, "no queries captured")
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query["sql"]
+                if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                    continue
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan = "\n".join(row[-1] for row in cursor.fetchall())
+                self.assertIsNone(self.FULL_SCAN.search(plan), f"full table scan in:\n{sql}\n{plan}")
+
+    def capture(self, func, *args, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            func(*args, **kwargs)
+        return ctx.captured_queries
+
+    def test_student_views(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN is SQLite specific")
+
+        body = self.student_body(self.enrollments[4])
+        for url in ("/api/login/", "/api/dashboard/", "/api/rewards", "/api/activities"):
+            cache.clear()
+            access_code_cache.clear()
+            queries = self.capture(self.client.post, url, body, content_type="application/json")
+            with self.subTest(url=url):
+                self.assertIndexedPlans(queries)
+
+    def test_activity_pages(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN is SQLite specific")
+
+        body = self.student_body(self.enrollments[0], page_size=1, date_from="2024-12-01")
+        first = self.client.post("/api/activities", body, content_type="application/json").json()
+        queries = self.capture(
+            self.client.post, "/api/activities", {**body, "cursor": first["next_cursor"]},
+            content_type="application/json",
+        )
+        self.assertIndexedPlans(queries)
+
+    def test_rank_and_totals_tasks(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN is SQLite specific")
+
+        self.assertIndexedPlans(self.capture(recompute_totals_for_course, self.course.id))
+        self.assertIndexedPlans(self.capture(rank_course_sql, self.course.id))
+
+    def test_group_leaderboard_reads_ranks_from_index(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN is SQLite specific")
+
+        queryset = Enrollment.objects.filter(group=self.enrollments[0].group, is_active=True).order_by("rank")
+        plan = queryset.explain()
+        self.assertIn("enrollment_active_rank_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_point_entry_date_hierarchy(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN is SQLite specific")
+
+        queryset = PointEntry.objects.filter(for_date__gte=date(2025, 1, 3), for_date__lt=date(2025, 1, 5))
+        self.assertIn("pointentry_for_date_idx", queryset.explain())
+
+
+class RewardClaimTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=1, students_per_group=2)
+        cls.enrollment = cls.enrollments[0]
+        ActivityEntry.objects.create(enrollment=cls.enrollment, action="Bonus", points=0, coins_change=15)
+        cls.reward = Reward.objects.create(name="Pen", cost=10, course=cls.course)
+
+    def claim(self, reward):
+        return self.client.post(
+            "/api/rewards/claim", self.student_body(self.enrollment, reward_id=reward.id),
+            content_type="application/json",
+        )
+
+    def test_claim_charges_balance_once(self):
+        response = self.claim(self.reward)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"]["reward"]["id"], self.reward.id)
+
+        duplicate = self.claim(self.reward)
+        self.assertEqual(duplicate.json(), {"success": False, "message": "Reward already claimed"})
+
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.balance, 5)
+        self.assertEqual(ActivityEntry.objects.filter(enrollment=self.enrollment, coins_change=-10).count(), 1)
+
+    def test_claim_rejects_insufficient_balance(self):
+        expensive = Reward.objects.create(name="Book", cost=50, course=self.course)
+        response = self.claim(expensive)
+        self.assertEqual(response.json()["message"], "Reward costs 50 coins, you only have 15")
+        self.assertFalse(RewardRedemption.objects.exists())
+
+    def test_claim_query_count(self):
+        self.client.post("/api/login/", self.student_body(self.enrollment), content_type="application/json")
+        # reward lookup, conditional balance update, two inserts, rollup
+        # upsert; the savepoint pair stands in for BEGIN/COMMIT inside the
+        # test transaction.
+        with self.assertNumQueries(8):
+            self.claim(self.reward)
+
+
+class RewardClaimConcurrencyTests(YouTrackTransactionTestCase):
+    def test_parallel_claims_never_overspend(self):
+        _, course, enrollments = self.create_course(groups=1, students_per_group=1)
+        enrollment = enrollments[0]
+        ActivityEntry.objects.create(enrollment=enrollment, action="Bonus", points=0, coins_change=25)
+        rewards = [Reward.objects.create(name=f"R{i}", cost=10, course=course) for i in range(4)]
+        body = self.student_body(enrollment)
+
+        barrier = threading.Barrier(12)
+        statuses = []
+
+        def worker(reward):
+            barrier.wait()
+            try:
+                for _ in range(20):
+                    try:
+                        response = self.client_class().post(
+                            "/api/rewards/claim", {**body, "reward_id": reward.id},
+                            content_type="application/json",
+                        )
+                        statuses.append(response.json()["success"])
+                        return
+                    except OperationalError:
+                        # Lock timeouts are a capacity problem, not a
+                        # correctness one; retry like a client would.
+                        continue
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=worker, args=(rewards[i % len(rewards)],)) for i in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        enrollment.refresh_from_db()
+        redemptions = RewardRedemption.objects.filter(enrollment=enrollment)
+        self.assertEqual(redemptions.count(), 2)
+        self.assertEqual(statuses.count(True), 2)
+        self.assertEqual(enrollment.balance, 5)
+        self.assertEqual(
+            ActivityEntry.objects.filter(enrollment=enrollment, coins_change=-10).count(), 2
+        )
+
+
+class DailyRollupTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.course, cls.enrollments = cls.create_course(groups=2, students_per_group=2)
+        cls.first_group, cls.second_group = cls.enrollments[0].group, cls.enrollments[2].group
+        cls.day = date(2025, 3, 1)
+
+    def rollups(self):
+        # Removals leave emptied rows behind; a rebuild does not recreate them.
+        return sorted(DailyEnrollmentStat.objects.exclude(entries=0).values_list("enrollment_id", "for_date", "points", "coins", "entries"))
+
+    def rebuilt(self):
+        current = self.rollups()
+        rebuild_daily_stats()
+        rebuilt = self.rollups()
+        return current, rebuilt
+
+    def test_writes_keep_rollups_equal_to_a_rebuild(self):
+        first, second = self.enrollments[:2]
+        entry = ActivityEntry.objects.create(enrollment=first, action="Homework", points=5, coins_change=2,
+                                             for_date=self.day)
+        ActivityEntry.objects.create(enrollment=first, action="Bonus", points=1, coins_change=0, for_date=self.day)
+        ActivityEntry.objects.create(enrollment=second, action="Bonus", points=3, coins_change=1)
+        reason = PointReason.objects.create(name="Attendance", default_points=2, default_coins=1)
+        award_points(reason, self.day, [first, second])
+        self.assertEqual(self.rollups()[0], (first.pk, self.day, 8, 3, 3))
+
+        entry.points, entry.for_date = 10, self.day + timedelta(days=1)
+        entry.save()
+        ActivityEntry.objects.filter(enrollment=second, action="Bonus").get().delete()
+
+        current, rebuilt = self.rebuilt()
+        self.assertEqual(current, rebuilt)
+        self.assertIn((first.pk, self.day + timedelta(days=1), 10, 2, 1), rebuilt)
+
+    def test_rebuild_and_reconcile_repair_writes_that_skipped_the_signals(self):
+        first = self.enrollments[0]
+        ActivityEntry.objects.create(enrollment=first, action="Homework", points=5, coins_change=2, for_date=self.day)
+        ActivityEntry.objects.filter(enrollment=first).update(points=50)
+
+        reconcile_totals_for_course_task(self.course.id)
+        self.assertEqual(Enrollment.objects.get(pk=first.pk).total_points, 50)
+
+        current, rebuilt = self.rebuilt()
+        self.assertNotEqual(current, rebuilt)
+        self.assertEqual(rebuilt, [(first.pk, self.day, 50, 2, 1)])
+
+    def test_daily_analytics_endpoint(self):
+        for enrollment, points, day in ((self.enrollments[0], 5, self.day), (self.enrollments[1], 3, self.day),
+                                        (self.enrollments[2], 4, self.day + timedelta(days=2))):
+            ActivityEntry.objects.create(enrollment=enrollment, action="Bonus", points=points, coins_change=1,
+                                         for_date=day)
+        self.client.force_login(self.owner)
+        url = reverse("analytics-daily")
+
+        response = self.client.get(url, {"course": self.course.id, "date_from": "2025-02-20",
+                                         "date_to": "2025-03-10"})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]
+        self.assertEqual([(p["date"], p["points"], p["entries"]) for p in data["total"]],
+                         [("2025-03-01", 8, 2), ("2025-03-03", 4, 1)])
+        self.assertEqual({g["id"]: len(g["series"]) for g in data["groups"]},
+                         {self.first_group.id: 1, self.second_group.id: 1})
+
+        group_only = self.client.get(url, {"group": self.second_group.id, "date_from": "2025-03-01",
+                                           "date_to": "2025-03-02"}).json()["data"]
+        self.assertEqual((len(group_only["groups"]), group_only["total"]), (1, []))
+
+        # Without date_to the range ends today, so a distant date_from is still over the limit.
+        for params in ({"course": self.course.id, "date_from": "2000-01-01"},
+                       {"course": self.course.id, "date_from": "2025-03-02", "date_to": "2025-03-01"},
+                       {"date_from": "2025-03-01"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+        outsider = User.objects.create_user(username="outsider", is_staff=True)
+        self.client.force_login(outsider)
+        self.assertEqual(self.client.get(url, {"course": self.course.id}).status_code, 404)
+
+
+@skipUnless(connection.vendor == "sqlite" and getattr(settings, "SQLITE_PROFILE", None) == "concurrent",
+            "concurrent SQLite profile only")
+class SQLiteProfileTests(YouTrackTestCase):
+    def test_new_connections_use_the_concurrent_profile(self):
+        fresh = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            with fresh.cursor() as cursor:
+                pragmas = {}
+                for pragma in ("journal_mode", "busy_timeout", "synchronous"):
+                    cursor.execute(f"PRAGMA {pragma}")
+                    pragmas[pragma] = cursor.fetchone()[0]
+            self.assertEqual(pragmas, {
+                "journal_mode": "wal", "busy_timeout": settings.SQLITE_BUSY_TIMEOUT * 1000, "synchronous": 1,
+            })
+            self.assertEqual(fresh.transaction_mode, "IMMEDIATE")
+        finally:
+            fresh.close()
+
+
+class AsyncViewParityTests(YouTrackTestCase):
+    """The async student endpoints must answer byte-for-byte like the sync ones."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=2, students_per_group=3)
+        cls.enrollment = cls.enrollments[1]
+        reason = PointReason.objects.create(name="Homework", default_points=5, default_coins=2)
+        for i in range(4):
+            PointEntry.objects.create(reason=reason, enrollment=cls.enrollment, for_date=date(2025, 1, 1) + timedelta(i))
+        ActivityEntry.objects.create(enrollment=cls.enrollment, action="Bonus", points=0, coins_change=10)
+        cls.rewards = [Reward.objects.create(name=f"R{cost}", cost=cost, course=cls.course) for cost in (3, 50)]
+
+    def post_both(self, path, body, **extra):
+        sync = self.client.post(f"/api/{path}", body, content_type="application/json", **extra)
+        asynchronous = self.client.post(f"/api/async/{path}", body, content_type="application/json", **extra)
+        self.assertEqual(asynchronous.status_code, sync.status_code, path)
+        self.assertEqual(asynchronous["Content-Type"], sync["Content-Type"], path)
+        return sync, asynchronous
+
+    def assertSamePayload(self, path, body, **extra):
+        sync, asynchronous = self.post_both(path, body, **extra)
+        self.assertEqual(asynchronous.content, sync.content, path)
+        return sync
+
+    def test_login(self):
+        sync, asynchronous = self.post_both("login/", self.student_body(self.enrollment))
+        self.assertEqual(asynchronous.json().keys(), sync.json().keys())
+
+        token = asynchronous.json()["token"]
+        dashboard = self.client.post("/api/dashboard/", {}, content_type="application/json",
+                                     HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertTrue(dashboard.json()["success"])
+
+        for body in ({}, {"student_code": "nope", "group_code": "nope"},
+                     self.student_body(self.enrollment, group_code=self.enrollments[4].group.access_code)):
+            self.assertSamePayload("login/", body)
+
+    def test_read_endpoints(self):
+        token = self.client.post("/api/login/", self.student_body(self.enrollment),
+                                 content_type="application/json").json()["token"]
+        for auth in ({}, {"HTTP_AUTHORIZATION": f"Bearer {token}"}):
+            body = {} if auth else self.student_body(self.enrollment)
+            for path in ("dashboard/", "rewards", "activities"):
+                with self.subTest(path=path, token=bool(auth)):
+                    self.assertSamePayload(path, body, **auth)
+
+        first = self.assertSamePayload("activities", {**self.student_body(self.enrollment), "page_size": 2}).json()
+        self.assertSamePayload("activities", {**self.student_body(self.enrollment), "cursor": first["next_cursor"]})
+
+    def test_errors(self):
+        body = self.student_body(self.enrollment)
+        self.assertSamePayload("dashboard/", {})
+        self.assertSamePayload("dashboard/", {}, HTTP_AUTHORIZATION="Bearer forged")
+        self.assertSamePayload("dashboard/", {**body, "student_code": "nope"})
+        self.assertSamePayload("activities", {**body, "cursor": "!!"})
+        self.assertSamePayload("activities", {**body, "page_size": 0})
+        self.assertSamePayload("rewards/claim", body)
+        self.assertSamePayload("rewards/claim", {**body, "reward_id": 999999})
+        self.assertSamePayload("rewards/claim", {**body, "reward_id": self.rewards[1].id})
+
+    def test_claim(self):
+        body = self.student_body(self.enrollment, reward_id=self.rewards[0].id)
+        claimed = self.client.post("/api/async/rewards/claim", body, content_type="application/json").json()
+        self.assertEqual(claimed["data"]["reward"], {"id": self.rewards[0].id, "name": "R3", "cost": 3})
+
+        self.assertSamePayload("rewards/claim", body)
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.balance, 8 + 10 - 3)
+
+
+class FastSerializationTests(YouTrackTestCase):
+    """Value-row serialization plus orjson must produce exactly the old serializer + DRF renderer bytes."""
+
+    NAMES = ["Ali", "Zoë", "O'Brien \"Jr\"", "line\u2028sep", "emoji \U0001F680", "back\\slash", "tab\tnew\nline"]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, _ = cls.create_course(groups=0)
+        cls.group = Group.objects.create(name="G", course=cls.course)
+        for i, name in enumerate(cls.NAMES):
+            student = Student.objects.create(first_name=name, last_name=cls.NAMES[-i - 1], created_by=cls.user)
+            enrollment = Enrollment.objects.create(student=student, group=cls.group)
+            Enrollment.objects.filter(pk=enrollment.pk).update(rank=i + 1)
+            ActivityEntry.objects.create(enrollment=enrollment, action=name, points=i, coins_change=-i,
+                                         for_date=date(2025, 3, 1) if i % 2 else None)
+
+    def assertSameBytes(self, fast, slow):
+        self.assertEqual(FastJSONRenderer().render(fast), JSONRenderer().render(slow))
+
+    def test_leaderboards(self):
+        enrollments = Enrollment.objects.filter(group=self.group, is_active=True).select_related("student")
+        self.assertSameBytes(
+            build_group_leaderboard(self.group.id),
+            EnrollmentSerializer(enrollments.order_by("rank"), many=True).data,
+        )
+        self.assertSameBytes(
+            build_course_leaderboard(self.course.id),
+            EnrollmentSerializer(enrollments.order_by("rank")[:50], many=True).data,
+        )
+
+    def test_activities(self):
+        activities = ActivityEntry.objects.order_by("id")
+        self.assertSameBytes(
+            activity_rows(activities.values(*ACTIVITY_ROW_FIELDS)),
+            ActivitySerializer(activities, many=True).data,
+        )
+
+    def test_renderer_edge_cases(self):
+        payload = {"when": timezone.now(), "day": date(2025, 1, 1), "big": 2 ** 70, "none": None, 1: [True, 0.1]}
+        self.assertSameBytes(payload, payload)
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+
+    def test_renderer_float_differences(self):
+        floats = [0.1, 1e15, 1e16, 1.5e-7, 5e-324, 1.7976931348623157e308]
+        rendered = FastJSONRenderer().render(floats)
+        self.assertEqual(json.loads(rendered), floats)
+        self.assertEqual(rendered, JSONRenderer().render(floats).replace(b"e+", b"e").replace(b"e-0", b"e-"))
+
+        self.assertEqual(FastJSONRenderer().render([float("nan"), float("inf")]), b"[null,null]")
+        with self.assertRaises(ValueError):
+            JSONRenderer().render([float("nan")])
+
+
+class StubCDMockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.received.append((body, dict(self.headers), self.client_address))
+        status_code = 500 if body["candidate_id"] in server.reject else 201
+        self.send_response(status_code)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+class OutboxTests(YouTrackTestCase):
+    """Enrollments queue CD mock messages in their transaction; the relay delivers them to a stub server."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubCDMockHandler)
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.stub_settings = override_settings(
+            CD_MOCK_URL=f"http://127.0.0.1:{cls.server.server_port}/api/add_candidate/",
+            CD_MOCK_API_KEY="test-key", CD_MOCK_BATCH_SIZE=2, CD_MOCK_CONCURRENCY=2,
+            OUTBOX_MAX_ATTEMPTS=2, OUTBOX_RETRY_BACKOFF=30,
+        )
+        cls.stub_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub_settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=2, students_per_group=3)
+        # Joining a second group must not queue the student twice.
+        Enrollment.objects.create(student=cls.enrollments[0].student, group=cls.enrollments[3].group)
+        cls.access_codes = {enrollment.student.access_code for enrollment in cls.enrollments}
+
+    def setUp(self):
+        super().setUp()
+        self.server.received = []
+        self.server.reject = set()
+        self.schedule_outbox_relay.reset_mock()
+
+    def received_codes(self):
+        return sorted(body["candidate_id"] for body, _, _ in self.server.received)
+
+    def test_enrollment_queues_one_message_per_student_and_relays_on_commit(self):
+        self.assertEqual(OutboxMessage.objects.count(), len(self.access_codes))
+
+        student = Student.objects.create(first_name="New", last_name="Student", created_by=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.create(student=student, group=self.enrollments[0].group)
+        self.schedule_outbox_relay.assert_called_once_with()
+        self.assertTrue(OutboxMessage.objects.filter(idempotency_key=f"cd_mock:student:{student.access_code}").exists())
+
+    def test_candidate_is_read_in_one_query(self):
+        enrollment = self.enrollments[0]
+        with self.assertNumQueries(1):
+            candidate = Candidate.for_enrollment(enrollment.pk)
+        self.assertEqual(candidate, (enrollment.student.access_code, enrollment.student.first_name,
+                                     enrollment.student.last_name, self.user.username))
+
+        Student.objects.filter(pk=enrollment.student_id).update(cd_synced_at=timezone.now())
+        self.assertIsNone(Candidate.for_enrollment(enrollment.pk))
+
+    def test_rolled_back_enrollment_leaves_no_message(self):
+        student = Student.objects.create(first_name="Gone", last_name="Student", created_by=self.user)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Enrollment.objects.create(student=student, group=self.enrollments[0].group)
+                raise RuntimeError
+        self.assertEqual(OutboxMessage.objects.count(), len(self.access_codes))
+
+    def test_relay_sends_each_student_once_over_pooled_connections(self):
+        self.assertEqual(relay_due_messages(), (len(self.access_codes), 0, 0))
+
+        self.assertEqual(self.received_codes(), sorted(self.access_codes))
+        headers = [headers for _, headers, _ in self.server.received]
+        self.assertEqual({h["X-API-KEY"] for h in headers}, {"test-key"})
+        self.assertEqual({h["Idempotency-Key"] for h in headers},
+                         {f"cd_mock:student:{code}" for code in self.access_codes})
+        self.assertEqual(self.server.received[0][0]["created_by"], self.user.username)
+        # Six students in chunks of two, two chunks at a time, over kept-alive connections.
+        self.assertLessEqual(len({address for _, _, address in self.server.received}), 2)
+        self.assertFalse(Student.objects.filter(cd_synced_at__isnull=True).exists())
+
+        self.server.received = []
+        self.assertEqual(relay_due_messages(), (0, 0, 0))
+        self.assertEqual(self.server.received, [])
+
+    def test_failures_back_off_then_dead_letter(self):
+        rejected = self.enrollments[2].student
+        self.server.reject = {rejected.access_code}
+        message = OutboxMessage.objects.get(idempotency_key=f"cd_mock:student:{rejected.access_code}")
+
+        self.assertEqual(relay_due_messages(), (len(self.access_codes) - 1, 1, 0))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.PENDING, 1))
+        self.assertIn("500", message.last_error)
+        self.assertGreater(message.available_at, timezone.now() + timedelta(seconds=25))
+        self.assertEqual(relay_due_messages(), (0, 0, 0))
+
+        OutboxMessage.objects.filter(pk=message.pk).update(available_at=timezone.now())
+        with self.assertLogs("main.outbox", "ERROR"):
+            self.assertEqual(relay_due_messages(), (0, 0, 1))
+        self.assertEqual(backlog_stats()["dead"], 1)
+        self.assertIsNone(Student.objects.get(pk=rejected.pk).cd_synced_at)
+
+        self.server.reject = set()
+        requeue(OutboxMessage.objects.filter(pk=message.pk))
+        self.assertEqual(relay_due_messages(), (1, 0, 0))
+        self.assertIsNotNone(Student.objects.get(pk=rejected.pk).cd_synced_at)
+
+    def test_admin_shows_backlog(self):
+        admin = User.objects.create_superuser(username="root", password="pw")
+        self.client.force_login(admin)
+        response = self.client.get("/admin/main/outboxmessage/")
+        self.assertContains(response, f"{len(self.access_codes)} pending")
+
+
+class ResultRetentionTests(YouTrackTestCase):
+    def test_fire_and_forget_tasks_skip_the_result_backend(self):
+        self.assertTrue(update_ranks_for_course_task.ignore_result)
+        self.assertFalse(update_ranks_for_course_task.track_started)
+        self.assertFalse(reconcile_all_courses_task.ignore_result)
+
+        _, course, _ = self.create_course(groups=1, students_per_group=2)
+        update_ranks_for_course_task.delay(course.id)
+        update_ranks_for_course_task.delay(course.id)
+        # STARTED insert + SUCCESS update per run with CELERY_TASK_TRACK_STARTED.
+        self.assertEqual(get_result_write_stats()["skipped_writes"], 4)
+
+    def test_prune_keeps_recent_results(self):
+        for i, age in enumerate((1, 10, 30)):
+            TaskResult.objects.create(task_id=f"t{i}", status="SUCCESS")
+            TaskResult.objects.filter(task_id=f"t{i}").update(date_done=timezone.now() - timedelta(days=age))
+        sent = OutboxMessage.objects.create(topic="x", idempotency_key="old", status=OutboxMessage.SENT,
+                                            sent_at=timezone.now() - timedelta(days=30))
+        pending = OutboxMessage.objects.create(topic="x", idempotency_key="pending")
+
+        self.assertEqual(prune_results_task(retention_days=7),
+                         "Pruned 2 task results and 1 delivered outbox messages")
+        self.assertEqual(list(TaskResult.objects.values_list("task_id", flat=True)), ["t0"])
+        self.assertEqual(list(OutboxMessage.objects.all()), [pending])
+        self.assertFalse(OutboxMessage.objects.filter(pk=sent.pk).exists())
+        self.assertEqual(get_result_write_stats()["pruned_results"], 2)
+
+
+class AccessCodeAllocatorTests(YouTrackTestCase):
+    def test_bulk_create_allocates_unique_codes_in_constant_queries(self):
+        user = User.objects.create_user(username="owner", is_staff=True)
+        code_width(Student, Student.ACCESS_CODE_WIDTH)  # warm the cached row count
+        probe_counts = []
+        for size in (10, 200):
+            students = [Student(first_name="S", last_name=str(i), created_by=user) for i in range(size)]
+            with CaptureQueriesContext(connection) as ctx:
+                created = Student.objects.bulk_create(students)
+            probe_counts.append(sum(q["sql"].startswith("SELECT") for q in ctx.captured_queries))
+            self.assertTrue(all(re.fullmatch(r"YT-E\d{6}", s.access_code) for s in created))
+
+        self.assertEqual(probe_counts, [1, 1])
+        codes = list(Student.objects.values_list("access_code", flat=True))
+        self.assertEqual(len(codes), len(set(codes)))
+
+    @override_settings(ACCESS_CODE_MAX_OCCUPANCY=0.01)
+    def test_codes_widen_past_the_occupancy_threshold(self):
+        user, course, _ = self.create_course(groups=1, students_per_group=0)
+        self.assertEqual(code_width(Group, Group.ACCESS_CODE_WIDTH), 4)
+
+        groups = Group.objects.bulk_create([Group(name=f"g{i}", course=course) for i in range(150)])
+        self.assertEqual(code_width(Group, Group.ACCESS_CODE_WIDTH), 5)
+        self.assertTrue(all(re.fullmatch(r"YT-G\d{5}", g.access_code) for g in groups))
+        self.assertRegex(Group.objects.create(name="next", course=course, coordinator=user).access_code,
+                         r"^YT-G\d{5}$")
+
+
+class StudentImportTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=1, students_per_group=1)
+        cls.group = cls.enrollments[0].group
+
+    def csv_upload(self, rows):
+        lines = ["First Name,Last Name"] + [f"Student,N{i}" for i in range(rows)] + [",missing", ""]
+        return SimpleUploadedFile("cohort.csv", "\n".join(lines).encode("utf-8-sig"), content_type="text/csv")
+
+    def test_import_is_batched_and_reports_codes(self):
+        self.schedule_outbox_relay.reset_mock()
+        query_counts = []
+        for rows in (10, 200):
+            upload = self.csv_upload(rows)
+            with CaptureQueriesContext(connection) as ctx, self.captureOnCommitCallbacks(execute=True):
+                result = import_student_file(upload, upload.name, self.group, self.user)
+            query_counts.append(len(ctx.captured_queries))
+            self.assertEqual(len(result.students), rows)
+            self.assertEqual(result.skipped, [(rows + 2, "first_name and last_name are required")])
+
+        # The per-row path costs several queries per student; the import does not grow with the file.
+        self.assertLess(query_counts[1], query_counts[0] + 10)
+        self.assertEqual(Enrollment.objects.filter(group=self.group).count(), 211)
+        self.assertEqual(OutboxMessage.objects.filter(topic="cd_mock.add_candidate").count(), 211)
+        self.assertEqual(self.schedule_outbox_relay.call_count, 2)
+
+        report = result.report().splitlines()
+        self.assertEqual(report[0], "first_name,last_name,access_code,group_code")
+        self.assertEqual(len(report), 201)
+        code = report[1].split(",")[2]
+        self.assertTrue(Enrollment.objects.filter(student__access_code=code, group=self.group).exists())
+
+    def test_admin_upload_downloads_report(self):
+        admin_user = User.objects.create_superuser(username="root", password="pw")
+        self.client.force_login(admin_user)
+        response = self.client.post("/admin/main/student/import/",
+                                    {"file": self.csv_upload(3), "group": self.group.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(len(response.content.decode().splitlines()), 4)
+        self.assertEqual(Student.objects.filter(created_by=admin_user).count(), 3)
+
+
+class AdminQueryBudgetTests(YouTrackTestCase):
+    """Every changelist costs the same number of queries however many rows the page shows."""
+
+    CHANGELIST_QUERY_BUDGET = 12
+
+    def add_rows(self, name, students_per_group):
+        user, course, enrollments = self.create_course(groups=2, students_per_group=students_per_group, name=name)
+        coordinator = User.objects.create_user(username=f"coordinator-{name}", is_staff=True)
+        reason = PointReason.objects.create(name=f"Homework {name}", default_points=5, default_coins=1)
+        instance = YTInstance.objects.create(name=name, admin=user)
+        instance.coordinators.add(user, coordinator)
+        instance.point_reasons.add(reason)
+
+        reward = Reward.objects.create(name=f"Sticker {name}", cost=0, course=course)
+        with self.captureOnCommitCallbacks(execute=True):
+            award_points(reason, date(2024, 1, 1), enrollments)
+        RewardRedemption.objects.bulk_create(RewardRedemption(enrollment=e, reward=reward) for e in enrollments)
+
+    def changelist_queries(self):
+        counts = {}
+        for model in admin.site._registry:
+            if model._meta.app_label != "main":
+                continue
+            url = reverse(f"admin:main_{model._meta.model_name}_changelist")
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            counts[model._meta.model_name] = len(ctx.captured_queries)
+        return counts
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.client.force_login(User.objects.create_superuser(username="root", password="pw"))
+
+        self.add_rows("small", students_per_group=1)
+        small = self.changelist_queries()
+        self.add_rows("large", students_per_group=40)
+        large = self.changelist_queries()
+
+        self.assertEqual(small, large)
+        for name, queries in large.items():
+            self.assertLessEqual(queries, self.CHANGELIST_QUERY_BUDGET, name)
+
+
+class TenantContextTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner, cls.course, cls.enrollments = cls.create_course(groups=1, students_per_group=5)
+        cls.coordinator = User.objects.create_user(username="coordinator", is_staff=True)
+        cls.reason = PointReason.objects.create(name="Homework", default_points=5)
+        cls.instance = YTInstance.objects.create(name="Campus", admin=cls.owner)
+        cls.instance.coordinators.add(cls.coordinator)
+        cls.instance.point_reasons.add(cls.reason)
+        cls.owner.user_permissions.set(Permission.objects.filter(content_type__app_label="main"))
+
+    def test_context_is_cached_and_invalidated_on_membership_change(self):
+        tenant = resolve_tenant_context(self.coordinator)
+        self.assertTrue(tenant.is_coordinator)
+        self.assertEqual((tenant.instance_id, tenant.admin_id), (self.instance.pk, self.owner.pk))
+        self.assertEqual(tenant.point_reason_ids, {self.reason.pk})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_tenant_context(self.coordinator), tenant)
+
+        other = User.objects.create_user(username="other", is_staff=True)
+        self.assertFalse(resolve_tenant_context(other).has_instance)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.instance.coordinators.add(other)
+        self.assertEqual(resolve_tenant_context(other).instance_id, self.instance.pk)
+        self.assertEqual(resolve_tenant_context(self.owner).coordinator_ids, {self.coordinator.pk, other.pk})
+
+    def test_admin_pages_resolve_the_instance_once(self):
+        self.client.force_login(self.owner)
+        group = self.enrollments[0].group
+        urls = [reverse("admin:main_student_changelist"), reverse("admin:main_group_change", args=[group.pk])]
+
+        def instance_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                for url in urls:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+            return [q for q in ctx.captured_queries if "main_ytinstance" in q["sql"]]
+
+        self.assertEqual(len(instance_queries()), 3)  # instance, coordinators, point reasons
+        self.assertEqual(instance_queries(), [])
+
+
+class SeedDataTests(YouTrackTestCase):
+    def test_seeded_totals_match_the_activity_history(self):
+        config = SeedConfig(instances=2, courses=2, groups=4, students=30, enrollments=40, activities=5, rewards=2)
+        result = seed_dataset(config)
+
+        self.assertEqual(result.counts["enrollments"], Enrollment.objects.count())
+        self.assertEqual(Enrollment.objects.count(), 40)
+        self.assertEqual(Student.objects.count(), 30)
+        self.assertEqual(ActivityEntry.objects.count(), result.counts["activities"])
+        for enrollment in Enrollment.objects.all():
+            history = enrollment.activities.aggregate(points=Sum("points"))["points"] or 0
+            self.assertEqual(enrollment.total_points, history)
+            self.assertGreater(enrollment.rank, 0)
+
+        context = dataset_context()
+        self.assertEqual(context.counts, result.counts)
+        self.assertEqual(len(context.logins), 40)
+        self.assertEqual(sorted(context.reward_ids), sorted(result.course_ids))
+
+    def test_bench_counts_queries_with_a_full_query_log(self):
+        connection.queries_log.extend({"sql": "", "time": "0"} for _ in range(connection.queries_limit))
+
+        def call():
+            list(Enrollment.objects.all())
+            return 200
+
+        result = BenchCommand()._bench("enrollments", call, {"warmup": 1, "iterations": 2})
+        self.assertEqual((result["queries"], result["errors"]), (1, 0))
+
+
+class PerformanceMiddlewareTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=1, students_per_group=3)
+
+    def timings(self, response):
+        return {part.split(";")[0].strip(): part for part in response["Server-Timing"].split(",")}
+
+    def test_unsampled_requests_are_untouched(self):
+        response = self.client.post("/api/dashboard/", self.student_body(self.enrollments[0]),
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    @override_settings(PERF_SAMPLE_RATE=1)
+    def test_sampled_request_reports_timings_and_logs_them(self):
+        for path, view in (("/api/dashboard/", "dashboard"), ("/api/async/dashboard/", "async-dashboard")):
+            with self.assertLogs("main.performance", "INFO") as logs, \
+                    CaptureQueriesContext(connection) as queries:
+                response = self.client.post(path, self.student_body(self.enrollments[0]),
+                                            content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+
+            timings = self.timings(response)
+            self.assertIn(f'desc="{view}"', timings["view"])
+            self.assertEqual(timings.keys(), {"total", "view", "db", "auth", "leaderboard", "serialize"})
+
+            line = json.loads(logs.records[0].getMessage())
+            self.assertEqual((line["view"], line["status"]), (view, 200))
+            self.assertEqual(line["queries"], len(queries.captured_queries))
+            self.assertLessEqual(len(line["slow_queries"]), 3)
+            self.assertIn(f'desc="{line["queries"]} queries"', timings["db"])
+
+
+class ProfilerTests(YouTrackTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.course, cls.enrollments = cls.create_course(groups=1, students_per_group=2)
+        cls.root = User.objects.create_superuser(username="root", password=None)
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PROFILER_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_superuser_can_profile_a_request_and_download_it(self):
+        self.client.force_login(self.root)
+        response = self.client.get(reverse("admin:main_student_changelist"), {"_profile": "1"})
+        # A 200 rather than the ?e=1 redirect: the flag never reaches the changelist as a filter.
+        self.assertEqual(response.status_code, 200)
+
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response["X-Profile-Id"], str(profile.pk))
+        self.assertEqual((profile.trigger, profile.user, profile.view_name),
+                         (RequestProfile.REQUESTED, self.root, "admin:main_student_changelist"))
+        self.assertTrue(profile_file(profile.file_stem, "prof").exists())
+
+        download = self.client.get(reverse("admin:main_requestprofile_download", args=[profile.pk, "collapsed"]))
+        self.assertEqual(download.status_code, 200)
+        self.assertEqual(b"".join(download.streaming_content).decode(),
+                         profile_file(profile.file_stem, "collapsed").read_text())
+        changelist = self.client.get(reverse("admin:main_requestprofile_changelist"))
+        self.assertContains(changelist, reverse("admin:main_requestprofile_download", args=[profile.pk, "prof"]))
+
+    def test_only_superusers_are_profiled(self):
+        self.client.force_login(self.user)
+        response = self.client.post("/api/dashboard/", self.student_body(self.enrollments[0]),
+                                    content_type="application/json", headers={"X-Profile": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("X-Profile-Id"))
+        self.assertFalse(RequestProfile.objects.exists())
+        self.assertEqual(self.client.get(reverse("admin:main_requestprofile_changelist")).status_code, 403)
+
+    @override_settings(PROFILER_SAMPLE_RATE=1, PROFILER_MAX_PROFILES=2)
+    def test_sampled_profiles_are_kept_in_a_ring_buffer(self):
+        for path in ("/api/dashboard/", "/api/async/dashboard/", "/api/dashboard/"):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(path, self.student_body(self.enrollments[0]),
+                                            content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+
+        profiles = list(RequestProfile.objects.all())
+        self.assertEqual([p.trigger for p in profiles], [RequestProfile.SAMPLED] * 2)
+        self.assertEqual(profiles[1].view_name, "async-dashboard")
+        stems = {path.stem for path in profile_file("x", "prof").parent.iterdir()}
+        self.assertEqual(stems, {p.file_stem for p in profiles})
@@ -1,5 +1,8 @@
 from django.urls import path
-from .views import CheckEnrollmentView, DashboardView, RewardListView, RewardClaimView, ActivitiesView
+from .views import CheckEnrollmentView, DashboardView, RewardListView, RewardClaimView, ActivitiesView, AwardPointsView, \
+    DailyAnalyticsView
+from .async_views import AsyncCheckEnrollmentView, AsyncDashboardView, AsyncRewardListView, AsyncRewardClaimView, \
+    AsyncActivitiesView
 
 urlpatterns = [
     path("login/", CheckEnrollmentView.as_view(), name="check-enrollment"),
@@ -7,4 +10,13 @@ urlpatterns = [
     path("rewards", RewardListView.as_view(), name="rewards-list"),
     path("rewards/claim", RewardClaimView.as_view(), name="rewards-claim"),
     path("activities", ActivitiesView.as_view(), name="activities"),
+    path("points/award", AwardPointsView.as_view(), name="points-award"),
+    path("analytics/daily", DailyAnalyticsView.as_view(), name="analytics-daily"),
+
+    # Same student endpoints as async views, for ASGI deployments.
+    path("async/login/", AsyncCheckEnrollmentView.as_view(), name="async-check-enrollment"),
+    path("async/dashboard/", AsyncDashboardView.as_view(), name="async-dashboard"),
+    path("async/rewards", AsyncRewardListView.as_view(), name="async-rewards-list"),
+    path("async/rewards/claim", AsyncRewardClaimView.as_view(), name="async-rewards-claim"),
+    path("async/activities", AsyncActivitiesView.as_view(), name="async-activities"),
 ]
@@ -1,15 +1,53 @@
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from rest_framework import status
+from rest_framework.permissions import BasePermission, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Student, Group, Enrollment, Reward, RewardRedemption, PointEntry, ActivityEntry
+from .authentication import AccessCodeAuthentication, StudentTokenAuthentication, MissingAccessCodes, \
+    EnrollmentNotFound, InvalidStudentToken, resolve_enrollment, get_token_version, issue_student_token, \
+    invalidate_enrollment
+from .caching import build_live_leaderboards, get_group_leaderboard, get_course_leaderboard
+from .leaderboard import get_leaderboard
+from .models import Student, Group, Reward, RewardRedemption, ActivityEntry
+from .pagination import ACTIVITY_PAGE_SIZE, ACTIVITY_CURSOR_FIELDS, InvalidCursor, paginate_activities
+from .performance import span
 from .serializers import EnrollmentCheckSerializer, GroupSerializer, \
-    EnrollmentSerializer, RewardRedemptionSerializer, RewardSerializer, ActivitySerializer
+    EnrollmentSerializer, RewardRedemptionSerializer, RewardSerializer, AwardPointsSerializer, \
+    ActivityPageSerializer, DailyAnalyticsQuerySerializer, ACTIVITY_ROW_FIELDS, activity_rows
+from .services import award_points, claim_reward, daily_series, enrollments_for_user, groups_for_user, \
+    point_reasons_for_user, RewardAlreadyClaimed, InsufficientBalance
+
+
+class StudentAPIView(APIView):
+    """Base for the student endpoints: resolves the caller's enrollment up front.
+
+    Callers send either the login token or the raw access codes.
+    ``request.user`` is a ``StudentPrincipal`` and ``request.auth`` its
+    ``StudentContext``; resolution failures keep the usual
+    ``{"success": False, "message": ...}`` shape, and ``missing_codes_message``
+    keeps each endpoint's own wording for absent access codes.
+    """
+    authentication_classes = [StudentTokenAuthentication, AccessCodeAuthentication]
+    permission_classes = [IsAuthenticated]
+    missing_codes_message = MissingAccessCodes.default_detail
+
+    def perform_authentication(self, request):
+        with span("auth"):
+            super().perform_authentication(request)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, MissingAccessCodes):
+            return Response({"success": False, "message": self.missing_codes_message}, status=exc.status_code)
+        if isinstance(exc, (EnrollmentNotFound, InvalidStudentToken)):
+            return Response({"success": False, "message": str(exc.detail)}, status=exc.status_code)
+        return super().handle_exception(exc)
 
 
 class CheckEnrollmentView(APIView):
+    authentication_classes = []
+
     def post(self, request, *args, **kwargs):
         serializer = EnrollmentCheckSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -17,85 +55,56 @@ class CheckEnrollmentView(APIView):
         student_code = serializer.validated_data["student_code"]
         group_code = serializer.validated_data["group_code"]
 
-        try:
-            student = Student.objects.get(access_code=student_code)
-        except Student.DoesNotExist:
-            return Response(
-                {"success": False, "message": "Student not found"},
-                status=status.HTTP_404_NOT_FOUND,
-            )
-
-        try:
-            group = Group.objects.get(access_code=group_code)
-        except Group.DoesNotExist:
+        context = resolve_enrollment(student_code, group_code)
+        token_version = get_token_version(context.enrollment_id) if context is not None else None
+        if token_version is None:
+            if context is not None:
+                # This process still cached an enrollment another worker has
+                # since deactivated or deleted; the token version is shared.
+                invalidate_enrollment(context.enrollment_id)
+            # Only failed logins pay for the per-code lookups behind the message.
+            if not Student.objects.filter(access_code=student_code).exists():
+                message = "Student not found"
+            elif not Group.objects.filter(access_code=group_code).exists():
+                message = "Group not found"
+            else:
+                message = "You're not enrolled in this group"
             return Response(
-                {"success": False, "message": "Group not found"},
+                {"success": False, "message": message},
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        try:
-            enrollment = Enrollment.objects.get(
-                student=student, group=group, is_active=True
-            )
-        except Enrollment.DoesNotExist:
-            return Response(
-                {"success": False, "message": "You're not enrolled in this group"},
-                status=status.HTTP_404_NOT_FOUND,
-            )
+        token, expires_at = issue_student_token(context, token_version)
 
         return Response(
-            {"success": True, "message": "ok"},
+            {"success": True, "message": "ok", "token": token, "expires_at": expires_at},
             status=status.HTTP_200_OK,
         )
 
 
-class DashboardView(APIView):
+class DashboardView(StudentAPIView):
     def post(self, request, *args, **kwargs):
-        student_code = request.data.get("student_code")
-        group_code = request.data.get("group_code")
-
-        if not student_code or not group_code:
-            return Response(
-                {"success": False, "message": "student_code and group_code are required"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        try:
-            student = Student.objects.get(access_code=student_code)
-            group = Group.objects.select_related("course").get(access_code=group_code)
-        except (Student.DoesNotExist, Group.DoesNotExist):
-            return Response(
-                {"success": False, "message": "Student or Group not found"},
-                status=status.HTTP_404_NOT_FOUND,
-            )
-
-        try:
-            enrollment = Enrollment.objects.select_related("student", "group").get(
-                student=student, group=group, is_active=True
-            )
-        except Enrollment.DoesNotExist:
-            return Response(
-                {"success": False, "message": "Enrollment not found"},
-                status=status.HTTP_404_NOT_FOUND,
-            )
+        enrollment = request.user.enrollment
+        group = enrollment.group
 
         enrollment_data = EnrollmentSerializer(enrollment).data
-
         group_data = GroupSerializer(group).data
-        group_enrollments = Enrollment.objects.filter(group=group, is_active=True).select_related("student").order_by(
-            "rank")
-        group_data["enrollments"] = EnrollmentSerializer(group_enrollments, many=True).data
 
         course = group.course
         course_data = {
             "name": course.name,
         }
-        course_enrollments = (
-            Enrollment.objects.filter(group__course=course, is_active=True)
-            .select_related("student", "group")
-            .order_by("rank")[:50]
-        )
-        course_data["enrollments"] = EnrollmentSerializer(course_enrollments, many=True).data
+
+        leaderboard = get_leaderboard()
+        if leaderboard is None:
+            group_data["enrollments"] = get_group_leaderboard(group)
+            course_data["enrollments"] = get_course_leaderboard(course.id)
+        else:
+            position, group_data["enrollments"], course_data["enrollments"], course_data["around"] = (
+                build_live_leaderboards(leaderboard, group, enrollment.id)
+            )
+            if position is not None:
+                enrollment_data["rank"], enrollment_data["total_points"] = position
 
         return Response(
             {
@@ -110,29 +119,18 @@ class DashboardView(APIView):
         )
 
 
-class RewardListView(APIView):
-    def post(self, request):
-        student_code = request.data.get("student_code")
-        group_code = request.data.get("group_code")
-
-        if not student_code or not group_code:
-            return Response(
-                {"success": False, "message": "Missing student_code or group_code"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+class RewardListView(StudentAPIView):
+    missing_codes_message = "Missing student_code or group_code"
 
-        student = Student.objects.get(access_code=student_code)
-        group = Group.objects.get(access_code=group_code)
-        enrollment = get_object_or_404(
-            Enrollment, student=student, group=group
-        )
+    def post(self, request):
+        context = request.auth
 
-        all_rewards = Reward.objects.filter(course=enrollment.group.course)
+        all_rewards = Reward.objects.filter(course_id=context.course_id)
 
-        claimed_qs = RewardRedemption.objects.filter(enrollment=enrollment)
+        claimed_qs = RewardRedemption.objects.filter(enrollment_id=context.enrollment_id).select_related("reward")
         claimed = RewardRedemptionSerializer(claimed_qs, many=True).data
 
-        claimed_reward_ids = claimed_qs.values_list("reward_id", flat=True)
+        claimed_reward_ids = [redemption["reward"]["id"] for redemption in claimed]
         available_qs = all_rewards.exclude(id__in=claimed_reward_ids).order_by("cost")
         available = RewardSerializer(available_qs, many=True).data
 
@@ -141,51 +139,35 @@ class RewardListView(APIView):
         )
 
 
-class RewardClaimView(APIView):
+class RewardClaimView(StudentAPIView):
+    missing_codes_message = "Missing required fields"
+
     def post(self, request):
-        student_code = request.data.get("student_code")
-        group_code = request.data.get("group_code")
         reward_id = request.data.get("reward_id")
 
-        if not student_code or not group_code or not reward_id:
+        if not reward_id:
             return Response(
                 {"success": False, "message": "Missing required fields"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        student = Student.objects.get(access_code=student_code)
-        group = Group.objects.get(access_code=group_code)
-        enrollment = get_object_or_404(
-            Enrollment, student=student, group=group
-        )
         reward = get_object_or_404(
-            Reward, id=reward_id, course=enrollment.group.course
+            Reward, id=reward_id, course_id=request.auth.course_id
         )
 
-        if RewardRedemption.objects.filter(enrollment=enrollment, reward=reward).exists():
+        try:
+            redemption = claim_reward(request.auth.enrollment_id, reward)
+        except RewardAlreadyClaimed:
             return Response(
                 {"success": False, "message": "Reward already claimed"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-
-        if enrollment.balance < reward.cost:
+        except InsufficientBalance as exc:
             return Response(
-                {
-                    "success": False,
-                    "message": f"Reward costs {reward.cost} coins, you only have {enrollment.total_points}"
-                },
+                {"success": False, "message": str(exc)},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        ActivityEntry.objects.create(
-            enrollment=enrollment,
-            action=f'Claimed "{reward.name}"',
-            points=0,
-            coins_change=-reward.cost,
-            for_date=timezone.now().date(),
-        )
-
-        redemption = RewardRedemption.objects.create(enrollment=enrollment, reward=reward)
         redemption_data = RewardRedemptionSerializer(redemption).data
 
         return Response(
@@ -196,26 +178,120 @@ class RewardClaimView(APIView):
         )
 
 
-class ActivitiesView(APIView):
+class ActivitiesView(StudentAPIView):
+    missing_codes_message = "Missing student_code or group_code"
+
     def post(self, request):
-        student_code = request.data.get("student_code")
-        group_code = request.data.get("group_code")
+        params = ActivityPageSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
 
-        if not student_code or not group_code:
+        activities_qs = (
+            ActivityEntry.objects.filter(enrollment_id=request.auth.enrollment_id)
+            .values(*ACTIVITY_ROW_FIELDS, *ACTIVITY_CURSOR_FIELDS)
+        )
+        if params.get("date_from"):
+            activities_qs = activities_qs.filter(for_date__gte=params["date_from"])
+        if params.get("date_to"):
+            activities_qs = activities_qs.filter(for_date__lte=params["date_to"])
+
+        try:
+            page, next_cursor = paginate_activities(
+                activities_qs,
+                cursor=params.get("cursor"),
+                page_size=params.get("page_size", ACTIVITY_PAGE_SIZE),
+            )
+        except InvalidCursor as exc:
             return Response(
-                {"success": False, "message": "Missing student_code or group_code"},
+                {"success": False, "message": str(exc)},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        student = Student.objects.get(access_code=student_code)
-        group = Group.objects.get(access_code=group_code)
-        enrollment = get_object_or_404(
-            Enrollment, student=student, group=group
+        activities = activity_rows(page)
+
+        return Response(
+            {"success": True, "data": activities, "next_cursor": next_cursor}
         )
 
-        activities_qs = enrollment.activities.order_by("-for_date", "-created_at")[:50]
-        activities = ActivitySerializer(activities_qs, many=True).data
+
+class CanAwardPoints(BasePermission):
+    """Awarding creates PointEntry rows, so it needs the same permission as adding one in the admin."""
+
+    def has_permission(self, request, view):
+        return request.user.has_perm("main.add_pointentry")
+
+
+class AwardPointsView(APIView):
+    permission_classes = [IsAdminUser, CanAwardPoints]
+
+    def post(self, request):
+        serializer = AwardPointsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        reason = get_object_or_404(point_reasons_for_user(request.user), id=data["reason_id"])
+        for_date = data.get("for_date") or timezone.localdate()
+
+        enrollments = enrollments_for_user(request.user).filter(is_active=True)
+        if data.get("group_id"):
+            enrollments = enrollments.filter(group_id=data["group_id"])
+        if data.get("enrollment_ids"):
+            enrollments = enrollments.filter(id__in=data["enrollment_ids"])
+
+        enrollment_ids = list(enrollments.values_list("id", flat=True))
+        if not enrollment_ids:
+            return Response(
+                {"success": False, "message": "No matching active enrollments"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        point_entries = award_points(reason, for_date, enrollment_ids)
 
         return Response(
-            {"success": True, "data": activities}
-        )
\ No newline at end of file
+            {
+                "success": True,
+                "data": {
+                    "awarded": len(point_entries),
+                    "reason": reason.name,
+                    "for_date": for_date,
+                },
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class DailyAnalyticsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        serializer = DailyAnalyticsQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        date_from, date_to = params["date_from"], params["date_to"]
+
+        groups = groups_for_user(request.user).select_related("course").order_by("name")
+        if params.get("group"):
+            groups = groups.filter(id=params["group"])
+        if params.get("course"):
+            groups = groups.filter(course_id=params["course"])
+
+        groups = list(groups)
+        if not groups:
+            return Response(
+                {"success": False, "message": "No matching groups"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        group_series, combined_series = daily_series(groups, date_from, date_to)
+
+        return Response(
+            {
+                "success": True,
+                "data": {
+                    "date_from": date_from,
+                    "date_to": date_to,
+                    "groups": group_series,
+                    "total": combined_series,
+                },
+            }
+        )